@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""Benchmark harness for the media processor.
+
+Generates a synthetic media tree, drives the application's processing,
+cleanup and directory-tree code paths against it, and reports files/sec,
+per-phase timings, peak RSS and the number of subprocesses started.
+
+By default ExifTool is replaced by `fake_exiftool.py` (with optional
+per-command latency) so runs are repeatable without the real binary. Pass
+`--real-exiftool` inside the Docker image for end-to-end numbers:
+
+    docker run --rm -v "$PWD/benchmarks:/benchmarks" <image> \
+        python /benchmarks/benchmark.py --real-exiftool --app-dir /app
+"""
+
+import argparse
+import importlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from corpus import generate_corpus
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_APP_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "docker")
+
+# Stream lines that mark the end of each phase, in order
+PROCESS_PHASE_MARKERS = [
+    ("preflight", "Preflight checks passed"),
+    ("prescan", "Pre-scan read metadata"),
+    ("process", " files processed, "),
+    ("move", " completed successfully"),
+]
+CLEANUP_PHASE_MARKERS = [
+    ("cleanup", " completed successfully"),
+]
+
+
+class SubprocessCounter:
+    """Counts subprocesses started in this process, keyed by executable name."""
+
+    def __init__(self):
+        self.counts = {}
+        self._original_popen = subprocess.Popen
+
+    def install(self):
+        counter = self
+
+        class CountingPopen(self._original_popen):
+            def __init__(self, args, *popen_args, **popen_kwargs):
+                executable = args if isinstance(args, str) else args[0]
+                name = os.path.basename(str(executable))
+                counter.counts[name] = counter.counts.get(name, 0) + 1
+                super().__init__(args, *popen_args, **popen_kwargs)
+
+        subprocess.Popen = CountingPopen
+
+    def reset(self):
+        self.counts = {}
+
+
+def install_fake_exiftool(work_dir, latency):
+    # Puts an `exiftool` wrapper around fake_exiftool.py first on PATH
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+    shim = os.path.join(bin_dir, "exiftool")
+    with open(shim, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCHMARK_DIR, "fake_exiftool.py")}" "$@"\n')
+    os.chmod(shim, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_EXIFTOOL_STORE"] = os.path.join(work_dir, "exiftool_store")
+    os.environ["FAKE_EXIFTOOL_LATENCY"] = str(latency)
+
+
+def load_app(app_dir, work_dir, args):
+    # The app reads its configuration from the environment at import time
+    os.environ.setdefault("TZ", "America/New_York")
+    os.environ["ALLOW_MOVE_FILES"] = "true"
+    os.environ["VERBOSE_LOGGING"] = "true" if args.verbose_logging else "false"
+    os.environ["EXIFTOOL_WRITE_MODE"] = args.write_mode
+    os.environ["METADATA_BACKEND"] = args.metadata_backend
+    os.environ["VIDEO_IN_PLACE_WRITES"] = "true" if args.video_in_place else "false"
+    os.environ["MOVE_AS_PROCESSED"] = "true" if args.move_as_processed else "false"
+    os.environ["MANIFEST_FILE"] = os.path.join(work_dir, "processing_manifest.db")
+    os.environ["CATALOG_FILE"] = os.path.join(work_dir, "media_catalog.db")
+    os.environ["LOCK_DIRECTORY"] = os.path.join(work_dir, "locks")
+    os.environ["JOBS_DIRECTORY"] = os.path.join(work_dir, "jobs")
+    os.environ["PROCESS_WORKERS"] = str(args.workers)
+    os.environ["IO_DEVICE_CONCURRENCY"] = str(args.device_concurrency)
+    os.environ["IO_INTERLEAVE"] = "true" if args.interleave else "false"
+    os.environ.pop("TAG_WHITELIST_FILE", None)
+    if hasattr(time, "tzset"):
+        time.tzset()
+    sys.path.insert(0, app_dir)
+    return importlib.import_module("app")
+
+
+def point_app_at(app, media_dir, move_to_dir):
+    # The routes keep their own references to the directories the engine uses
+    engine = sys.modules["engine"]
+    for module in (app, engine):
+        module.media_directory = module.EXTERNAL_MEDIA_DIR = media_dir
+        module.move_to_directory = module.EXTERNAL_MOVE_TO_DIR = move_to_dir
+    app.directory_listing_cache.clear()
+    if engine.processing_manifest is not None:
+        engine.processing_manifest.close()
+        engine.processing_manifest = None
+
+
+def timed_stream(stream, markers):
+    # Consumes a text stream, returning (phase durations, total seconds, lines)
+    start = previous = time.perf_counter()
+    phases = {}
+    remaining = list(markers)
+    lines = []
+    for chunk in stream:
+        now = time.perf_counter()
+        lines.append(chunk)
+        for index, (phase, marker) in enumerate(remaining):
+            if marker in chunk:
+                phases[phase] = now - previous
+                previous = now
+                del remaining[:index + 1]
+                break
+    return phases, time.perf_counter() - start, lines
+
+
+def run_process(app, media_dir, args):
+    data = {
+        "selected_media_directory": media_dir,
+        "recursive_search": True,
+        "move_files_selected": args.move,
+        "geotag_enabled": args.geotag,
+        "geotag_override": False,
+        "geotag_data": {
+            "location": "Benchmark Park",
+            "city": "Springfield",
+            "state": "Illinois",
+            "country": "United States - US",
+            "coordinates": "39.78373, -89.65063",
+        },
+        "ignore_minor_errors": False,
+        "skip_file_validation": args.skip_validation,
+        "process_workers": args.workers,
+    }
+    data["tag_whitelist"] = app.load_tag_whitelist()
+    error = app.prepare_geotag_data(data)
+    if error:
+        raise RuntimeError(error)
+    return timed_stream(app.process_photos_stream(data), PROCESS_PHASE_MARKERS)
+
+
+def run_cleanup(app, media_dir, args):
+    data = {"selected_media_directory": media_dir, "recursive_search": True}
+    return timed_stream(app.clean_files_stream(data), CLEANUP_PHASE_MARKERS)
+
+
+def run_directory(app, media_dir, args):
+    # Walks every level of the lazy tree through the HTTP endpoint, cold then warm
+    client = app.app.test_client()
+    phases = {}
+    lines = []
+    start = time.perf_counter()
+    for phase in ("cold", "warm"):
+        phase_start = time.perf_counter()
+        pending = [media_dir]
+        while pending:
+            response = client.get("/directory-structure", query_string={"path": pending.pop()})
+            if response.status_code != 200:
+                raise RuntimeError(response.get_data(as_text=True))
+            for child in response.get_json()["subdirectories"]:
+                if child["has_children"]:
+                    pending.append(child["external_path"])
+                lines.append(child["external_path"])
+        phases[phase] = time.perf_counter() - phase_start
+    return phases, time.perf_counter() - start, lines
+
+
+SCENARIOS = {"process": run_process, "cleanup": run_cleanup, "directory": run_directory}
+
+
+def run_benchmark(app, counter, work_dir, run_number, args):
+    run_dir = os.path.join(work_dir, f"run-{run_number}")
+    media_dir = os.path.join(run_dir, "media")
+    # A --move-to-dir on another mount exercises cross-device moves
+    move_to_dir = os.path.join(args.move_to_dir or run_dir, f"moveTo-{run_number}" if args.move_to_dir else "moveTo")
+    os.makedirs(move_to_dir)
+
+    # Each corpus starts with an empty metadata store, since its files can
+    # reuse the inodes (the store keys) of the previous run's files
+    if not args.real_exiftool:
+        shutil.rmtree(os.environ["FAKE_EXIFTOOL_STORE"], ignore_errors=True)
+
+    corpus_start = time.perf_counter()
+    corpus = generate_corpus(
+        media_dir,
+        args.files,
+        depth=args.depth,
+        fanout=args.fanout,
+        video_ratio=args.video_ratio,
+        junk_ratio=args.junk_ratio,
+        jpeg_size=args.jpeg_size,
+        video_size=args.video_size,
+        seed=run_number,
+    )
+    corpus_seconds = time.perf_counter() - corpus_start
+
+    point_app_at(app, media_dir, move_to_dir)
+    counter.reset()
+    phases, seconds, lines = SCENARIOS[args.scenario](app, media_dir, args)
+    output = "".join(lines)
+    if args.scenario != "directory" and "completed successfully" not in output:
+        raise RuntimeError(f"Run {run_number} did not complete:\n{output[-2000:]}")
+
+    files = corpus["jpg"] + corpus["mp4"] + corpus["junk"]
+    result = {
+        "run": run_number,
+        "scenario": args.scenario,
+        "files": files,
+        "directories": corpus["directories"],
+        "bytes": corpus["bytes"],
+        "corpus_seconds": round(corpus_seconds, 3),
+        "seconds": round(seconds, 3),
+        "files_per_second": round(files / seconds, 1) if seconds else None,
+        "phases": {phase: round(value, 3) for phase, value in phases.items()},
+        "subprocesses": dict(counter.counts),
+    }
+    if not args.keep:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        shutil.rmtree(move_to_dir, ignore_errors=True)
+    return result
+
+
+def peak_rss_kib():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1024 if sys.platform == "darwin" else 1
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale,
+    }
+
+
+def print_report(results, peak_rss, args):
+    print(f"Scenario: {args.scenario} | ExifTool: {'real' if args.real_exiftool else f'fake ({args.latency}s latency)'}"
+          f" | workers: {args.workers} | write mode: {args.write_mode} | backend: {args.metadata_backend}")
+    for result in results:
+        phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in result["phases"].items())
+        subprocesses = ", ".join(f"{name} x{count}" for name, count in sorted(result["subprocesses"].items())) or "none"
+        print(
+            f"Run {result['run']}: {result['files']} files in {result['directories']} directories, "
+            f"{result['seconds']:.3f}s ({result['files_per_second']} files/sec)\n"
+            f"    phases: {phases or 'n/a'}\n"
+            f"    subprocesses: {subprocesses}"
+        )
+    print(f"Peak RSS: {peak_rss['self']} KiB (harness and app), {peak_rss['children']} KiB (largest child)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", nargs="?", choices=sorted(SCENARIOS), default="process")
+    parser.add_argument("--files", type=int, default=500, help="media files per run")
+    parser.add_argument("--depth", type=int, default=3, help="directory levels below the root")
+    parser.add_argument("--fanout", type=int, default=4, help="subdirectories per directory")
+    parser.add_argument("--video-ratio", type=float, default=0.1, help="fraction of files that are MP4")
+    parser.add_argument("--junk-ratio", type=float, default=0.05, help="junk files per media file")
+    parser.add_argument("--jpeg-size", type=int, default=0, help="approximate JPEG size in bytes")
+    parser.add_argument("--video-size", type=int, default=0, help="approximate MP4 payload size in bytes")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--device-concurrency", type=int, default=0, help="I/O slots per device (0: unlimited)")
+    parser.add_argument("--interleave", action="store_true", help="interleave small and large files")
+    parser.add_argument("--write-mode", choices=["standard", "single-pass"], default="standard")
+    parser.add_argument("--move-to-dir", help="parent directory for move targets (default: next to the corpus)")
+    parser.add_argument("--move-as-processed", action="store_true", help="move each file as soon as it is processed")
+    parser.add_argument("--metadata-backend", choices=["exiftool", "native"], default="exiftool")
+    parser.add_argument("--video-in-place", action="store_true", help="let the native backend edit videos in place")
+    parser.add_argument("--move", action="store_true", help="move files after processing")
+    parser.add_argument("--geotag", action="store_true", help="geotag files (adds the pre-scan)")
+    parser.add_argument("--skip-validation", action="store_true")
+    parser.add_argument("--verbose-logging", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake ExifTool seconds per command")
+    parser.add_argument("--real-exiftool", action="store_true", help="use the exiftool binary on PATH")
+    parser.add_argument("--app-dir", default=DEFAULT_APP_DIR, help="directory containing app.py")
+    parser.add_argument("--work-dir", help="where corpora are generated (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep generated corpora")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="media-benchmark-")
+    os.makedirs(work_dir, exist_ok=True)
+    if not args.real_exiftool:
+        install_fake_exiftool(work_dir, args.latency)
+
+    counter = SubprocessCounter()
+    counter.install()
+    app = load_app(os.path.abspath(args.app_dir), work_dir, args)
+
+    try:
+        results = [run_benchmark(app, counter, work_dir, run, args) for run in range(1, args.runs + 1)]
+    finally:
+        # Stop the ExifTool workers so their memory shows up in RUSAGE_CHILDREN
+        sys.modules["engine"].exiftool_pool.shutdown()
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    peak_rss = peak_rss_kib()
+    if args.json:
+        print(json.dumps({"results": results, "peak_rss_kib": peak_rss}, indent=2))
+    else:
+        print_report(results, peak_rss, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
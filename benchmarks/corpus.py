@@ -0,0 +1,143 @@
+"""Synthetic media trees for benchmarking.
+
+Files are named the way the processor expects
+(`2000-12-30T12.00.00 Title [tag1;tag2.subtag].jpg`) and contain minimal but
+structurally valid JPEG / MP4 data, so the real ExifTool can write to them too.
+"""
+
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+
+JUNK_FILE_NAMES = ["Thumbs.db", ".DS_Store", "desktop.ini", "._{name}"]
+TITLES = ["Birthday Party", "Beach Day", "First Steps", "Christmas Morning", "Road Trip", ""]
+TAGS = ["family", "holiday.christmas", "holiday.birthday", "travel.beach", "pets.dog"]
+
+
+def jpeg_stub(size: int = 0) -> bytes:
+    # 1x1 grayscale baseline JPEG; COM segments pad it to roughly `size` bytes
+    segments = [
+        b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00",
+        b"\xff\xdb" + struct.pack(">H", 67) + b"\x00" + b"\x01" * 64,
+        b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, 1, 1, 1) + b"\x01\x11\x00",
+        b"\xff\xc4" + struct.pack(">H", 20) + b"\x00" + b"\x01" + b"\x00" * 15 + b"\x00",
+        b"\xff\xc4" + struct.pack(">H", 20) + b"\x10" + b"\x01" + b"\x00" * 15 + b"\x00",
+    ]
+    padding = max(0, size - 200)
+    while padding > 0:
+        chunk = min(padding, 65533)
+        segments.append(b"\xff\xfe" + struct.pack(">H", chunk + 2) + b"\x00" * chunk)
+        padding -= chunk + 4
+    scan = b"\xff\xda" + struct.pack(">H", 8) + b"\x01\x01\x00\x00\x3f\x00" + b"\x3f"
+    return b"\xff\xd8" + b"".join(segments) + scan + b"\xff\xd9"
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def _full_box(box_type: bytes, payload: bytes, version: int = 0, flags: int = 0) -> bytes:
+    return _box(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def mp4_stub(size: int = 0, moov_first: bool = False) -> bytes:
+    # ftyp + moov (one video track whose single chunk points into mdat) + mdat
+    media_data = b"\x00" * max(16, size)
+    matrix = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2mp41")
+
+    def moov(chunk_offset):
+        stbl = _box(b"stbl", b"".join([
+            _full_box(b"stsd", struct.pack(">I", 0)),
+            _full_box(b"stts", struct.pack(">II", 1, 1) + struct.pack(">I", 1)),
+            _full_box(b"stsc", struct.pack(">IIII", 1, 1, 1, 1)),
+            _full_box(b"stsz", struct.pack(">III", len(media_data), 1, 0)[:8]),
+            _full_box(b"stco", struct.pack(">II", 1, chunk_offset)),
+        ]))
+        minf = _box(b"minf", _full_box(b"vmhd", b"\x00" * 8, flags=1) + stbl)
+        mdia = _box(b"mdia", b"".join([
+            _full_box(b"mdhd", struct.pack(">IIIIHH", 0, 0, 1000, 1000, 0x55C4, 0)),
+            _full_box(b"hdlr", struct.pack(">I", 0) + b"vide" + b"\x00" * 12 + b"\x00"),
+            minf,
+        ]))
+        tkhd = _full_box(
+            b"tkhd",
+            struct.pack(">IIIII", 0, 0, 1, 0, 1000) + b"\x00" * 8 + struct.pack(">hhhH", 0, 0, 0, 0) + matrix + struct.pack(">II", 0, 0),
+            flags=3,
+        )
+        mvhd = _full_box(
+            b"mvhd",
+            struct.pack(">IIIIIH", 0, 0, 1000, 1000, 0x10000, 0x100) + b"\x00" * 10 + matrix + b"\x00" * 24 + struct.pack(">I", 2),
+        )
+        return _box(b"moov", mvhd + _box(b"trak", tkhd + mdia))
+
+    mdat_header_size = 8
+    if moov_first:
+        moov_size = len(moov(0))
+        chunk_offset = len(ftyp) + moov_size + mdat_header_size
+        return ftyp + moov(chunk_offset) + _box(b"mdat", media_data)
+    chunk_offset = len(ftyp) + mdat_header_size
+    return ftyp + _box(b"mdat", media_data) + moov(chunk_offset)
+
+
+def generate_corpus(
+    root: str,
+    file_count: int,
+    depth: int = 2,
+    fanout: int = 4,
+    video_ratio: float = 0.1,
+    junk_ratio: float = 0.05,
+    jpeg_size: int = 0,
+    video_size: int = 0,
+    seed: int = 0,
+) -> dict:
+    """Creates `file_count` media files spread over a `fanout`-ary tree `depth` levels deep.
+
+    Returns counts of what was written so runs can be compared.
+    """
+    rng = random.Random(seed)
+    directories = [root]
+    frontier = [root]
+    for level in range(depth):
+        next_frontier = []
+        for parent in frontier:
+            for index in range(fanout):
+                directory = os.path.join(parent, f"Folder {level + 1}-{index + 1}")
+                next_frontier.append(directory)
+        directories.extend(next_frontier)
+        frontier = next_frontier
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    jpeg_data = jpeg_stub(jpeg_size)
+    video_data = mp4_stub(video_size)
+    start = datetime(2000, 1, 1)
+    counts = {"directories": len(directories), "jpg": 0, "mp4": 0, "junk": 0, "bytes": 0}
+
+    for index in range(file_count):
+        # Unique timestamps keep move targets conflict free
+        taken = start + timedelta(minutes=17 * index)
+        title = rng.choice(TITLES)
+        tags = rng.sample(TAGS, rng.randint(0, 2))
+        name = taken.strftime("%Y-%m-%dT%H.%M.%S")
+        if title:
+            name += f" {title}"
+        if tags:
+            name += f" [{';'.join(tags)}]"
+
+        is_video = rng.random() < video_ratio
+        extension, data = (".mp4", video_data) if is_video else (".jpg", jpeg_data)
+        directory = rng.choice(directories)
+        with open(os.path.join(directory, name + extension), "wb") as f:
+            f.write(data)
+        counts["mp4" if is_video else "jpg"] += 1
+        counts["bytes"] += len(data)
+
+        if rng.random() < junk_ratio:
+            junk_name = rng.choice(JUNK_FILE_NAMES).format(name=name + extension)
+            with open(os.path.join(directory, junk_name), "wb") as f:
+                f.write(b"\x00" * 64)
+            counts["junk"] += 1
+
+    return counts
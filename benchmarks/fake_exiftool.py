@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Stand-in for the `exiftool` binary used by the benchmark harness.
+
+Supports the subset of ExifTool behaviour the application relies on: tag
+writes (`-TAG=`, `-TAG+=`), tag reads (including `-Time:all`) in plain, `-s`
+and `-json` output, recursive directory scans (`-r`, `-ext`, `-i`) and
+`-stay_open` batch mode with `-executeNUM` / `-echo4` sentinels. Metadata is
+kept in JSON files under FAKE_EXIFTOOL_STORE instead of inside the media
+files, and every write rewrites the media file like ExifTool's
+`-overwrite_original` does.
+
+Environment variables:
+    FAKE_EXIFTOOL_STORE    directory for the metadata store (required)
+    FAKE_EXIFTOOL_LATENCY  seconds to sleep per command (default 0)
+    FAKE_EXIFTOOL_COUNTER  file that gets one line appended per process start
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+STORE = os.environ.get("FAKE_EXIFTOOL_STORE", "")
+LATENCY = float(os.environ.get("FAKE_EXIFTOOL_LATENCY", "0") or 0)
+COUNTER = os.environ.get("FAKE_EXIFTOOL_COUNTER", "")
+
+IGNORED_OPTIONS = {"-overwrite_original", "-P", "-F", "-m", "-n", "-fast", "-fast2", "-q", "-a", "-G", "-G1"}
+TIME_TAGS = ("DateTimeOriginal", "CreateDate", "ModifyDate")
+
+
+def store_path(file_path):
+    stat = os.stat(file_path)
+    return os.path.join(STORE, f"{stat.st_dev}-{stat.st_ino}.json")
+
+
+def load_metadata(file_path):
+    try:
+        with open(store_path(file_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_metadata(file_path, metadata):
+    os.makedirs(STORE, exist_ok=True)
+    with open(store_path(file_path), "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+
+
+def tag_name(tag):
+    # Groups ("XMP:", "IPTC:", ...) are not modelled
+    return tag.split(":")[-1]
+
+
+def find_tag(metadata, name):
+    for key in metadata:
+        if key.lower() == name.lower():
+            return key
+    return None
+
+
+def label(name):
+    # "GPSLongitude" -> "GPS Longitude", like ExifTool's default output
+    return " ".join(re.findall(r"[A-Z]+(?![a-z])|[A-Z][a-z]*|[a-z]+|\d+", name)) or name
+
+
+def collect_files(paths, recursive, extensions, ignored_directories):
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        if recursive:
+            for root, directories, names in os.walk(path):
+                directories[:] = [d for d in directories if d not in ignored_directories]
+                files.extend(os.path.join(root, name) for name in names)
+        else:
+            files.extend(
+                os.path.join(path, name) for name in os.listdir(path)
+                if os.path.isfile(os.path.join(path, name))
+            )
+        if extensions:
+            files = [f for f in files if os.path.splitext(f)[1].lower() in extensions or f in paths]
+    return files
+
+
+def apply_writes(metadata, writes):
+    assigned = set()
+    for tag, operator, value in writes:
+        name = tag_name(tag)
+        if name.lower() == "all" and tag.lower().startswith("time"):
+            for time_tag in TIME_TAGS:
+                metadata[time_tag] = value
+            continue
+
+        existing = find_tag(metadata, name)
+        if existing and existing != name:
+            metadata[name] = metadata.pop(existing)
+
+        if operator == "+=":
+            current = metadata.get(name)
+            current = [] if current is None else current if isinstance(current, list) else [current]
+            metadata[name] = current + [value]
+        elif value == "":
+            metadata.pop(name, None)
+            assigned.discard(name.lower())
+        elif name.lower() in assigned:
+            # Repeated "=" assignments in one command build a list
+            current = metadata[name]
+            metadata[name] = (current if isinstance(current, list) else [current]) + [value]
+        else:
+            metadata[name] = value
+            assigned.add(name.lower())
+
+
+def rewrite_file(file_path, metadata):
+    temporary_path = f"{file_path}_exiftool_tmp"
+    with open(file_path, "rb") as source, open(temporary_path, "wb") as target:
+        while chunk := source.read(1024 * 1024):
+            target.write(chunk)
+    # The old entry goes while the file still holds its inode: once replaced,
+    # a parallel writer can reuse the inode and save its own metadata there
+    old_store_path = store_path(file_path)
+    if os.path.exists(old_store_path):
+        os.remove(old_store_path)
+    os.replace(temporary_path, file_path)
+    save_metadata(file_path, metadata)
+
+
+def run(args, out, err):
+    json_output = short_names = recursive = False
+    extensions, ignored_directories = [], []
+    writes, reads, paths, echoes = [], [], [], []
+
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in IGNORED_OPTIONS:
+            pass
+        elif arg in ("-json", "-j"):
+            json_output = True
+        elif arg == "-s":
+            short_names = True
+        elif arg in ("-r", "-r."):
+            recursive = True
+        elif arg == "-ext":
+            extensions.append("." + args[i + 1].lower().lstrip("."))
+            i += 1
+        elif arg == "-i":
+            ignored_directories.append(args[i + 1])
+            i += 1
+        elif arg in ("-echo3", "-echo4"):
+            echoes.append((arg, args[i + 1]))
+            i += 1
+        elif arg.startswith("-") and "=" in arg:
+            tag, value = arg[1:].split("=", 1)
+            operator = "="
+            if tag.endswith("+"):
+                tag, operator = tag[:-1], "+="
+            writes.append((tag, operator, value))
+        elif arg.startswith("-"):
+            reads.append(arg[1:])
+        else:
+            paths.append(arg)
+        i += 1
+
+    if LATENCY:
+        time.sleep(LATENCY)
+
+    status = 0
+    records = []
+    for file_path in collect_files(paths, recursive, extensions, ignored_directories):
+        if not os.path.isfile(file_path):
+            err.write(f"Error: File not found - {file_path}\n")
+            status = 1
+            continue
+
+        metadata = load_metadata(file_path)
+        if writes:
+            apply_writes(metadata, writes)
+            rewrite_file(file_path, metadata)
+            continue
+
+        record = {"SourceFile": file_path}
+        if reads:
+            for read in reads:
+                if read.lower() == "time:all":
+                    record.update((tag, metadata[tag]) for tag in TIME_TAGS if tag in metadata)
+                    continue
+                key = find_tag(metadata, tag_name(read))
+                if key is not None:
+                    record[tag_name(read)] = metadata[key]
+        else:
+            record.update(metadata)
+        records.append(record)
+
+    if writes:
+        out.write(f"    {len(paths)} image files updated\n")
+    elif json_output and records:
+        # Same layout as ExifTool: one top-level "{ ... }" block per file
+        out.write("[" + ",\n".join(
+            "{\n" + ",\n".join(f"  {json.dumps(k)}: {json.dumps(v)}" for k, v in record.items()) + "\n}"
+            for record in records
+        ) + "]\n")
+    else:
+        for record in records:
+            if len(records) > 1:
+                out.write(f"======== {record['SourceFile']}\n")
+            for key, value in record.items():
+                if key == "SourceFile":
+                    continue
+                if isinstance(value, list):
+                    value = ", ".join(map(str, value))
+                out.write(f"{key if short_names else label(key):<32}: {value}\n")
+
+    for option, text in echoes:
+        (err if option == "-echo4" else out).write(text.replace("${status}", str(status)) + "\n")
+    return status
+
+
+def stay_open():
+    pending = []
+    for raw_line in sys.stdin.buffer:
+        arg = raw_line.decode("utf-8").rstrip("\n")
+        if arg.startswith("-execute"):
+            run(pending, sys.stdout, sys.stderr)
+            pending = []
+            sys.stdout.write(f"{{ready{arg[len('-execute'):]}}}\n")
+            sys.stdout.flush()
+            sys.stderr.flush()
+        elif pending[-1:] == ["-stay_open"] and arg == "False":
+            return 0
+        else:
+            pending.append(arg)
+    return 0
+
+
+def main():
+    if not STORE:
+        sys.stderr.write("FAKE_EXIFTOOL_STORE is not set\n")
+        return 1
+    if COUNTER:
+        with open(COUNTER, "a", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\n")
+    if sys.argv[1:5] == ["-stay_open", "True", "-@", "-"]:
+        return stay_open()
+    return run(sys.argv[1:], sys.stdout, sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,47 +1,46 @@
-import calendar
-import json
 import os
-import re
-import shutil
-import subprocess
-import sys
-import unicodedata
-import yaml
-from datetime import timedelta, datetime
-from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import threading
 from flask import Flask, render_template, request, Response, stream_with_context, jsonify
+from jobs import JobManager
+from progress import ndjson_events
+from run_locks import hold_process_lock
+from engine import (
+    APP_NAME,
+    ALLOW_MOVE_FILES,
+    EXCLUDED_DIRECTORIES,
+    EXTERNAL_MEDIA_DIR,
+    EXTERNAL_MOVE_TO_DIR,
+    JOBS_DIRECTORY,
+    JOB_WORKERS,
+    LOCK_DIRECTORY,
+    PROCESS_WORKERS,
+    TAG_WHITELIST_FILE,
+    WATCH_DIRECTORY,
+    clean_files_stream,
+    ending_early,
+    geotag_store,
+    get_media_catalog,
+    load_tag_whitelist,
+    media_directory,
+    metrics,
+    move_to_directory,
+    plan_processing_stream,
+    prepare_geotag_data,
+    process_photos_stream,
+    tag_whitelist_store,
+    validate_files_stream,
+    watch_stream,
+)
 
 app = Flask(__name__)
 
-# Internal Directories
-media_directory = "/media"
-move_to_directory = "/moveTo"
-
-# Environment Variables
-FAMILY_LAST_NAME = os.getenv("FAMILY_LAST_NAME", "Cassidy")    
-APP_NAME = os.getenv("APP_NAME", f"{FAMILY_LAST_NAME} Family Media Processor")
-GEOTAG_DATA_FILE = os.getenv("GEOTAG_DATA_FILE", "./config/geotag_data.yaml")
-TAG_WHITELIST_FILE = os.getenv("TAG_WHITELIST_FILE", "")
-EXTERNAL_MEDIA_DIR = os.getenv("EXTERNAL_MEDIA_DIR", media_directory)
-EXTERNAL_MOVE_TO_DIR = os.getenv("EXTERNAL_MOVE_TO_DIR", move_to_directory)
-EXCLUDED_DIRECTORIES = [d.strip() for d in os.getenv("EXCLUDED_DIRECTORIES", "").split(',') if d.strip()]
-TZ = os.getenv("TZ", "GMT")
-ALLOW_MOVE_FILES = os.getenv("ALLOW_MOVE_FILES", "false").lower() == "true"
-VERBOSE_LOGGING = os.getenv("VERBOSE_LOGGING", "false").lower() == "true"
-
-# Local Variables
-tag_delimiter = ";"
-tag_hierarchy_delimiter = "."
-family_name = f"{FAMILY_LAST_NAME} Family"
-copyright_notice = f"{family_name} Photos"
-gps_coordinates_round_digits = 5  # Some software seems to struggle with longer gps coordinates
-file_extension_whitelist = ['.jpg', '.jpeg', '.mp4', '.mov']
-extension_conversions = {".jpeg": ".jpg",}
+# Subdirectory listings keyed by path: (directory mtime, subdirectory names)
+directory_listing_cache = {}
 
 
 @app.route('/')
 def index():
-    return render_template('index.html', app_name=APP_NAME, move_to_dir=EXTERNAL_MOVE_TO_DIR, move_files_allowed=ALLOW_MOVE_FILES)
+    return render_template('index.html', app_name=APP_NAME, move_to_dir=EXTERNAL_MOVE_TO_DIR, move_files_allowed=ALLOW_MOVE_FILES, process_workers=PROCESS_WORKERS)
     
 @app.route('/favicon.ico')
 def favicon():
@@ -49,597 +48,319 @@ def favicon():
     
 @app.route('/directory-structure', methods=['GET'])
 def directory_structure():
-    def build_tree(root_path):
-    	
-        directory_name = os.path.basename(root_path)
-        if directory_name in EXCLUDED_DIRECTORIES:
-            return None
-            
-        tree = {
-            'name': directory_name,
-            'internal_path': root_path,
-            'external_path': root_path.replace(media_directory, EXTERNAL_MEDIA_DIR, 1),
-            'subdirectories': []
-        }
-        
+    # Returns one directory and its immediate subdirectories; the UI requests
+    # deeper levels as they are expanded
+    external_path = request.args.get('path', EXTERNAL_MEDIA_DIR)
+    root_path = os.path.normpath(external_path.replace(EXTERNAL_MEDIA_DIR, media_directory, 1))
+    if os.path.commonpath([root_path, media_directory]) != media_directory:
+        return jsonify({"error": "Path is outside the media directory"}), 400
+
+    try:
+        subdirectory_names = list_subdirectories(root_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return jsonify({"error": "Directory not found"}), 404
+
+    subdirectories = []
+    for name in subdirectory_names:
+        path = os.path.join(root_path, name)
         try:
-            for entry in os.scandir(root_path):
-                if entry.is_dir():
-                    sub_tree = build_tree(entry.path)
-                    if sub_tree:
-                        tree['subdirectories'].append(sub_tree)
-        except PermissionError:
-            pass  # Skip directories we can't access
-        return tree
-
-    directory_tree = build_tree(media_directory)
-    if directory_tree:
-        directory_tree['name'] = EXTERNAL_MEDIA_DIR
-    return jsonify(directory_tree)
+            has_children = bool(list_subdirectories(path))
+        except OSError:
+            has_children = False
+        subdirectories.append({
+            'name': name,
+            'internal_path': path,
+            'external_path': path.replace(media_directory, EXTERNAL_MEDIA_DIR, 1),
+            'has_children': has_children,
+        })
+
+    return jsonify({
+        'name': EXTERNAL_MEDIA_DIR if root_path == media_directory else os.path.basename(root_path),
+        'internal_path': root_path,
+        'external_path': root_path.replace(media_directory, EXTERNAL_MEDIA_DIR, 1),
+        'has_children': bool(subdirectories),
+        'subdirectories': subdirectories,
+    })
+
+def list_subdirectories(path: str) -> list:
+    # A directory's mtime changes whenever an entry is added, removed or renamed
+    # in it, so cached listings stay valid until that happens
+    mtime_ns = os.stat(path).st_mtime_ns
+    cached = directory_listing_cache.get(path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+
+    subdirectories = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name not in EXCLUDED_DIRECTORIES:
+                    subdirectories.append(entry.name)
+    except PermissionError:
+        pass  # Skip directories we can't access
+
+    directory_listing_cache[path] = (mtime_ns, subdirectories)
+    return subdirectories
     
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/geotag-data', methods=['GET'])
 def geotag_data():
+    return geotag_response(lambda geotags: geotags.tree)
+
+@app.route('/geotag-data/children', methods=['GET'])
+def geotag_children():
+    # Names one level below ?path=<country>&path=<state>...; no path lists the countries
+    return geotag_response(lambda geotags: geotags.children(request.args.getlist('path')))
+
+@app.route('/geotag-data/search', methods=['GET'])
+def geotag_search():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    return geotag_response(lambda geotags: geotags.search(query, limit))
+
+def geotag_response(build):
+    # JSON built from the current geotag data, tagged with the data's version
+    # so unchanged data is answered with 304 Not Modified
     try:
-        with open(GEOTAG_DATA_FILE, 'r', encoding='utf-8') as file:
-            return jsonify(yaml.safe_load(file))
+        geotags = geotag_store.get()
     except Exception as e:
         return jsonify({"error": f"Error loading geotag data: {str(e)}"}), 500
 
+    if geotags.version in request.if_none_match:
+        response = Response(status=304)
+    else:
+        try:
+            response = jsonify(build(geotags))
+        except KeyError:
+            return jsonify({"error": "Geotag location not found"}), 404
+    response.set_etag(geotags.version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/tag-whitelist/validate', methods=['GET'])
+def validate_tag_whitelist():
+    # Problems in the whitelist file itself; any `tag` arguments are checked against it
+    if not TAG_WHITELIST_FILE:
+        return jsonify({"enabled": False, "patterns": 0, "problems": [], "tags": {}})
+    try:
+        whitelist = tag_whitelist_store.get()
+    except Exception as e:
+        return jsonify({"error": f"Failed to load tag whitelist file: {e}"}), 500
+
+    problems = list(whitelist.problems)
+    if not len(whitelist):
+        problems.append({"line": None, "pattern": None, "message": "Tag whitelist file is empty or contains no valid tags."})
+    return jsonify({
+        "enabled": True,
+        "patterns": len(whitelist),
+        "problems": problems,
+        "tags": {tag: whitelist.allows(tag) for tag in request.args.getlist('tag')},
+    })
+
+@app.route('/catalog', methods=['GET'])
+def catalog():
+    # Processed files matching every given filter: q (title words), tag
+    # (repeatable; includes sub-tags), year, from/to (YYYY-MM-DD), place,
+    # limit and offset
+    media_catalog = get_media_catalog()
+    if media_catalog is None:
+        return jsonify({"enabled": False, "total": 0, "results": []})
+    try:
+        total, results = media_catalog.search(
+            text=request.args.get('q'),
+            tags=[tag for tag in request.args.getlist('tag') if tag.strip()],
+            year=request.args.get('year', type=int),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            place=request.args.get('place'),
+            limit=request.args.get('limit', 100, type=int),
+            offset=request.args.get('offset', 0, type=int),
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid catalog query: {e}"}), 400
+
+    for result in results:
+        path = result.pop('path')
+        if os.path.commonpath([path, move_to_directory]) == move_to_directory:
+            result['external_path'] = path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR, 1)
+        else:
+            result['external_path'] = path.replace(media_directory, EXTERNAL_MEDIA_DIR, 1)
+    return jsonify({"enabled": True, "full_text": media_catalog.full_text, "total": total, "results": results})
+
 @app.route('/start-processing', methods=['POST'])
 def start_processing():
     data = request.get_json()
     
     try:
-        data['tag_whitelist_patterns'] = load_tag_whitelist()
+        data['tag_whitelist'] = load_tag_whitelist()
     except Exception as e:
-        return "Error: Invalid tag whitelist file.", 500
+        return f"Error: Invalid tag whitelist file: {e}", 500
 
-    if data['geotag_enabled']:
-        try:
-            latitude, longitude = map(float, data['geotag_data']['coordinates'].split(','))
-            latitude = round(latitude, gps_coordinates_round_digits)
-            longitude = round(longitude, gps_coordinates_round_digits)
-        except ValueError:
-            return "Error: Invalid coordinates format. Ensure they are number pairs.", 500
-
-        country, country_code = data['geotag_data']['country'].split(' - ', 1)
-
-        data['geotag_data'] = {
-            "location": data['geotag_data']['location'],
-            "city": data['geotag_data']['city'],
-            "state": data['geotag_data']['state'],
-            "country": country,
-            "country_code": country_code,
-            "longitude": longitude,
-            "latitude": latitude,
-        }
-
-    return Response(stream_with_context(process_photos_stream(data)), mimetype='text/plain')
-
-
-def process_photos_stream(data):
-	
-    # Validate env variables
-    if not is_valid_timezone(TZ):
-        yield f"Invalid Environment Variables: TZ={TZ}\n"
-        yield f"{APP_NAME} ending early\n"
-        return
+    error = prepare_geotag_data(data)
+    if error:
+        return error, 500
 
-    # Select files based on recursion mode
-    file_items = []
-    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory);
-    if data['recursive_search']:
-        yield "RECURSIVE_SEARCH is true. Processing files in all subdirectories.\n"
-        for root, _, files in os.walk(internal_selected_media_directory):
-            file_items.extend(os.path.join(root, file) for file in files)
-    else:
-        yield "RECURSIVE_SEARCH is false. Processing files in the top-level directory only.\n"
-        file_items = [os.path.join(internal_selected_media_directory, f) for f in os.listdir(internal_selected_media_directory) if os.path.isfile(os.path.join(internal_selected_media_directory, f))]
+    return stream_response(process_photos_stream(data))
 
-    # Log user options
-    if ALLOW_MOVE_FILES:
-        if data['move_files_selected']:
-            yield "MOVE_FILES is true. Files will be moved.\n"
-        else:
-            yield "MOVE_FILES is false. Files will not be moved.\n"
-    if data['geotag_enabled']:
-        override_status = "enabled" if data['geotag_override'] else "disabled"
-        yield f"GEOTAG_FILES is true. Files will be geotagged. (Override: {override_status})\n"
-    else:
-        yield "GEOTAG_FILES is false. Files will not be geotaged.\n"
-    if data['skip_file_validation']:
-        yield "SKIP_FILE_VALIDATION is true. Files will skip post-process validation.\n"
-    if data['ignore_minor_errors']:
-        yield "IGNORE_MINOR_ERRORS is true. Processing files will ignore minor errors.\n"
-        
-        
-    yield "-------------- New Process --------------\n"
-    
-    if not file_items:
-        yield f"No files found in: {data['selected_media_directory']}.\n"
-        yield f"{APP_NAME} ending early\n"
-        return
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(job_manager.list())
 
-    # Process each file
-    for i, file_path in enumerate(file_items):
-        file_name = os.path.basename(file_path)
-        file_base_name, file_extension = os.path.splitext(file_name)
-        
-        # Check if file needs to be deleted
-        if should_delete_file(file_name):
-            try:
-                os.remove(file_path)
-                yield f"File deleted: {file_name}\n"
-                continue
-            except Exception as e:
-                yield f"Error deleting {file_name}: {str(e)}\n"
-                yield f"{APP_NAME} ending early\n"
-                return
-
-        # Check if file extension is in the whitelist
-        if file_extension.lower() not in file_extension_whitelist:
-            yield f"Error File extension not whitelisted for {file_name}\n"
-            yield f"{APP_NAME} ending early\n"
-            return
-
-        # Clean file names, if necessary
-        # 1. Update file extensions if necessary (lowercase and conversions)
-        # 2. Replace weird Unicode spaces (Zs category) with regular space
-        new_extension = extension_conversions.get(file_extension.lower(), file_extension.lower())
-        normalized_base = ''.join(
-            ' ' if unicodedata.category(c) == 'Zs' and c != ' ' else c
-            for c in file_base_name
-        )
-        new_file_name = f"{normalized_base}{new_extension}"
-        new_file_path = os.path.join(os.path.dirname(file_path), new_file_name)
-        if new_file_name != file_name:
-            try:
-                os.rename(file_path, new_file_path)
-                file_path = new_file_path
-                file_items[i] = new_file_path
-            except Exception as e:
-                yield f"Error updating file extension for {file_name}: {str(e)}\n"
-                yield f"{APP_NAME} ending early\n"
-                return
-
-        # Use regex to extract date and title
-        match = re.match(
-            r"^(\d{4})-(\d{2})-(\d{2})T(\d{2})\.(\d{2})\.(\d{2})"
-            r"(?: ([^\[]*))?"
-            r"(?: \[([^\]]+)\])?$",
-            file_base_name
-        )
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    data = request.get_json()
+    job_type = data.pop('job_type', 'process')
 
-        if not match:
-            yield f"File Name Format Error: {file_name}\n"
-            yield f"{APP_NAME} ending early\n"
-            return
-
-        year, month, day, hour, minute, second, title, tags = match.groups()
-        date = f"{year}:{month}:{day} {hour}:{minute}:{second}"
-        
-        # Format fields
-        if tags:
-            tags_list = [tag.strip() for tag in tags.split(tag_delimiter)]
-        else:
-            tags = ""
-            tags_list = ""
-        if not title:
-           title = ""
-
-        # Validate fields
-        if '  ' in file_name:
-            yield f"File Name Validation Error: {file_name} contains consecutive spaces.\n"
-            yield f"{APP_NAME} ending early\n"
-            return
-        if title and title.startswith('-'):
-            yield f"File Name Validation Error: Title starts with a dash: {file_name}\n"
-            yield f"{APP_NAME} ending early\n"
-            return
-        if title and title.endswith(' '):
-            yield f"File Name Validation Error: Title ends with a space: {file_name}\n"
-            yield f"{APP_NAME} ending early\n"
-            return
-        if title and ('[' in title or ']' in title):
-            yield f"File Name Validation Error: Title contains brackets: {file_name}\n"
-            yield f"{APP_NAME} ending early\n"
-            return
-        if tags_list and data['tag_whitelist_patterns']:
-            for tag in tags_list:
-                if not any(pattern.match(tag) for pattern in data['tag_whitelist_patterns']):
-                    yield f"File Name Validation Error: '{tag}' tag is not allowed.\n"
-                    yield f"{APP_NAME} ending early\n"
-                    return
-
-        # Build ExifTool command
-        exif_command = [
-            "exiftool", 
-            "-overwrite_original",
-            "-P",
-            "-F",
-        ]
-        if data['ignore_minor_errors']:
-            exif_command.append("-m")
-
-        exif_command.extend([
-            # Date Fields
-            f"-Time:all={date} +00:00", # Use UTC universally
-
-            # Title Fields
-            f"-Title={title}",
-            f"-By-line=",
-            f"-Caption-Abstract=",
-            f"-ImageDescription={title}",
-            f"-Description={title}",
-            f"-ObjectName={title}",
-            f"-Subtitle=",
-            f"-XPComment=",
-            f"-URL=",
-
-            # Rating Fields
-            # (Removes all ratings set in Windows)
-            f"-Rating=",
-            f"-RatingPercent=",
-            f"-SharedUserRating=",
-
-            # Author Fields
-            f"-Author={family_name}",
-            f"-XPAuthor={family_name}",
-            f"-Creator={family_name}",
-            f"-Artist={family_name}",
-
-            # Copyright Fields
-            f"-Copyright={copyright_notice}",
-            f"-CopyrightNotice=",
-            f"-Rights=",
-            f"-UsageTerms=",
-            f"-WebStatement=",
-            f"-Marked=",
-
-            # File Name Fields
-            f"-RawFileName={file_name}",
-
-            # Miscellaneous Fields               
-            f"-XMP-iptcCore:CountryCode=",
-            f"-XMP-iptcCore:CreatorContactInfo=",
-            f"-XMP-iptcCore:CreatorCity=",
-            f"-XMP-iptcCore:CreatorCountry=",
-            f"-XMP-iptcCore:CreatorAddress=",
-            f"-XMP-iptcCore:CreatorPostalCode=",
-            f"-XMP-iptcCore:CreatorRegion=",
-            f"-XMP-iptcCore:CreatorWorkEmail=",
-            f"-XMP-iptcCore:CreatorWorkTelephone=",
-            f"-XMP-iptcCore:CreatorWorkURL=",
-               
-            f"-XMP-photoshop:TextLayerName=",
-            f"-XMP-photoshop:TextLayerText=",
-                
-            f"-DerivedFromDocumentID=",
-            f"-DerivedFromOriginalDocumentID=",
-            f"-OriginalDocumentID=",
-            f"-DocumentID=",
-            f"-Software=",
-            f"-HistoryAction=",
-            f"-HistoryChanged=",
-            f"-HistoryInstanceID=",
-            f"-HistoryParameters=",
-            f"-HistorySoftwareAgent=",
-            f"-HistoryWhen=",
-            f"-InstanceID=",
-                
-            file_path
-        ])
-            
-        # Tags Fields (fields must be cleared first)
-        exif_command_tags = [
-            "exiftool",
-            "-overwrite_original",
-            "-P",
-            "-F",
-        ]
-        if data['ignore_minor_errors']:
-            exif_command_tags.append("-m")
-
-        exif_command_tags.extend([
-            "-XMP:HierarchicalSubject=", 
-            "-XMP:Subject=", 
-            "-IPTC:Keywords=", 
-            "-Microsoft:Category=",
-            file_path
-        ])
-        subprocess.run(exif_command_tags)
-
-        if tags_list:
-            for tag in tags_list:
-                tag_pipe = tag.replace(tag_hierarchy_delimiter, "|").strip()
-                tag_slash = tag.replace(tag_hierarchy_delimiter, "/").strip()
-
-                exif_command.extend([
-                    f"-XMP:HierarchicalSubject+={tag_pipe}",
-                    f"-XMP:Subject+={tag_slash}",
-                    f"-IPTC:Keywords+={tag_slash}",
-                    f"-Microsoft:Category+={tag_slash}"
-                ])
-                
-                
-        # Geotag Fields
-        if data['geotag_enabled']:
-            existing_gps = has_existing_gps(file_path)
-                
-            if existing_gps and not data['geotag_override']:
-                yield f"   Warning: Geotag data already exists for: {file_name}\n"
-
-            elif not existing_gps or data['geotag_override']:
-                if existing_gps and data['geotag_override']:
-                    yield f"   Warning: Overriding existing geotag data for: {file_name}\n"
-                    
-                tri_coordinates = f"{data['geotag_data']['latitude']}, {data['geotag_data']['longitude']}, 0"
-                location_string = f"{data['geotag_data']['city']}, {data['geotag_data']['state']}, {data['geotag_data']['country']}"
-                      
-                exif_command.extend([
-                    f"-composite:gpslatitude={data['geotag_data']['latitude']}",
-                    f"-xmp:gpslatitude={data['geotag_data']['latitude']}",
-                    f"-composite:gpslongitude={data['geotag_data']['longitude']}",
-                    f"-xmp:gpslongitude={data['geotag_data']['longitude']}",
-                    f"-GPSAltitude=0",
-                    f"-GPSAltitudeRef=0",
-                        
-                    f"-Keys:GPSCoordinates={tri_coordinates}",
-                    f"-Userdata:GPSCoordinates={tri_coordinates}",
-                    f"-Itemlist:GPSCoordinates={tri_coordinates}",
-                        
-                    f"-XMP:City={data['geotag_data']['city']}",
-                    f"-XMP:State={data['geotag_data']['state']}",
-                    f"-XMP:CountryCode={data['geotag_data']['country_code']}",
-                    f"-XMP:Country={data['geotag_data']['country']}",
-                    f"-XMP:CountryName={data['geotag_data']['country']}",
-                       
-                    f"-IPTC:City={data['geotag_data']['city']}",
-                    f"-IPTC:Province-State={data['geotag_data']['state']}",
-                    f"-IPTC:Country-PrimaryLocationCode={data['geotag_data']['country_code']}",
-                    f"-IPTC:Country-PrimaryLocationName={data['geotag_data']['country']}",
-                        
-                    f"-XMP-photoshop:City={data['geotag_data']['city']}",
-                    f"-XMP-photoshop:State={data['geotag_data']['state']}",
-                    f"-XMP-photoshop:Country={data['geotag_data']['country']}",
-                        
-                    f"-XMP-iptcExt:LocationShownCity={data['geotag_data']['city']}",
-                    f"-XMP-iptcExt:LocationShownProvinceState={data['geotag_data']['state']}",
-                    f"-XMP-iptcExt:LocationShownCountryCode={data['geotag_data']['country_code']}",
-                    f"-XMP-iptcExt:LocationShownCountryName={data['geotag_data']['country']}",
-                    f"-XMP-iptcExt:LocationShownGPSLatitude={data['geotag_data']['latitude']}",
-                    f"-XMP-iptcExt:LocationShownGPSLongitude={data['geotag_data']['longitude']}",
-                    f"-XMP-iptcExt:LocationShownGPSAltitude=0",
-                    f"-XMP-iptcExt:LocationShownGPSAltitudeRef=0",
-                    f"-XMP-iptcExt:LocationShownLocationName={location_string}",
-                        
-                    f"-Keys:LocationName={location_string}",
-                      
-                    f"-GPSMapDatum=",
-                    f"-GPSImgDirection=",
-                    f"-GPSImgDirectionRef=",
-                    f"-GPSSpeed=",
-                    f"-GPSSpeedRef=",
-                ])
-         
-        # Run ExifTool command
-        result = subprocess.run(exif_command, capture_output=True, text=True)
-        if result.returncode != 0:
-            yield f"ExifTool processing failed for {file_name}: {result.stderr.strip()}\n"
-            yield f"{APP_NAME} ending early\n"
-            return 
-
-        # Validate field updates (spot test)
-        if not data['skip_file_validation']:
-            expected_exif = {
-                "Author": family_name,
-                "Copyright": copyright_notice,
-            }
-            if not validate_exif_fields(file_path, expected_exif):
-                yield f"Error updating metadata for: {file_name}\n"
-                yield f"{APP_NAME} ending early\n"
-                return
-
-        yield f"File processed successfully: {file_name}\n"
-
-        # Output all exif fields, if VERBOSE_LOGGING is true 
-        if VERBOSE_LOGGING:
-            metadata_result = subprocess.run(["exiftool", file_path], capture_output=True, text=True)
-            if metadata_result.returncode == 0:
-                yield f"Exif Metadata for {file_name}:\n"
-                yield metadata_result.stdout + "\n"
-            else:
-                yield f"Error fetching metadata for {file_name}: {metadata_result.stderr.strip()}\n"
-                return
-
-        # Update file modified date   
+    if job_type == 'process':
         try:
-            set_file_modified_date(file_path, date, TZ)
+            load_tag_whitelist()
         except Exception as e:
-            yield f"Error setting modified date for {file_name}: {str(e)}\n"
-            yield f"{APP_NAME} ending early\n"
-
-    # Move files if needed
-    if ALLOW_MOVE_FILES and data['move_files_selected']:
-        yield "All files processed successfully - now moving files\n"
-        file_move_operations = []
-        target_file_paths = set()
-        
-        for source_file_path in file_items:
-            file_name = os.path.basename(source_file_path)
-        
-            year, month = file_name.split('-')[:2]
-            month_name = calendar.month_abbr[int(month)].upper()
-            formatted_month = f"{month} - {month_name}"
-            target_directory = os.path.join(move_to_directory, year, formatted_month)
-            target_file_path = os.path.join(target_directory, file_name)
-            
-            external_target_file_path = target_file_path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR)
-            
-            if target_file_path in target_file_paths:
-                yield f"Conflict found: Multiple files have the same target path {external_target_file_path}\n"
-                yield "No files will be moved.\n"
-                yield f"{APP_NAME} ending early\n"
-                return
-        
-            if os.path.exists(target_file_path):
-                yield f"Conflict found: {external_target_file_path} already exists.\n"
-                yield f"No files will be moved.\n"
-                yield f"{APP_NAME} ending early\n"
-                return
-        
-            target_file_paths.add(target_file_path)
-            file_move_operations.append({
-                "source_path": source_file_path,
-                "target_path": target_file_path,
-            })
-
-        for operation in file_move_operations:
-            source_file_path = operation["source_path"]
-            target_file_path = operation["target_path"]
-        
-            # Create the target directory if it doesn't exist
-            os.makedirs(os.path.dirname(target_file_path), exist_ok=True)
-        
-            # Move the file
-            shutil.move(source_file_path, target_file_path)
-
-    yield f"{APP_NAME} completed successfully.\n"
-    
-@app.route('/file-cleanup', methods=['POST'])
-def file_cleanup():
-    data = request.get_json()
-    return Response(stream_with_context(clean_files_stream(data)), mimetype='text/plain')
-
-def clean_files_stream(data):
-	
-    # Select files based on recursion mode
-    file_items = []
-    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory);
-    if data['recursive_search']:
-        yield "RECURSIVE_SEARCH is true. Cleaning files in all subdirectories.\n"
-        for root, _, files in os.walk(internal_selected_media_directory):
-            file_items.extend(os.path.join(root, file) for file in files)
-    else:
-        yield "RECURSIVE_SEARCH is false. Cleaning files in the top-level directory only.\n"
-        file_items = [os.path.join(internal_selected_media_directory, f) for f in os.listdir(internal_selected_media_directory) if os.path.isfile(os.path.join(internal_selected_media_directory, f))]      
+            return f"Error: Invalid tag whitelist file: {e}", 500
 
-    yield "-------------- New Cleanup Process --------------\n"
-    
-    if not file_items:
-        yield f"No files found in: {data['selected_media_directory']}.\n"
-        yield f"{APP_NAME} ending early\n"
-        return
+        error = prepare_geotag_data(data)
+        if error:
+            return error, 500
 
-    # Process each file
-    for i, file_path in enumerate(file_items):
-        file_name = os.path.basename(file_path)
-
-        # Check if file needs to be deleted
-        if should_delete_file(file_name):
-            try:
-                os.remove(file_path)
-                yield f"File deleted: {file_path}\n"
-                continue
-            except Exception as e:
-                yield f"Error deleting {file_path}: {str(e)}\n"
-                yield f"{APP_NAME} ending early\n"
-                return
-
-    yield f"{APP_NAME} completed successfully.\n"
-    
-def load_tag_whitelist():
-    patterns = []
-    if not TAG_WHITELIST_FILE:
-    	return None
     try:
-        with open(TAG_WHITELIST_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                tag = line.strip()
-                if not tag or tag.startswith('#'):
-                    continue
-                segments_with_wildcards = [
-                    '[^.]+'
-                    if segment == '*'
-                    else re.escape(segment)
-                    for segment in tag.split('.')
-                ]
-                regex = '^' + r'\.'.join(segments_with_wildcards) + '$'
-                patterns.append(re.compile(regex, re.IGNORECASE))
-    except Exception as e:
-        raise RuntimeError(f"Failed to load tag whitelist file.")
+        job = job_manager.submit(job_type, data)
+    except ValueError as e:
+        return f"Error: {str(e)}", 400
+    return jsonify(job), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/log', methods=['GET'])
+def job_log(job_id):
+    if job_manager.get(job_id) is None:
+        return "Error: Job not found.", 404
+
+    tail = request.args.get('tail', type=int)
+    if request.args.get('download', 'false').lower() == 'true':
+        # The full log, including verbose metadata left out of the event stream
+        return Response(
+            job_manager.read_log(job_id, tail),
+            mimetype='text/plain',
+            headers={"Content-Disposition": f"attachment; filename=job-{job_id}.log"},
+        )
+    if request.args.get('follow', 'false').lower() == 'true':
+        return Response(stream_with_context(job_manager.follow_log(job_id, tail)), mimetype='text/plain')
+    return Response(job_manager.read_log(job_id, tail), mimetype='text/plain')
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    if job_manager.get(job_id) is None:
+        return "Error: Job not found.", 404
+
+    tail = request.args.get('tail', type=int)
+    if request.args.get('follow', 'false').lower() == 'true':
+        return Response(stream_with_context(job_manager.follow_events(job_id, tail)), mimetype='application/x-ndjson')
+    return Response(job_manager.read_events(job_id, tail), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+def stream_response(stream):
+    # Plain text by default; ?format=ndjson sends structured progress events instead
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_with_context(ndjson_events(stream)), mimetype='application/x-ndjson')
+    return Response(stream_with_context(stream), mimetype='text/plain')
+
+@app.route('/plan-processing', methods=['POST'])
+def plan_processing():
+    data = request.get_json()
 
-    if not patterns:
-        raise ValueError("Tag whitelist file is empty or contains no valid tags.")
+    try:
+        data['tag_whitelist'] = load_tag_whitelist()
+    except Exception as e:
+        return f"Error: Invalid tag whitelist file: {e}", 500
 
-    return patterns
-    
-def should_delete_file(filename: str) -> bool:
-    FILES_TO_DELETE = {
-        "desktop.ini",
-        "thumbs.db",
-        "ehthumbs.db",
-        ".ds_store",
-        ".spotlight-v100",
-        ".trashes",
-        ".fseventsd",
-        ".directory"
-    }
+    error = prepare_geotag_data(data)
+    if error:
+        return error, 500
 
-    PREFIXES_TO_DELETE = (
-        "._",            # Apple resource fork metadata
-        ".appledouble",  # AppleDouble metadata directory
-        ".trash-",       # Linux Trash folders (like .Trash-1000)
-    )
+    return Response(stream_with_context(plan_processing_stream(data)), mimetype='text/plain')
 
-    lower_name = filename.lower()
-    return (
-        lower_name in FILES_TO_DELETE or
-        any(lower_name.startswith(prefix) for prefix in PREFIXES_TO_DELETE)
-    )
+@app.route('/validate-files', methods=['POST'])
+def validate_files():
+    data = request.get_json()
 
-def is_valid_timezone(tz: str) -> bool:
     try:
-        ZoneInfo(tz)
-        return True
-    except ZoneInfoNotFoundError:
-    	return False
-    	  	
-def has_existing_gps(file_path: str) -> bool:
-    gps_check_result = subprocess.run(
-        ["exiftool", "-GPSLongitude", "-GPSLatitude", "-n", file_path], 
-        capture_output=True, 
-        text=True
-    )
-    return "GPS Longitude" in gps_check_result.stdout and "GPS Latitude" in gps_check_result.stdout
-        
-def set_file_modified_date(file_path: str, date_str: str, timezone: str) -> None:
-    dt = datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
-    dt = dt.replace(tzinfo=ZoneInfo(timezone))
-    dt_utc = dt.astimezone(ZoneInfo("UTC"))
-    timestamp = dt_utc.timestamp()
-    os.utime(file_path, (timestamp, timestamp))
-    
-def validate_exif_fields(file_path, expected_fields):
+        data['tag_whitelist'] = load_tag_whitelist()
+    except Exception as e:
+        return f"Error: Invalid tag whitelist file: {e}", 500
+
+    return Response(stream_with_context(validate_files_stream(data)), mimetype='text/plain')
+
+@app.route('/file-cleanup', methods=['POST'])
+def file_cleanup():
+    data = request.get_json()
+    return stream_response(clean_files_stream(data))
+
+def processing_job_stream(payload, checkpoint):
+    data = dict(payload)
     try:
-        result = subprocess.run(
-            ["exiftool", "-s"] + [f"-{key}" for key in expected_fields.keys()] + [file_path],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            return False
+        data['tag_whitelist'] = load_tag_whitelist()
+    except Exception as e:
+        yield f"Error: Invalid tag whitelist file: {e}\n"
+        yield ending_early()
+        return
+    yield from process_photos_stream(data, checkpoint, wait_for_locks=True)
+
+def cleanup_job_stream(payload, checkpoint):
+    # Deleting junk files is idempotent, so a resumed cleanup simply runs again
+    return clean_files_stream(dict(payload), wait_for_locks=True)
+
+# Background jobs (see /jobs routes). Jobs on overlapping directories wait
+# for each other, so several can run at once.
+job_manager = JobManager(JOBS_DIRECTORY, {
+    "process": processing_job_stream,
+    "cleanup": cleanup_job_stream,
+}, JOB_WORKERS)
+
+def start_watcher():
+    # Processes files dropped into WATCH_DIRECTORY (moving them if allowed),
+    # logging to the container output
+    data = {
+        "selected_media_directory": WATCH_DIRECTORY,
+        "recursive_search": True,
+        "move_files_selected": ALLOW_MOVE_FILES,
+        "geotag_enabled": False,
+        "geotag_override": False,
+        "ignore_minor_errors": False,
+    }
 
-        lines = result.stdout.splitlines()
-        actual_fields = {line.split(":")[0].strip(): ":".join(line.split(":")[1:]).strip() for line in lines}
+    def run():
+        # With several web workers, only the one holding the lock watches;
+        # another takes over if it exits
+        lock_file = hold_process_lock(os.path.join(LOCK_DIRECTORY, "watcher.lock"))
+        try:
+            for line in watch_stream(data):
+                print(line, end="", flush=True)
+        finally:
+            lock_file.close()
 
-        for key, expected_value in expected_fields.items():
-            if actual_fields.get(key) != expected_value:
-                return False
+    threading.Thread(target=run, name="watcher", daemon=True).start()
 
-        return True
-    except Exception:
-        return False
+def start_background_tasks():
+    # Called once per process: by `python app.py`, or by each gunicorn
+    # worker (see gunicorn.conf.py)
+    job_manager.resume_interrupted()
+    if WATCH_DIRECTORY:
+        start_watcher()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    # Development server; the container runs gunicorn (see gunicorn.conf.py)
+    start_background_tasks()
+    app.run(host="0.0.0.0", port=5000, threaded=True)
@@ -0,0 +1,173 @@
+"""Command line entry point for running the media processor without the web UI.
+
+Runs the same engine as the Flask routes, for cron jobs and scripted checks:
+
+    python -m cli process /media/2024 --recursive --move --json
+    python -m cli process /media/2024 --geotag "United States - US" Texas Austin Home
+    python -m cli process /media/2024 --recursive --dry-run
+    python -m cli process /media/2024 --recursive --changes-only
+    python -m cli validate /media/2024 --recursive
+    python -m cli cleanup /media --recursive --dry-run
+    python -m cli watch /media/inbox --recursive --move
+
+Output is the same text log the UI shows, or NDJSON progress events with
+`--json`. Exit codes: 0 success, 1 the run failed or found problems, 2 bad
+arguments or configuration, 130 interrupted.
+"""
+import argparse
+import json
+import os
+import sys
+
+import engine
+from progress import line_level, ndjson_events
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+class UsageError(Exception):
+    pass
+
+
+def build_data(args) -> dict:
+    # The same payload the UI sends
+    data = {
+        "selected_media_directory": os.path.abspath(args.directory),
+        "recursive_search": args.recursive,
+        "move_files_selected": getattr(args, "move", False),
+        "dry_run": getattr(args, "dry_run", False),
+    }
+    if getattr(args, "move", False) and not engine.ALLOW_MOVE_FILES:
+        raise UsageError("--move requires ALLOW_MOVE_FILES=true")
+    if args.command == "cleanup":
+        return data
+
+    try:
+        data["tag_whitelist"] = engine.load_tag_whitelist()
+    except Exception as e:
+        raise UsageError(f"Invalid tag whitelist file: {e}")
+    if args.command == "validate":
+        return data
+
+    data.update({
+        "geotag_enabled": bool(args.geotag),
+        "geotag_override": args.geotag_override,
+        "geotag_nearest_place": args.nearest_place,
+        "geotag_data": geotag_selection(args.geotag) if args.geotag else None,
+        "ignore_minor_errors": args.ignore_minor_errors,
+        "force_reprocess": args.force,
+        "write_changes_only": args.changes_only,
+        "skip_file_validation": args.skip_validation,
+        "process_workers": args.workers,
+    })
+    error = engine.prepare_geotag_data(data)
+    if error:
+        raise UsageError(error)
+    return data
+
+
+def geotag_selection(names) -> dict:
+    # Looks a location up in GEOTAG_DATA_FILE the way the UI dropdowns do
+    try:
+        coordinates = engine.geotag_store.get().coordinates(names)
+    except (KeyError, TypeError):
+        raise UsageError(f"Geotag location not found: {' / '.join(names)}")
+    except Exception as e:
+        raise UsageError(f"Error loading geotag data: {e}")
+    country, state, city, location = names
+    return {"country": country, "state": state, "city": city, "location": location, "coordinates": str(coordinates)}
+
+
+def select_stream(args, data):
+    if args.command == "cleanup":
+        return engine.clean_files_stream(data, wait_for_locks=args.wait)
+    if args.command == "watch":
+        return engine.watch_stream(data)
+    if args.command == "validate":
+        return engine.validate_files_stream(data)
+    if data["dry_run"]:
+        # Reports what a run would change, without changing anything
+        return engine.plan_processing_stream(data)
+    return engine.process_photos_stream(data, wait_for_locks=args.wait)
+
+
+def run(args) -> int:
+    try:
+        data = build_data(args)
+    except UsageError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    failed = False
+
+    def track(stream):
+        # Errors end processing runs early, but validation keeps going and
+        # only reports them, so any error line fails the run
+        nonlocal failed
+        for line in stream:
+            if line_level(line) == "error" or (getattr(line, "event", None) == "end" and line.fields["status"] == "failed"):
+                failed = True
+            yield line
+
+    lines = track(select_stream(args, data))
+    if args.json:
+        for event in ndjson_events(lines):
+            if event.startswith('{"type":"done"'):
+                done = json.loads(event)
+                done["exit_code"] = EXIT_FAILED if failed else EXIT_OK
+                if failed:
+                    done["status"] = "failed"
+                event = json.dumps(done, separators=(",", ":")) + "\n"
+            sys.stdout.write(event)
+            sys.stdout.flush()
+    else:
+        for line in lines:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Process, validate, clean up or watch media files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    process = commands.add_parser("process", help="set metadata from file names (and optionally move files)")
+    validate = commands.add_parser("validate", help="run the preflight checks without changing anything")
+    cleanup = commands.add_parser("cleanup", help="delete junk files such as Thumbs.db and ._ files")
+    watch = commands.add_parser("watch", help="process new files as they arrive, until interrupted")
+    for command in (process, validate, cleanup, watch):
+        command.add_argument("directory", help="directory to process")
+        command.add_argument("-r", "--recursive", action="store_true", help="include subdirectories")
+        command.add_argument("--json", action="store_true", help="print NDJSON progress events instead of the text log")
+    for command in (process, validate, watch):
+        command.add_argument("--move", action="store_true", help="move files into the move-to directory (needs ALLOW_MOVE_FILES)")
+
+    for command in (process, watch):
+        command.add_argument("--geotag", nargs=4, metavar=("COUNTRY", "STATE", "CITY", "LOCATION"),
+                             help="geotag files with a location from GEOTAG_DATA_FILE")
+        command.add_argument("--geotag-override", action="store_true", help="replace existing GPS data when geotagging")
+        command.add_argument("--nearest-place", action="store_true",
+                             help="name locations of files with GPS after the nearest saved place")
+        command.add_argument("--workers", type=int, default=engine.PROCESS_WORKERS, help="files processed in parallel")
+        command.add_argument("--ignore-minor-errors", action="store_true")
+        command.add_argument("--force", action="store_true", help="reprocess files unchanged since the last run")
+        command.add_argument("--skip-validation", action="store_true", help="skip the post-write metadata check")
+        command.add_argument("--changes-only", action="store_true",
+                             help="read the current metadata first and only write fields that differ")
+    for command in (process, cleanup):
+        command.add_argument("--dry-run", action="store_true", help="report what would be done without changing files")
+        command.add_argument("--wait", action="store_true",
+                             help="wait for other runs on overlapping directories instead of failing")
+
+    args = parser.parse_args(argv)
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
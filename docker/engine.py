@@ -0,0 +1,1653 @@
+import calendar
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from exiftool_pool import ExifToolPool
+from geotag_store import GeotagStore
+from place_index import PlaceIndex
+from tag_whitelist import TagWhitelistStore
+from jpeg_metadata import TEMPORARY_SUFFIX, JpegMetadataError, read_jpeg_metadata, write_jpeg_metadata
+from mp4_metadata import Mp4MetadataError, read_mp4_metadata, write_mp4_metadata
+from hash_index import HashIndex
+from io_scheduler import IoScheduler, file_size, interleave_by_size, ionice_prefix
+from media_catalog import MediaCatalog
+from metadata_plan import field_changes, parse_assignment, read_fields, tag_matches
+from metrics import Metrics, PhaseTimer
+from move_engine import DuplicateFileError, MoveEngine
+from processing_manifest import ProcessingManifest, metadata_fingerprint
+from progress import Event, end_event, file_event
+from run_locks import RunLocks
+from watcher import StableFileBatcher, WatchError, open_source
+
+# Internal Directories
+media_directory = "/media"
+move_to_directory = "/moveTo"
+
+# Environment Variables
+FAMILY_LAST_NAME = os.getenv("FAMILY_LAST_NAME", "Cassidy")    
+APP_NAME = os.getenv("APP_NAME", f"{FAMILY_LAST_NAME} Family Media Processor")
+GEOTAG_DATA_FILE = os.getenv("GEOTAG_DATA_FILE", "./config/geotag_data.yaml")
+TAG_WHITELIST_FILE = os.getenv("TAG_WHITELIST_FILE", "")
+EXTERNAL_MEDIA_DIR = os.getenv("EXTERNAL_MEDIA_DIR", media_directory)
+EXTERNAL_MOVE_TO_DIR = os.getenv("EXTERNAL_MOVE_TO_DIR", move_to_directory)
+EXCLUDED_DIRECTORIES = [d.strip() for d in os.getenv("EXCLUDED_DIRECTORIES", "").split(',') if d.strip()]
+TZ = os.getenv("TZ", "GMT")
+ALLOW_MOVE_FILES = os.getenv("ALLOW_MOVE_FILES", "false").lower() == "true"
+VERBOSE_LOGGING = os.getenv("VERBOSE_LOGGING", "false").lower() == "true"
+EXIFTOOL_WRITE_MODE = os.getenv("EXIFTOOL_WRITE_MODE", "standard").lower()
+METADATA_BACKEND = os.getenv("METADATA_BACKEND", "exiftool").lower()
+VIDEO_IN_PLACE_WRITES = os.getenv("VIDEO_IN_PLACE_WRITES", "false").lower() == "true"
+MANIFEST_FILE = os.getenv("MANIFEST_FILE", "./config/processing_manifest.db")
+CATALOG_FILE = os.getenv("CATALOG_FILE", "./config/media_catalog.db")
+JOBS_DIRECTORY = os.getenv("JOBS_DIRECTORY", "./config/jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+LOCK_DIRECTORY = os.getenv("LOCK_DIRECTORY", "./config/locks")
+MOVE_WORKERS = int(os.getenv("MOVE_WORKERS", "4"))
+MOVE_VERIFY = os.getenv("MOVE_VERIFY", "size").lower()
+MOVE_AS_PROCESSED = os.getenv("MOVE_AS_PROCESSED", "false").lower() == "true"
+DUPLICATE_HANDLING = os.getenv("DUPLICATE_HANDLING", "off").lower()
+HASH_INDEX_FILE = os.getenv("HASH_INDEX_FILE", "./config/hash_index.db")
+NEAREST_PLACE_MAX_DISTANCE_KM = float(os.getenv("NEAREST_PLACE_MAX_DISTANCE_KM", "1"))
+WATCH_DIRECTORY = os.getenv("WATCH_DIRECTORY", "")
+WATCH_MODE = os.getenv("WATCH_MODE", "auto").lower()
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "10"))
+WATCH_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", "5"))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", "50"))
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", os.cpu_count() or 1))
+EXIFTOOL_WORKERS = int(os.getenv("EXIFTOOL_WORKERS", PROCESS_WORKERS))
+IO_DEVICE_CONCURRENCY = int(os.getenv("IO_DEVICE_CONCURRENCY", "0"))
+IO_LARGE_FILE_SIZE_MB = int(os.getenv("IO_LARGE_FILE_SIZE_MB", "512"))
+IO_INTERLEAVE = os.getenv("IO_INTERLEAVE", "false").lower() == "true"
+EXIFTOOL_IONICE = os.getenv("EXIFTOOL_IONICE", "").lower()
+
+# Local Variables
+tag_delimiter = ";"
+tag_hierarchy_delimiter = "."
+family_name = f"{FAMILY_LAST_NAME} Family"
+copyright_notice = f"{family_name} Photos"
+gps_coordinates_round_digits = 5  # Some software seems to struggle with longer gps coordinates
+file_extension_whitelist = ['.jpg', '.jpeg', '.mp4', '.mov']
+extension_conversions = {".jpeg": ".jpg",}
+native_metadata_extensions = ['.jpg', '.mp4', '.mov']  # Written without ExifTool when METADATA_BACKEND is native
+temporary_file_suffixes = (TEMPORARY_SUFFIX, "_exiftool_tmp")  # Copies being written by another run, never media
+video_extensions = ['.mp4', '.mov']
+# How mp4_metadata got each video's metadata onto disk, for the log
+video_write_methods = {
+    "in_place": "in place",
+    "moov_at_end": "at the end of the file",
+    "moov_moved": "by moving the movie header to the end of the file",
+    "full_rewrite": "by rewriting the whole file",
+}
+location_fields = ["GPSLatitude", "GPSLongitude", "City", "Country"]
+prescan_fields = location_fields + ["DateTimeOriginal", "CreateDate", "Author", "Artist", "Copyright", "RawFileName"]
+current_metadata_options = ["-a", "-G1"]  # Every copy of a tag, with its group, for write_changes_only
+
+# Counters and latency histograms served at /metrics
+metrics = Metrics()
+metrics.describe("phase_duration_seconds", "histogram", "Time spent in each processing phase.")
+metrics.describe("files_total", "counter", "Files handled by processing runs, by outcome.")
+metrics.describe("bytes_total", "counter", "Bytes of files processed and moved.")
+metrics.describe("video_metadata_bytes_written_total", "counter", "Bytes written to update video metadata natively, by write method.")
+metrics.describe("exiftool_spawns_total", "counter", "ExifTool processes started.")
+metrics.describe("errors_total", "counter", "Errors by the phase they occurred in.")
+
+# Every ExifTool process runs at EXIFTOOL_IONICE priority
+exiftool_command_prefix = ionice_prefix(EXIFTOOL_IONICE)
+
+# Persistent ExifTool workers (started on first use)
+exiftool_pool = ExifToolPool(
+    EXIFTOOL_WORKERS,
+    on_spawn=lambda: metrics.increment("exiftool_spawns_total", mode="stay_open"),
+    command_prefix=exiftool_command_prefix,
+)
+
+# Per-device limits on concurrent file operations (IO_DEVICE_CONCURRENCY)
+io_scheduler = IoScheduler(IO_DEVICE_CONCURRENCY, IO_LARGE_FILE_SIZE_MB * 1024 * 1024)
+
+# Directory claims that keep overlapping runs apart, across web workers
+run_locks = RunLocks(LOCK_DIRECTORY)
+lock_poll_interval = 1.0
+
+# Parsed geotag data, reloaded when GEOTAG_DATA_FILE changes
+geotag_store = GeotagStore(GEOTAG_DATA_FILE)
+
+# Compiled tag whitelist, rebuilt when TAG_WHITELIST_FILE changes
+tag_whitelist_store = TagWhitelistStore(TAG_WHITELIST_FILE)
+
+# Spatial index of the saved places for nearest-place matching: (data version, index)
+place_index = None
+place_index_lock = threading.Lock()
+
+# Record of already processed files (opened on first use)
+processing_manifest = None
+processing_manifest_lock = threading.Lock()
+
+# Content hash index of the move-to tree, opened on first use
+hash_index = None
+hash_index_lock = threading.Lock()
+
+# Searchable catalog of processed files (opened on first use)
+media_catalog = None
+media_catalog_lock = threading.Lock()
+
+
+def prepare_geotag_data(data):
+    # Converts the UI geotag selection into the values written to files.
+    # Returns an error message, or None if the data is valid.
+    if not data['geotag_enabled']:
+        return None
+
+    try:
+        latitude, longitude = map(float, data['geotag_data']['coordinates'].split(','))
+        latitude = round(latitude, gps_coordinates_round_digits)
+        longitude = round(longitude, gps_coordinates_round_digits)
+    except ValueError:
+        return "Error: Invalid coordinates format. Ensure they are number pairs."
+
+    country, country_code = data['geotag_data']['country'].split(' - ', 1)
+
+    data['geotag_data'] = {
+        "location": data['geotag_data']['location'],
+        "city": data['geotag_data']['city'],
+        "state": data['geotag_data']['state'],
+        "country": country,
+        "country_code": country_code,
+        "longitude": longitude,
+        "latitude": latitude,
+    }
+    return None
+
+def log_process_options(data):
+    # Select files based on recursion mode
+    if data['recursive_search']:
+        yield "RECURSIVE_SEARCH is true. Processing files in all subdirectories.\n"
+    else:
+        yield "RECURSIVE_SEARCH is false. Processing files in the top-level directory only.\n"
+
+    # Log user options
+    if ALLOW_MOVE_FILES:
+        if data['move_files_selected']:
+            yield "MOVE_FILES is true. Files will be moved.\n"
+        else:
+            yield "MOVE_FILES is false. Files will not be moved.\n"
+    if data['geotag_enabled']:
+        override_status = "enabled" if data['geotag_override'] else "disabled"
+        yield f"GEOTAG_FILES is true. Files will be geotagged. (Override: {override_status})\n"
+    else:
+        yield "GEOTAG_FILES is false. Files will not be geotaged.\n"
+    if data.get('geotag_nearest_place'):
+        yield f"NEAREST_PLACE is true. Files with GPS will be named after the nearest saved place within {NEAREST_PLACE_MAX_DISTANCE_KM} km.\n"
+    if data.get('skip_file_validation'):
+        yield "SKIP_FILE_VALIDATION is true. Files will skip post-process validation.\n"
+    if data['ignore_minor_errors']:
+        yield "IGNORE_MINOR_ERRORS is true. Processing files will ignore minor errors.\n"
+    if data.get('force_reprocess'):
+        yield "FORCE_REPROCESS is true. Files processed in earlier runs will be processed again.\n"
+    if data.get('write_changes_only'):
+        yield "WRITE_CHANGES_ONLY is true. Only metadata fields that differ will be written.\n"
+    if ALLOW_MOVE_FILES and data['move_files_selected'] and MOVE_AS_PROCESSED:
+        yield "MOVE_AS_PROCESSED is true. Files will be moved as soon as they are processed.\n"
+
+def ending_early() -> Event:
+    return end_event(f"{APP_NAME} ending early\n", "failed")
+
+def completed_successfully() -> Event:
+    return end_event(f"{APP_NAME} completed successfully.\n", "completed")
+
+def process_photos_stream(data, completed_files=None, wait_for_locks=False):
+    # Runs a processing run (see run_process_photos) and releases the
+    # directories it claimed however the stream ends
+    claims = []
+    try:
+        yield from run_process_photos(data, completed_files, wait_for_locks, claims)
+    finally:
+        for claim in claims:
+            claim.release()
+
+def run_process_photos(data, completed_files, wait_for_locks, claims):
+	
+    # Validate env variables
+    if not is_valid_timezone(TZ):
+        yield f"Invalid Environment Variables: TZ={TZ}\n"
+        yield ending_early()
+        return
+
+    # Watch mode passes the batch of files to process and logs the options once
+    if data.get('file_paths') is None:
+        yield from log_process_options(data)
+
+    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory);
+    yield "-------------- New Process --------------\n"
+    run_start = time.monotonic()
+    timer = PhaseTimer(metrics)
+
+    # Other runs can't touch the selected files while this one works on them
+    if data.get('file_paths') is not None:
+        source_directories = {os.path.dirname(file_path) for file_path in data['file_paths']}
+    else:
+        source_directories = {internal_selected_media_directory}
+    claim = yield from claim_directories(source_directories, wait_for_locks)
+    if claim is None:
+        yield ending_early()
+        return
+    claims.append(claim)
+
+    # The tree is walked once; preflight and processing share the list
+    file_paths = list(timer.iterate("discovery", selected_files(data)))
+
+    # Check every file before any file is touched
+    move_files = ALLOW_MOVE_FILES and data['move_files_selected']
+    target_directories = set()
+    with timer.phase("preflight"):
+        preflight_errors, file_count = preflight_check(
+            file_paths,
+            data['tag_whitelist'],
+            move_files,
+            target_directories,
+        )
+
+    if not file_count:
+        yield f"No files found in: {data['selected_media_directory']}.\n"
+        yield ending_early()
+        return
+
+    if preflight_errors:
+        for error in preflight_errors:
+            yield f"{error}\n"
+        yield f"Preflight found {len(preflight_errors)} problem(s). No files were changed.\n"
+        yield ending_early()
+        return
+
+    # ... and the move-to directories its files are going to
+    if target_directories:
+        claim = yield from claim_directories(target_directories, wait_for_locks)
+        if claim is None:
+            yield ending_early()
+            return
+        claims.append(claim)
+    yield Event(f"Preflight checks passed for {file_count} files.\n", "start", total=file_count, phase="process")
+
+    if EXIFTOOL_WRITE_MODE == "single-pass":
+        yield "EXIFTOOL_WRITE_MODE is single-pass. Metadata is written and verified in one ExifTool pass.\n"
+
+    # Pre-scan existing metadata for the whole directory with a single ExifTool read
+    existing_metadata = None
+    if data['geotag_enabled'] or data.get('geotag_nearest_place'):
+        yield "Pre-scanning existing metadata...\n"
+        prescan_start = time.monotonic()
+        existing_metadata = prescan_metadata(
+            data.get('file_paths') or [internal_selected_media_directory], data['recursive_search'], prescan_fields
+        )
+        timer.record("prescan", time.monotonic() - prescan_start)
+        yield f"Pre-scan read metadata for {len(existing_metadata)} files in {time.monotonic() - prescan_start:.1f}s.\n"
+
+    # Current values of every field, so only the fields that differ are written
+    current_metadata = None
+    if data.get('write_changes_only'):
+        yield "Reading current metadata...\n"
+        current_metadata = yield from read_all_current_metadata(data, timer)
+
+    # Process files in parallel, streaming each file's log in order
+    manifest = get_processing_manifest()
+    process_workers = max(1, int(data.get('process_workers') or PROCESS_WORKERS))
+    if IO_DEVICE_CONCURRENCY:
+        yield f"Processing files with {process_workers} worker(s), at most {IO_DEVICE_CONCURRENCY} I/O slots per device.\n"
+    else:
+        yield f"Processing files with {process_workers} worker(s).\n"
+    processed_files = []
+    status_counts = {"processed": 0, "skipped": 0, "deleted": 0, "resumed": 0}
+    move_engine = None
+    if move_files:
+        duplicate_index = None
+        if DUPLICATE_HANDLING != "off":
+            duplicate_index = get_hash_index()
+            rescanned = duplicate_index.refresh(move_to_directory)
+            yield f"DUPLICATE_HANDLING is {DUPLICATE_HANDLING}. Hash index updated ({rescanned} directories rescanned).\n"
+        move_engine = MoveEngine(MOVE_WORKERS, MOVE_VERIFY, duplicate_index, DUPLICATE_HANDLING == "skip", timer, io_scheduler)
+    move_counts = {"renamed": 0, "copied": 0, "duplicate": 0}
+    # With MOVE_AS_PROCESSED, moves start while later files are still processing.
+    # Preflight has already ruled out target conflicts, so this is safe.
+    # (With DUPLICATE_HANDLING, an existing target that turns out to differ still ends the run.)
+    move_as_processed = move_files and MOVE_AS_PROCESSED
+    move_futures = deque()
+    with ThreadPoolExecutor(max_workers=process_workers) as executor:
+        pending = deque()
+        # Files are fed to the workers in the order preflight saw them
+        file_iterator = iter(file_paths)
+        if IO_INTERLEAVE:
+            file_iterator = interleave_by_size(file_iterator, IO_LARGE_FILE_SIZE_MB * 1024 * 1024)
+        while True:
+            # Keep a bounded number of files in flight so logs stream steadily
+            while len(pending) < process_workers * 2:
+                file_path = next(file_iterator, None)
+                if file_path is None:
+                    break
+                # Files finished before an interrupted job was resumed only need moving
+                if completed_files is not None and file_path in completed_files:
+                    yield file_event([], "resumed", os.path.basename(file_path))
+                    if move_as_processed:
+                        move_futures.append(submit_move(move_engine, file_path))
+                    elif move_files:
+                        processed_files.append(file_path)
+                    status_counts["resumed"] += 1
+                    continue
+                pending.append((file_path, executor.submit(
+                    process_file_scheduled, file_path, data, existing_metadata, manifest, timer, current_metadata
+                )))
+            if not pending:
+                break
+
+            original_file_path, future = pending.popleft()
+            processed_file_path, log, status = future.result()
+            metrics.increment("files_total", status=status)
+            yield file_event(log, status, os.path.basename(original_file_path))
+            if status != "error":
+                status_counts[status] += 1
+                if processed_file_path:
+                    # Only the move phase needs the processed paths kept around
+                    if move_as_processed:
+                        move_futures.append(submit_move(move_engine, processed_file_path))
+                    elif move_files:
+                        processed_files.append(processed_file_path)
+                    if completed_files is not None:
+                        completed_files.add(processed_file_path)
+
+            # Record background moves that have already finished
+            while status != "error" and move_futures and move_futures[0][2].done():
+                method, message = complete_move(*move_futures.popleft(), manifest)
+                if message:
+                    yield f"{message}\n"
+                if method is None:
+                    status = "error"
+                else:
+                    move_counts[method] += 1
+
+            if status == "error":
+                for _, future in pending:
+                    future.cancel()
+                executor.shutdown(wait=True, cancel_futures=True)
+                if move_engine:
+                    # Moves already running are finished (or rolled back) and recorded
+                    move_engine.shutdown()
+                    for move in move_futures:
+                        complete_move(*move, manifest)
+                yield ending_early()
+                return
+
+    yield (
+        f"{status_counts['processed']} files processed, "
+        f"{status_counts['skipped']} skipped (already up to date), "
+        f"{status_counts['deleted']} deleted.\n"
+    )
+    if status_counts["resumed"]:
+        yield f"{status_counts['resumed']} files were already completed before this job was resumed.\n"
+
+    # Move files if needed
+    if move_as_processed:
+        yield Event("All files processed successfully - finishing moves\n", "phase", phase="move")
+        move_results = (complete_move(*move, manifest) for move in move_futures)
+    elif move_files:
+        yield Event("All files processed successfully - now moving files\n", "phase", phase="move")
+        file_move_operations = []
+        target_file_paths = set()
+        # Each target directory is listed once instead of checking every target path
+        target_directory_listings = {}
+
+        for source_file_path in processed_files:
+            target_file_path = move_target_path(os.path.basename(source_file_path))
+            external_target_file_path = target_file_path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR)
+
+            if target_file_path in target_file_paths:
+                yield f"Conflict found: Multiple files have the same target path {external_target_file_path}\n"
+                yield "No files will be moved.\n"
+                yield ending_early()
+                return
+
+            target_directory, target_file_name = os.path.split(target_file_path)
+            # With duplicate handling, an existing identical target is left for the move engine to report
+            if target_file_name in directory_names(target_directory_listings, target_directory) and (
+                DUPLICATE_HANDLING == "off"
+                or get_hash_index().find_duplicate(source_file_path, target_file_path) != target_file_path
+            ):
+                yield f"Conflict found: {external_target_file_path} already exists.\n"
+                yield f"No files will be moved.\n"
+                yield ending_early()
+                return
+
+            target_file_paths.add(target_file_path)
+            file_move_operations.append((source_file_path, target_file_path))
+
+        if IO_INTERLEAVE:
+            file_move_operations = interleave_by_size(file_move_operations, IO_LARGE_FILE_SIZE_MB * 1024 * 1024, lambda operation: operation[0])
+        move_results = (
+            record_move(source_file_path, target_file_path, method, error, manifest)
+            for source_file_path, target_file_path, method, error in move_engine.move_all(file_move_operations)
+        )
+
+    if move_files:
+        try:
+            for method, message in move_results:
+                if message:
+                    yield f"{message}\n"
+                if method is None:
+                    yield ending_early()
+                    return
+                move_counts[method] += 1
+        finally:
+            move_engine.shutdown()
+        yield (
+            f"{move_counts['renamed'] + move_counts['copied']} files moved "
+            f"({move_counts['renamed']} renamed, {move_counts['copied']} copied across devices).\n"
+        )
+        if move_counts["duplicate"]:
+            yield f"{move_counts['duplicate']} duplicate files were left in place.\n"
+
+    # Phases run on several workers at once, so their totals can exceed the wall-clock time
+    yield f"Phase timings (run took {time.monotonic() - run_start:.1f}s, times are summed across workers):\n"
+    for phase, total, count in timer.summary():
+        yield f"   {phase}: {total:.2f}s total, {total / count * 1000:.1f}ms average over {count}\n"
+
+    yield completed_successfully()
+
+def process_file_scheduled(file_path, data, existing_metadata=None, manifest=None, timer=None, current_metadata=None):
+    # process_file once the file's device has a free I/O slot (IO_DEVICE_CONCURRENCY)
+    with io_scheduler.slot([file_path], file_size(file_path), timer):
+        return process_file(file_path, data, existing_metadata, manifest, timer, current_metadata)
+
+def process_file(file_path, data, existing_metadata=None, manifest=None, timer=None, current_metadata=None):
+    # Runs the full pipeline for a single file and returns
+    # (processed file path or None if deleted, log lines, status) where status
+    # is one of "processed", "skipped", "deleted" or "error"
+    log = []
+    timer = timer or PhaseTimer(metrics)
+    single_pass = EXIFTOOL_WRITE_MODE == "single-pass"
+    original_file_path = file_path
+    file_name = os.path.basename(file_path)
+    file_base_name, file_extension = os.path.splitext(file_name)
+
+    # Check if file needs to be deleted
+    if should_delete_file(file_name):
+        try:
+            os.remove(file_path)
+            log.append(f"File deleted: {file_name}\n")
+            return None, log, "deleted"
+        except Exception as e:
+            log.append(f"Error deleting {file_name}: {str(e)}\n")
+            timer.error("delete")
+            return None, log, "error"
+
+    # Check if file extension is in the whitelist
+    if file_extension.lower() not in file_extension_whitelist:
+        log.append(f"Error File extension not whitelisted for {file_name}\n")
+        timer.error("whitelist")
+        return None, log, "error"
+
+    # Clean file names, if necessary
+    with timer.phase("rename"):
+        new_file_name = normalize_file_name(file_name)
+        new_file_path = os.path.join(os.path.dirname(file_path), new_file_name)
+        if new_file_name != file_name:
+            try:
+                os.rename(file_path, new_file_path)
+                file_path = new_file_path
+            except Exception as e:
+                log.append(f"Error updating file extension for {file_name}: {str(e)}\n")
+                timer.error("rename")
+                return None, log, "error"
+
+    # Extract and validate date, title and tags
+    try:
+        with timer.phase("parse"):
+            date, title, tags_list = parse_file_name(file_name, None)
+    except FileNameError as e:
+        log.append(f"{e}\n")
+        timer.error("parse")
+        return None, log, "error"
+    try:
+        with timer.phase("whitelist"):
+            check_tag_whitelist(tags_list, data['tag_whitelist'])
+    except FileNameError as e:
+        log.append(f"{e}\n")
+        timer.error("whitelist")
+        return None, log, "error"
+
+    # Skip files already processed with identical metadata
+    fingerprint = processing_fingerprint(date, title, tags_list, data)
+    if manifest and not data.get('force_reprocess'):
+        if manifest.is_current(file_path, os.stat(file_path), fingerprint):
+            log.append(f"File skipped (unchanged since last run): {file_name}\n")
+            # Files processed before the catalog existed are added as they are seen
+            catalog = get_media_catalog()
+            if catalog and not catalog.contains(file_path):
+                catalog.record(file_path, date, title, tags_list)
+            return file_path, log, "skipped"
+
+    # JPEGs and videos can be written without ExifTool (METADATA_BACKEND=native)
+    native_write = METADATA_BACKEND == "native" and os.path.splitext(file_path)[1].lower() in native_metadata_extensions
+
+    geotag, location_record = choose_geotag(file_path, original_file_path, data, existing_metadata, native_write, log, timer)
+
+    # The file's current metadata, from one of the bulk reads if it ran: all
+    # planned fields with write_changes_only, RawFileName from the pre-scan
+    if data.get('write_changes_only'):
+        record = (current_metadata or {}).get(os.path.normpath(original_file_path))
+        if record is None:
+            record = read_current_metadata(file_path)
+    else:
+        record = (existing_metadata or {}).get(os.path.normpath(original_file_path))
+    raw_name = raw_file_name(file_name, record)
+
+    assignments = metadata_assignments(date, title, raw_name, geotag)
+    tag_values = tag_field_values(tags_list)
+
+    # With write_changes_only, fields that already hold their value are left
+    # alone, and files where nothing differs aren't written at all
+    written_tag_values = tag_values
+    unchanged = False
+    if data.get('write_changes_only'):
+        changes = field_changes(metadata_fields(assignments, tag_values), record)
+        changed_tags = {tag for tag, _, _ in changes}
+        assignments = [argument for argument in assignments if parse_assignment(argument)[0] in changed_tags]
+        written_tag_values = {field: values for field, values in tag_values.items() if field in changed_tags}
+        unchanged = not changes
+
+    # Build ExifTool command
+    exif_command = [
+        "-overwrite_original",
+        "-P",
+        "-F",
+    ]
+    if data['ignore_minor_errors']:
+        exif_command.append("-m")
+    exif_command.extend(assignments)
+    exif_command.append(file_path)
+
+    # Tags Fields
+    if single_pass:
+        # Repeated "=" assignments in one command replace the existing list,
+        # so no separate clearing pass (and file rewrite) is needed
+        for field, values in written_tag_values.items():
+            exif_command.extend([f"-{field}={value}" for value in values] or [f"-{field}="])
+    else:
+        # Tags fields must be cleared first
+        exif_command_tags = [
+            "-overwrite_original",
+            "-P",
+            "-F",
+        ]
+        if data['ignore_minor_errors']:
+            exif_command_tags.append("-m")
+
+        exif_command_tags.extend([f"-{field}=" for field in written_tag_values])
+        exif_command_tags.append(file_path)
+
+        for field, values in written_tag_values.items():
+            exif_command.extend(f"-{field}+={value}" for value in values)
+
+    # Run ExifTool command
+    expected_exif = {
+        "Author": family_name,
+        "Copyright": copyright_notice,
+    }
+    validate = not data.get('skip_file_validation') and not unchanged
+    if native_write and not unchanged:
+        # Rewrite only the JPEG metadata segments or the video's movie header;
+        # files the native writers cannot handle safely fall back to ExifTool
+        try:
+            write_start = time.perf_counter()
+            write_native_metadata(file_path, file_name, log, {
+                "date": date,
+                "title": title,
+                "author": family_name,
+                "copyright": copyright_notice,
+                "raw_file_name": raw_name,
+                "hierarchical_subject": tag_values["XMP:HierarchicalSubject"],
+                "subject": tag_values["XMP:Subject"],
+                "keywords": tag_values["IPTC:Keywords"],
+                "geotag": geotag,
+            })
+            timer.record("write", time.perf_counter() - write_start)
+            # One read back serves both validation and the verbose dump
+            with timer.phase("validation"):
+                metadata_result = native_metadata_result(file_path)
+            read_results = [metadata_result] * (validate + VERBOSE_LOGGING)
+        except (JpegMetadataError, Mp4MetadataError) as e:
+            log.append(f"   Warning: Writing {file_name} with ExifTool instead ({e})\n")
+            native_write = False
+        except OSError as e:
+            log.append(f"Metadata write failed for {file_name}: {str(e)}\n")
+            timer.error("write")
+            return None, log, "error"
+
+    if not native_write and not unchanged:
+        # In single-pass mode the read back shares the write's round trip and is timed with it
+        with timer.phase("write"):
+            if single_pass:
+                # Write, read back and dump (if verbose) in a single round trip
+                commands = [exif_command]
+                if validate:
+                    commands.append(exif_validation_command(file_path, expected_exif))
+                if VERBOSE_LOGGING:
+                    commands.append([file_path])
+                result, *read_results = run_exiftool_batch(commands)
+            else:
+                # A failed tag clearing is reported like a failed write, and
+                # the write isn't attempted
+                result = run_exiftool(exif_command_tags) if written_tag_values else None
+                if result is None or result.returncode == 0:
+                    result = run_exiftool(exif_command)
+
+        if result.returncode != 0:
+            log.append(f"ExifTool processing failed for {file_name}: {result.stderr.strip()}\n")
+            timer.error("write")
+            return None, log, "error"
+
+    # Validate field updates (spot test)
+    if validate:
+        if single_pass or native_write:
+            valid = exif_fields_match(read_results.pop(0), expected_exif)
+        else:
+            with timer.phase("validation"):
+                valid = validate_exif_fields(file_path, expected_exif)
+        if not valid:
+            log.append(f"Error updating metadata for: {file_name}\n")
+            timer.error("validation")
+            return None, log, "error"
+
+    if unchanged:
+        log.append(f"File skipped (metadata already up to date): {file_name}\n")
+    else:
+        log.append(f"File processed successfully: {file_name}\n")
+
+    # Output all exif fields, if VERBOSE_LOGGING is true 
+    if VERBOSE_LOGGING and not unchanged:
+        if single_pass or native_write:
+            metadata_result = read_results.pop(0)
+        else:
+            with timer.phase("validation"):
+                metadata_result = run_exiftool([file_path])
+        if metadata_result.returncode == 0:
+            log.append(Event(f"Exif Metadata for {file_name}:\n", "detail"))
+            log.append(Event(metadata_result.stdout + "\n", "detail"))
+        else:
+            log.append(f"Error fetching metadata for {file_name}: {metadata_result.stderr.strip()}\n")
+            timer.error("validation")
+            return None, log, "error"
+
+    # Update file modified date   
+    try:
+        with timer.phase("modified_date"):
+            if not data.get('write_changes_only') or modified_date_differs(file_path, date, TZ):
+                set_file_modified_date(file_path, date, TZ)
+    except Exception as e:
+        log.append(f"Error setting modified date for {file_name}: {str(e)}\n")
+        timer.error("modified_date")
+        return None, log, "error"
+
+    if manifest:
+        manifest.record(file_path, fingerprint)
+    catalog = get_media_catalog()
+    if catalog:
+        catalog.record(file_path, date, title, tags_list, catalog_location(geotag, location_record))
+
+    if unchanged:
+        return file_path, log, "skipped"
+    metrics.increment("bytes_total", os.path.getsize(file_path), phase="process")
+    return file_path, log, "processed"
+
+def processing_fingerprint(date, title, tags_list, data) -> str:
+    return metadata_fingerprint({
+        "date": date,
+        "title": title,
+        "tags": tags_list,
+        "geotag": data['geotag_data'] if data['geotag_enabled'] else None,
+        "geotag_override": data['geotag_override'],
+        # Matches depend on the saved places and the distance limit
+        "nearest_place": (geotag_store.get().version, NEAREST_PLACE_MAX_DISTANCE_KM) if data.get('geotag_nearest_place') else None,
+        "family_name": family_name,
+        "copyright_notice": copyright_notice,
+    })
+
+def plan_processing_stream(data):
+    # Dry run of process_photos_stream: reads every file's current metadata
+    # and reports the renames, metadata fields, modified dates and moves a
+    # run would change, without changing anything
+    if not is_valid_timezone(TZ):
+        yield f"Invalid Environment Variables: TZ={TZ}\n"
+        yield ending_early()
+        return
+
+    yield from log_process_options(data)
+    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory)
+    yield "-------------- New Plan --------------\n"
+    timer = PhaseTimer(metrics)
+
+    move_files = ALLOW_MOVE_FILES and data['move_files_selected']
+    file_paths = list(selected_files(data))
+    preflight_errors, file_count = preflight_check(file_paths, data['tag_whitelist'], move_files)
+    if not file_count:
+        yield f"No files found in: {data['selected_media_directory']}.\n"
+        yield ending_early()
+        return
+    if preflight_errors:
+        for error in preflight_errors:
+            yield f"{error}\n"
+        yield f"Preflight found {len(preflight_errors)} problem(s). Fix them to see the full plan.\n"
+        yield ending_early()
+        return
+
+    existing_metadata = None
+    if data['geotag_enabled'] or data.get('geotag_nearest_place'):
+        existing_metadata = prescan_metadata(
+            data.get('file_paths') or [internal_selected_media_directory], data['recursive_search'], prescan_fields
+        )
+    current_metadata = yield from read_all_current_metadata(data, timer)
+
+    manifest = get_processing_manifest()
+    counts = {"rename": 0, "metadata": 0, "fields": 0, "modified_date": 0, "move": 0, "up_to_date": 0, "skipped": 0, "deleted": 0}
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path)
+        if should_delete_file(file_name):
+            yield f"Would delete: {file_name}\n"
+            counts["deleted"] += 1
+            continue
+        log, changes = plan_file(file_path, data, existing_metadata, current_metadata, manifest, timer)
+        if move_files:
+            target_file_path = move_target_path(normalize_file_name(file_name))
+            log.append(f"   Move to: {target_file_path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR, 1)}\n")
+            counts["move"] += 1
+        for change, count in changes.items():
+            counts[change] += count
+        if log:
+            yield f"{file_name}:\n"
+            yield from log
+
+    yield (
+        f"Plan for {file_count} files: {counts['rename']} renamed, "
+        f"{counts['metadata']} with metadata changes ({counts['fields']} fields), "
+        f"{counts['modified_date']} modified dates updated, {counts['move']} moved, "
+        f"{counts['up_to_date']} already up to date, {counts['skipped']} skipped (unchanged since last run), "
+        f"{counts['deleted']} deleted.\n"
+    )
+    yield "Dry run complete. No files were changed.\n"
+
+def plan_file(file_path, data, existing_metadata, current_metadata, manifest, timer):
+    # What process_file would change in one file (before moving it):
+    # (report lines, {change: count})
+    log = []
+    changes = {}
+    file_name = os.path.basename(file_path)
+    new_file_name = normalize_file_name(file_name)
+    if new_file_name != file_name:
+        log.append(f"   Rename to: {new_file_name}\n")
+        changes["rename"] = 1
+
+    date, title, tags_list = parse_file_name(file_name, None)
+    if (
+        manifest and not data.get('force_reprocess') and new_file_name == file_name
+        and manifest.is_current(file_path, os.stat(file_path), processing_fingerprint(date, title, tags_list, data))
+    ):
+        changes["skipped"] = 1
+        return log, changes
+
+    geotag, _ = choose_geotag(file_path, file_path, data, existing_metadata, False, log, timer)
+    record = current_metadata.get(os.path.normpath(file_path))
+    if record is None:
+        record = read_current_metadata(file_path)
+    # RawFileName as processing would choose it, from the metadata that run
+    # would have read (see process_file)
+    if data.get('write_changes_only'):
+        raw_name = raw_file_name(file_name, record)
+    else:
+        raw_name = raw_file_name(file_name, (existing_metadata or {}).get(os.path.normpath(file_path)))
+    assignments = metadata_assignments(date, title, raw_name, geotag)
+    fields = field_changes(metadata_fields(assignments, tag_field_values(tags_list)), record)
+    for tag, current, target in fields:
+        log.append(f"   {tag}: {plan_value(current)} -> {plan_value(target) if target != '' else '(removed)'}\n")
+    if fields:
+        changes["metadata"] = 1
+        changes["fields"] = len(fields)
+
+    if modified_date_differs(file_path, date, TZ):
+        modified = datetime.fromtimestamp(os.stat(file_path).st_mtime, ZoneInfo(TZ)).strftime("%Y-%m-%d %H:%M:%S")
+        target = datetime.fromtimestamp(file_modified_timestamp(date, TZ), ZoneInfo(TZ)).strftime("%Y-%m-%d %H:%M:%S")
+        log.append(f"   Modified date: {modified} -> {target}\n")
+        changes["modified_date"] = 1
+
+    if not changes:
+        changes["up_to_date"] = 1
+    return log, changes
+
+def plan_value(value) -> str:
+    if value is None or value == []:
+        return "(none)"
+    if isinstance(value, list):
+        return "; ".join(map(str, value))
+    return str(value)
+
+def validate_files_stream(data):
+
+    # Select files based on recursion mode
+    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory);
+    if data['recursive_search']:
+        yield "RECURSIVE_SEARCH is true. Validating files in all subdirectories.\n"
+    else:
+        yield "RECURSIVE_SEARCH is false. Validating files in the top-level directory only.\n"
+
+    yield "-------------- New Validation --------------\n"
+
+    move_files = ALLOW_MOVE_FILES and data.get('move_files_selected', False)
+    errors, file_count = preflight_check(
+        discover_files(internal_selected_media_directory, data['recursive_search']),
+        data['tag_whitelist'],
+        move_files,
+    )
+
+    if not file_count:
+        yield f"No files found in: {data['selected_media_directory']}.\n"
+        return
+
+    for error in errors:
+        yield f"{error}\n"
+
+    if errors:
+        yield f"Validation found {len(errors)} problem(s) in {file_count} files.\n"
+    else:
+        yield f"Validation passed for {file_count} files.\n"
+
+def clean_files_stream(data, wait_for_locks=False):
+	
+    # Select files based on recursion mode
+    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory);
+    if data['recursive_search']:
+        yield "RECURSIVE_SEARCH is true. Cleaning files in all subdirectories.\n"
+    else:
+        yield "RECURSIVE_SEARCH is false. Cleaning files in the top-level directory only.\n"
+    dry_run = data.get('dry_run', False)
+    if dry_run:
+        yield "DRY_RUN is true. Files will be listed but not deleted.\n"
+
+    yield Event("-------------- New Cleanup Process --------------\n", "start", phase="cleanup")
+
+    # A dry run changes nothing, so it doesn't need the directory to itself
+    claim = None
+    if not dry_run:
+        claim = yield from claim_directories([internal_selected_media_directory], wait_for_locks)
+        if claim is None:
+            yield ending_early()
+            return
+
+    # Process each file as it is found
+    file_count = 0
+    try:
+        for file_path in discover_files(internal_selected_media_directory, data['recursive_search']):
+            file_count += 1
+            file_name = os.path.basename(file_path)
+
+            # Check if file needs to be deleted
+            if should_delete_file(file_name):
+                if dry_run:
+                    yield file_event([f"File would be deleted: {file_path}\n"], "deleted", file_name)
+                    continue
+                try:
+                    os.remove(file_path)
+                    yield file_event([f"File deleted: {file_path}\n"], "deleted", file_name)
+                    continue
+                except Exception as e:
+                    yield f"Error deleting {file_path}: {str(e)}\n"
+                    yield ending_early()
+                    return
+    finally:
+        if claim:
+            claim.release()
+
+    if not file_count:
+        yield f"No files found in: {data['selected_media_directory']}.\n"
+        yield ending_early()
+        return
+
+    yield completed_successfully()
+    
+def watch_stream(data, stop_event=None):
+    # Processes files as they arrive in the selected directory, in small batches,
+    # until stop_event is set. Each file goes through the normal pipeline once;
+    # files with problems are reported and skipped until they change again.
+    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory)
+    recursive = data['recursive_search']
+    try:
+        source = open_source(
+            internal_selected_media_directory, recursive, EXCLUDED_DIRECTORIES,
+            lambda: discover_files(internal_selected_media_directory, recursive),
+            WATCH_MODE, WATCH_POLL_INTERVAL,
+        )
+    except WatchError as e:
+        yield f"Error watching {data['selected_media_directory']}: {e}\n"
+        yield ending_early()
+        return
+
+    yield from log_process_options(data)
+    yield (
+        f"Watching {data['selected_media_directory']} for new files ({source.name}). "
+        f"Files are processed once unchanged for {WATCH_SETTLE_SECONDS:g}s.\n"
+    )
+    move_files = ALLOW_MOVE_FILES and data['move_files_selected']
+    batcher = StableFileBatcher(WATCH_SETTLE_SECONDS, WATCH_BATCH_SIZE)
+    try:
+        while not (stop_event and stop_event.is_set()):
+            for file_path in source.changes(timeout=0.5):
+                if file_path is None:
+                    # Events were lost, so everything is checked again
+                    for discovered_path in discover_files(internal_selected_media_directory, recursive):
+                        batcher.add(discovered_path)
+                elif not file_path.endswith(temporary_file_suffixes):
+                    batcher.add(file_path)
+
+            batch = batcher.take_batch()
+            if not batch:
+                continue
+
+            try:
+                tag_whitelist = load_tag_whitelist()
+            except Exception as e:
+                yield f"Error: Invalid tag whitelist file: {e}\n"
+                batcher.mark_handled(batch)
+                continue
+
+            file_paths = []
+            for file_path in batch:
+                errors, _ = preflight_check([file_path], tag_whitelist, move_files)
+                for error in errors:
+                    yield f"{error}\n"
+                if not errors:
+                    file_paths.append(file_path)
+            if file_paths:
+                yield from process_photos_stream(dict(data, tag_whitelist=tag_whitelist, file_paths=file_paths), wait_for_locks=True)
+
+            # The pipeline's own writes and renames must not queue the files again
+            handled = set(batch)
+            handled.update(os.path.join(os.path.dirname(path), normalize_file_name(os.path.basename(path))) for path in batch)
+            batcher.mark_handled(handled)
+    finally:
+        source.close()
+
+class FileNameError(ValueError):
+    pass
+
+def selected_files(data):
+    # The files a run works on: an explicit list (watch mode) or the selected directory
+    if data.get('file_paths') is not None:
+        return iter(data['file_paths'])
+    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory)
+    return discover_files(internal_selected_media_directory, data['recursive_search'])
+
+def claim_directories(directories, wait: bool):
+    # Claims `directories` for this run (see RunLocks). Returns the claim, or
+    # None if another run is working in an overlapping directory and `wait`
+    # is false. While waiting, empty lines are yielded so a job can still
+    # notice it was cancelled.
+    claim = run_locks.try_claim(directories)
+    if claim is not None:
+        return claim
+    external_directories = sorted(
+        directory.replace(media_directory, EXTERNAL_MEDIA_DIR, 1).replace(move_to_directory, EXTERNAL_MOVE_TO_DIR, 1)
+        for directory in directories
+    )
+    if len(external_directories) > 3:
+        external_directories[3:] = [f"{len(external_directories) - 3} more"]
+    external_directories = ", ".join(external_directories)
+    if not wait:
+        yield f"Error: Another run is working in {external_directories}. Try again once it has finished.\n"
+        return None
+    yield f"Waiting for another run working in {external_directories} to finish...\n"
+    while claim is None:
+        time.sleep(lock_poll_interval)
+        yield ""
+        claim = run_locks.try_claim(directories)
+    yield "Directories are free, continuing.\n"
+    return claim
+
+def discover_files(directory: str, recursive: bool):
+    # Yields file paths as the walk finds them, skipping EXCLUDED_DIRECTORIES
+    # and the metadata writers' temporary files.
+    # Each directory is listed completely before its files are yielded, so
+    # files renamed by the caller are never picked up a second time.
+    pending_directories = [directory]
+    while pending_directories:
+        current_directory = pending_directories.pop()
+        file_paths = []
+        subdirectories = []
+        try:
+            with os.scandir(current_directory) as entries:
+                for entry in entries:
+                    # DirEntry type checks use the cached directory data, not a stat call
+                    if entry.is_dir():
+                        if recursive and not entry.is_symlink() and entry.name not in EXCLUDED_DIRECTORIES:
+                            subdirectories.append(entry.path)
+                    elif entry.is_file() and not entry.name.endswith(temporary_file_suffixes):
+                        file_paths.append(entry.path)
+        except OSError:
+            continue  # Skip directories we can't access
+
+        yield from file_paths
+        pending_directories.extend(reversed(subdirectories))
+
+def normalize_file_name(file_name: str) -> str:
+    # 1. Update file extensions if necessary (lowercase and conversions)
+    # 2. Replace weird Unicode spaces (Zs category) with regular space
+    file_base_name, file_extension = os.path.splitext(file_name)
+    new_extension = extension_conversions.get(file_extension.lower(), file_extension.lower())
+    normalized_base = ''.join(
+        ' ' if unicodedata.category(c) == 'Zs' and c != ' ' else c
+        for c in file_base_name
+    )
+    return f"{normalized_base}{new_extension}"
+
+def parse_file_name(file_name: str, tag_whitelist):
+    # Returns (date, title, tags_list) or raises FileNameError
+    file_base_name = os.path.splitext(file_name)[0]
+
+    # Use regex to extract date and title
+    match = re.match(
+        r"^(\d{4})-(\d{2})-(\d{2})T(\d{2})\.(\d{2})\.(\d{2})"
+        r"(?: ([^\[]*))?"
+        r"(?: \[([^\]]+)\])?$",
+        file_base_name
+    )
+
+    if not match:
+        raise FileNameError(f"File Name Format Error: {file_name}")
+
+    year, month, day, hour, minute, second, title, tags = match.groups()
+    date = f"{year}:{month}:{day} {hour}:{minute}:{second}"
+
+    # Format fields
+    if tags:
+        tags_list = [tag.strip() for tag in tags.split(tag_delimiter)]
+    else:
+        tags_list = ""
+    if not title:
+       title = ""
+
+    # Validate fields
+    if '  ' in file_name:
+        raise FileNameError(f"File Name Validation Error: {file_name} contains consecutive spaces.")
+    if title and title.startswith('-'):
+        raise FileNameError(f"File Name Validation Error: Title starts with a dash: {file_name}")
+    if title and title.endswith(' '):
+        raise FileNameError(f"File Name Validation Error: Title ends with a space: {file_name}")
+    if title and ('[' in title or ']' in title):
+        raise FileNameError(f"File Name Validation Error: Title contains brackets: {file_name}")
+    check_tag_whitelist(tags_list, tag_whitelist)
+
+    return date, title, tags_list
+
+def check_tag_whitelist(tags_list, tag_whitelist) -> None:
+    # Raises FileNameError for the first tag no whitelist pattern allows
+    if tags_list and tag_whitelist:
+        for tag in tags_list:
+            if not tag_whitelist.allows(tag):
+                raise FileNameError(f"File Name Validation Error: '{tag}' tag is not allowed.")
+
+def move_target_path(file_name: str) -> str:
+    year, month = file_name.split('-')[:2]
+    month_name = calendar.month_abbr[int(month)].upper()
+    formatted_month = f"{month} - {month_name}"
+    return os.path.join(move_to_directory, year, formatted_month, file_name)
+
+def submit_move(move_engine, source_file_path: str):
+    # Starts moving a processed file in the background: (source, target, future)
+    target_file_path = move_target_path(os.path.basename(source_file_path))
+    return source_file_path, target_file_path, move_engine.submit(source_file_path, target_file_path)
+
+def complete_move(source_file_path, target_file_path, future, manifest):
+    # Waits for a background move; see record_move
+    try:
+        result = future.result()
+    except OSError as e:
+        return record_move(source_file_path, target_file_path, None, e, manifest)
+    return record_move(source_file_path, target_file_path, result, None, manifest)
+
+def record_move(source_file_path, target_file_path, result, error, manifest):
+    # Returns (method, message to log or None); method is None when the move
+    # failed, or "duplicate" when the file was left in place
+    file_name = os.path.basename(source_file_path)
+    if isinstance(error, DuplicateFileError):
+        duplicate = error.duplicate_path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR, 1)
+        metrics.increment("files_total", status="duplicate")
+        return "duplicate", f"Duplicate left in place: {file_name} is identical to {duplicate}"
+    if error:
+        metrics.increment("errors_total", phase="move")
+        if isinstance(error, FileExistsError):
+            return None, f"Conflict found: {target_file_path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR, 1)} already exists."
+        return None, f"Error moving {file_name}: {error}"
+    if manifest:
+        manifest.move(source_file_path, target_file_path)
+    catalog = get_media_catalog()
+    if catalog:
+        catalog.move(source_file_path, target_file_path)
+    metrics.increment("files_total", status="moved")
+    metrics.increment("bytes_total", os.path.getsize(target_file_path), phase="move")
+    method, duplicate_path = result
+    if duplicate_path:
+        duplicate = duplicate_path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR, 1)
+        return method, f"Duplicate moved: {file_name} is identical to {duplicate}"
+    return method, None
+
+def preflight_check(file_items, tag_whitelist, move_files: bool, target_directories=None):
+    # Runs every pure-Python check on all files without changing anything and
+    # returns (all problems found, number of files checked). The move-to
+    # directories the files would go to are added to `target_directories`.
+    errors = []
+    file_count = 0
+    # Move targets are remembered as short digests rather than full paths,
+    # and each target directory is listed once instead of checking every path
+    target_file_digests = set()
+    target_directory_listings = {}
+    for file_path in file_items:
+        file_count += 1
+        file_name = os.path.basename(file_path)
+        if should_delete_file(file_name):
+            continue
+
+        if os.path.splitext(file_name)[1].lower() not in file_extension_whitelist:
+            errors.append(f"Error File extension not whitelisted for {file_name}")
+            continue
+
+        try:
+            parse_file_name(file_name, tag_whitelist)
+        except FileNameError as e:
+            errors.append(str(e))
+            continue
+
+        if move_files:
+            target_file_path = move_target_path(normalize_file_name(file_name))
+            external_target_file_path = target_file_path.replace(move_to_directory, EXTERNAL_MOVE_TO_DIR)
+            target_file_digest = hashlib.blake2b(target_file_path.encode("utf-8"), digest_size=16).digest()
+            if target_file_digest in target_file_digests:
+                errors.append(f"Conflict found: Multiple files have the same target path {external_target_file_path}")
+            # With duplicate handling, existing targets are compared by content after processing
+            elif DUPLICATE_HANDLING == "off" and os.path.basename(target_file_path) in directory_names(
+                target_directory_listings, os.path.dirname(target_file_path)
+            ):
+                errors.append(f"Conflict found: {external_target_file_path} already exists.")
+            target_file_digests.add(target_file_digest)
+            if target_directories is not None:
+                target_directories.add(os.path.dirname(target_file_path))
+
+    return errors, file_count
+
+def directory_names(listings: dict, directory: str) -> set:
+    # The names in `directory`, listed on first use and kept in `listings`
+    if directory not in listings:
+        try:
+            with os.scandir(directory) as entries:
+                listings[directory] = {entry.name for entry in entries}
+        except FileNotFoundError:
+            listings[directory] = set()
+    return listings[directory]
+
+def load_tag_whitelist():
+    # The compiled whitelist, or None if every tag is allowed
+    if not TAG_WHITELIST_FILE:
+        return None
+    try:
+        whitelist = tag_whitelist_store.get()
+    except Exception as e:
+        raise RuntimeError(f"Could not read {TAG_WHITELIST_FILE}: {e}")
+
+    if not len(whitelist):
+        raise ValueError("Tag whitelist file is empty or contains no valid tags.")
+
+    return whitelist
+    
+def should_delete_file(filename: str) -> bool:
+    FILES_TO_DELETE = {
+        "desktop.ini",
+        "thumbs.db",
+        "ehthumbs.db",
+        ".ds_store",
+        ".spotlight-v100",
+        ".trashes",
+        ".fseventsd",
+        ".directory"
+    }
+
+    PREFIXES_TO_DELETE = (
+        "._",            # Apple resource fork metadata
+        ".appledouble",  # AppleDouble metadata directory
+        ".trash-",       # Linux Trash folders (like .Trash-1000)
+    )
+
+    lower_name = filename.lower()
+    return (
+        lower_name in FILES_TO_DELETE or
+        any(lower_name.startswith(prefix) for prefix in PREFIXES_TO_DELETE)
+    )
+
+def is_valid_timezone(tz: str) -> bool:
+    try:
+        ZoneInfo(tz)
+        return True
+    except ZoneInfoNotFoundError:
+    	return False
+    	  	
+def get_processing_manifest():
+    global processing_manifest
+    if not MANIFEST_FILE:
+        return None
+    with processing_manifest_lock:
+        if processing_manifest is None:
+            processing_manifest = ProcessingManifest(MANIFEST_FILE)
+    return processing_manifest
+
+def get_hash_index():
+    global hash_index
+    with hash_index_lock:
+        if hash_index is None:
+            hash_index = HashIndex(HASH_INDEX_FILE)
+    return hash_index
+
+def get_media_catalog():
+    global media_catalog
+    if not CATALOG_FILE:
+        return None
+    with media_catalog_lock:
+        if media_catalog is None:
+            media_catalog = MediaCatalog(CATALOG_FILE)
+    return media_catalog
+
+def catalog_location(geotag, location_record) -> dict:
+    # The location written to a file, completed from what it already had
+    geotag = geotag or {}
+    existing = location_record or {}
+    location = {
+        "place": geotag.get("location"),
+        "city": geotag.get("city") or existing.get("City"),
+        "state": geotag.get("state") or existing.get("State"),
+        "country": geotag.get("country") or existing.get("Country"),
+    }
+    for key, field in (("latitude", "GPSLatitude"), ("longitude", "GPSLongitude")):
+        location[key] = geotag.get(key)
+        if location[key] is None:
+            try:
+                location[key] = float(existing[field])
+            except (KeyError, TypeError, ValueError):
+                pass
+    return location
+
+def run_exiftool(args) -> subprocess.CompletedProcess:
+    return exiftool_pool.execute(args)
+
+def run_exiftool_batch(commands) -> list:
+    return exiftool_pool.execute_many(commands)
+
+def prescan_metadata(paths, recursive: bool, fields, options=("-fast2",)) -> dict:
+    # Reads fields for every media file in the directories (or files) with one ExifTool
+    # process, parsing its JSON output record by record as it streams: {file_path: {field: value}}
+    command = exiftool_command_prefix + ["exiftool", "-json", "-n", *options] + [f"-{field}" for field in fields]
+    if recursive:
+        command.append("-r.")
+    for excluded_directory in EXCLUDED_DIRECTORIES:
+        command.extend(["-i", excluded_directory])
+    for extension in file_extension_whitelist:
+        command.extend(["-ext", extension.lstrip(".")])
+    command.extend(paths)
+
+    metadata = {}
+    metrics.increment("exiftool_spawns_total", mode="prescan")
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, encoding="utf-8") as process:
+        for record in iter_exiftool_json(process.stdout):
+            metadata[os.path.normpath(record["SourceFile"])] = record
+    return metadata
+
+def iter_exiftool_json(stream):
+    # ExifTool writes each record as a top-level "{ ... }" block, so a record can
+    # be decoded as soon as its closing brace arrives
+    record_lines = []
+    for line in stream:
+        record_lines.append(line)
+        if line.rstrip("\r\n") in ("}", "},", "}]"):
+            record = "".join(record_lines).strip().lstrip("[,").rstrip("],")
+            record_lines = []
+            yield json.loads(record)
+
+def write_native_metadata(file_path: str, file_name: str, log: list, fields: dict) -> None:
+    if os.path.splitext(file_path)[1].lower() in video_extensions:
+        # Reported per file, since a video's write can range from a few KB to the whole file
+        bytes_written, method = write_mp4_metadata(file_path, fields, in_place=VIDEO_IN_PLACE_WRITES)
+        log.append(f"   Video metadata written {video_write_methods[method]} ({bytes_written:,} bytes): {file_name}\n")
+        metrics.increment("video_metadata_bytes_written_total", bytes_written, method=method)
+    else:
+        write_jpeg_metadata(file_path, fields)
+
+def read_native_metadata(file_path: str) -> dict:
+    if os.path.splitext(file_path)[1].lower() in video_extensions:
+        return read_mp4_metadata(file_path)
+    return read_jpeg_metadata(file_path)
+
+def native_metadata(file_path: str):
+    # Metadata read without ExifTool, or None if the native reader can't parse the file
+    try:
+        return read_native_metadata(file_path)
+    except (OSError, JpegMetadataError, Mp4MetadataError):
+        return None
+
+def native_metadata_result(file_path: str) -> subprocess.CompletedProcess:
+    # Formats the native read like `exiftool -s` so the usual validation applies
+    try:
+        metadata = read_native_metadata(file_path)
+    except (OSError, JpegMetadataError, Mp4MetadataError) as e:
+        return subprocess.CompletedProcess([file_path], 1, "", str(e))
+    stdout = "".join(f"{key:<32}: {value}\n" for key, value in metadata.items())
+    return subprocess.CompletedProcess([file_path], 0, stdout, "")
+
+def has_gps_fields(metadata: dict) -> bool:
+    return "GPSLongitude" in metadata and "GPSLatitude" in metadata
+
+def read_location_metadata(file_path: str) -> dict:
+    # GPS and location name fields of one file, in the pre-scan's format
+    result = run_exiftool(["-json", "-n"] + [f"-{field}" for field in location_fields] + [file_path])
+    try:
+        return json.loads(result.stdout)[0]
+    except (ValueError, IndexError):
+        return {}
+
+def nearest_saved_place(metadata: dict):
+    # ((country, state, city, location, latitude, longitude), distance in km)
+    # of the saved place closest to the file's GPS, or None
+    try:
+        latitude, longitude = float(metadata["GPSLatitude"]), float(metadata["GPSLongitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return get_place_index().nearest(latitude, longitude)
+
+def get_place_index() -> PlaceIndex:
+    # Rebuilt only when the geotag data file changes
+    global place_index
+    geotags = geotag_store.get()
+    with place_index_lock:
+        if place_index is None or place_index[0] != geotags.version:
+            place_index = (geotags.version, PlaceIndex(geotags.places, NEAREST_PLACE_MAX_DISTANCE_KM))
+        return place_index[1]
+
+def choose_geotag(file_path, original_file_path, data, existing_metadata, native_write, log, timer):
+    # The geotag to write to a file, if any, and its current location fields:
+    # (geotag or None, location record or None). Warnings go to `log`.
+    file_name = os.path.basename(original_file_path)
+    geotag = None
+    location_record = None
+    nearest_place_enabled = data.get('geotag_nearest_place', False)
+    if data['geotag_enabled'] or nearest_place_enabled:
+        # Files missing from the pre-scan (e.g. hidden files ExifTool skipped) are read individually
+        with timer.phase("gps_check"):
+            location_record = (existing_metadata or {}).get(os.path.normpath(original_file_path))
+            if location_record is None and native_write:
+                location_record = native_metadata(file_path)
+            if location_record is None:
+                location_record = read_location_metadata(file_path)
+            existing_gps = has_gps_fields(location_record)
+
+        if existing_gps and nearest_place_enabled and not data['geotag_override']:
+            # Name the place the file was taken at from the saved place nearest to its own GPS
+            if location_record.get("City") and location_record.get("Country"):
+                log.append(f"   Warning: Location names already exist for: {file_name}\n")
+            else:
+                with timer.phase("nearest_place"):
+                    match = nearest_saved_place(location_record)
+                if match is None:
+                    log.append(f"   Warning: No saved place within {NEAREST_PLACE_MAX_DISTANCE_KM} km of {file_name}\n")
+                else:
+                    (country, state, city, location, _, _), distance = match
+                    country, country_code = country.split(' - ', 1)
+                    log.append(f"   Location matched for {file_name}: {location} ({distance:.2f} km)\n")
+                    # Only the location names are written; the file's own GPS is kept
+                    geotag = {
+                        "latitude": None,
+                        "longitude": None,
+                        "location": location,
+                        "city": city,
+                        "state": state,
+                        "country": country,
+                        "country_code": country_code,
+                    }
+
+        elif existing_gps and not data['geotag_override']:
+            log.append(f"   Warning: Geotag data already exists for: {file_name}\n")
+
+        elif data['geotag_enabled']:
+            if existing_gps and data['geotag_override']:
+                log.append(f"   Warning: Overriding existing geotag data for: {file_name}\n")
+            geotag = dict(data['geotag_data'])
+
+    if geotag:
+        geotag["location_name"] = f"{geotag['city']}, {geotag['state']}, {geotag['country']}"
+    return geotag, location_record
+
+def raw_file_name(file_name: str, record) -> str:
+    # The value for RawFileName: the file's name before it was first renamed
+    # by normalize_file_name. A recorded name in `record` (metadata already
+    # read in bulk, or None) that normalizes to `file_name` is kept, so a
+    # rerun doesn't replace "IMG.JPEG" with "IMG.jpg".
+    for key, value in (record or {}).items():
+        if tag_matches("RawFileName", key) and isinstance(value, str) and normalize_file_name(value) == file_name:
+            return value
+    return file_name
+
+def metadata_assignments(date, title, file_name, geotag) -> list:
+    # The ExifTool "-Tag=value" arguments written to every file, apart from
+    # the tag lists (see tag_field_values)
+    args = [
+        # Date Fields
+        f"-Time:all={date} +00:00", # Use UTC universally
+
+        # Title Fields
+        f"-Title={title}",
+        f"-By-line=",
+        f"-Caption-Abstract=",
+        f"-ImageDescription={title}",
+        f"-Description={title}",
+        f"-ObjectName={title}",
+        f"-Subtitle=",
+        f"-XPComment=",
+        f"-URL=",
+
+        # Rating Fields
+        # (Removes all ratings set in Windows)
+        f"-Rating=",
+        f"-RatingPercent=",
+        f"-SharedUserRating=",
+
+        # Author Fields
+        f"-Author={family_name}",
+        f"-XPAuthor={family_name}",
+        f"-Creator={family_name}",
+        f"-Artist={family_name}",
+
+        # Copyright Fields
+        f"-Copyright={copyright_notice}",
+        f"-CopyrightNotice=",
+        f"-Rights=",
+        f"-UsageTerms=",
+        f"-WebStatement=",
+        f"-Marked=",
+
+        # File Name Fields
+        f"-RawFileName={file_name}",
+
+        # Miscellaneous Fields               
+        f"-XMP-iptcCore:CountryCode=",
+        f"-XMP-iptcCore:CreatorContactInfo=",
+        f"-XMP-iptcCore:CreatorCity=",
+        f"-XMP-iptcCore:CreatorCountry=",
+        f"-XMP-iptcCore:CreatorAddress=",
+        f"-XMP-iptcCore:CreatorPostalCode=",
+        f"-XMP-iptcCore:CreatorRegion=",
+        f"-XMP-iptcCore:CreatorWorkEmail=",
+        f"-XMP-iptcCore:CreatorWorkTelephone=",
+        f"-XMP-iptcCore:CreatorWorkURL=",
+
+        f"-XMP-photoshop:TextLayerName=",
+        f"-XMP-photoshop:TextLayerText=",
+
+        f"-DerivedFromDocumentID=",
+        f"-DerivedFromOriginalDocumentID=",
+        f"-OriginalDocumentID=",
+        f"-DocumentID=",
+        f"-Software=",
+        f"-HistoryAction=",
+        f"-HistoryChanged=",
+        f"-HistoryInstanceID=",
+        f"-HistoryParameters=",
+        f"-HistorySoftwareAgent=",
+        f"-HistoryWhen=",
+        f"-InstanceID=",
+
+    ]
+    if geotag:
+        args.extend(geotag_exif_args(geotag))
+    return args
+
+def tag_field_values(tags_list) -> dict:
+    return {
+        "XMP:HierarchicalSubject": [tag.replace(tag_hierarchy_delimiter, "|").strip() for tag in tags_list],
+        "XMP:Subject": [tag.replace(tag_hierarchy_delimiter, "/").strip() for tag in tags_list],
+        "IPTC:Keywords": [tag.replace(tag_hierarchy_delimiter, "/").strip() for tag in tags_list],
+        "Microsoft:Category": [tag.replace(tag_hierarchy_delimiter, "/").strip() for tag in tags_list],
+    }
+
+def metadata_fields(assignments, tag_values) -> list:
+    # (tag, target) pairs in the order ExifTool applies them (see field_changes)
+    return [parse_assignment(argument) for argument in assignments] + list(tag_values.items())
+
+def planned_metadata_fields() -> list:
+    # Every field a run can write, for reading the current values up front
+    placeholder_geotag = dict.fromkeys(
+        ("latitude", "longitude", "location", "city", "state", "country", "country_code", "location_name"), ""
+    )
+    return read_fields(metadata_fields(metadata_assignments("", "", "", placeholder_geotag), tag_field_values([])))
+
+def read_all_current_metadata(data, timer):
+    # Bulk read of every planned field of the selected files (one ExifTool
+    # pass), logging how long it took: {file_path: record}
+    internal_selected_media_directory = data['selected_media_directory'].replace(EXTERNAL_MEDIA_DIR, media_directory)
+    read_start = time.monotonic()
+    current_metadata = prescan_metadata(
+        data.get('file_paths') or [internal_selected_media_directory], data['recursive_search'],
+        planned_metadata_fields(), current_metadata_options,
+    )
+    timer.record("prescan", time.monotonic() - read_start)
+    yield f"Read current metadata for {len(current_metadata)} files in {time.monotonic() - read_start:.1f}s.\n"
+    return current_metadata
+
+def read_current_metadata(file_path: str) -> dict:
+    # The current values of every planned field of one file, in the format
+    # of the bulk read in process_photos_stream
+    command = ["-json", "-n"] + current_metadata_options + [f"-{field}" for field in planned_metadata_fields()]
+    result = run_exiftool(command + [file_path])
+    try:
+        return json.loads(result.stdout)[0]
+    except (ValueError, IndexError):
+        return {}
+
+def geotag_exif_args(geotag: dict) -> list:
+    # ExifTool arguments for a geotag; without coordinates only the location
+    # names are written
+    args = []
+    if geotag["latitude"] is not None:
+        tri_coordinates = f"{geotag['latitude']}, {geotag['longitude']}, 0"
+        args.extend([
+            f"-composite:gpslatitude={geotag['latitude']}",
+            f"-xmp:gpslatitude={geotag['latitude']}",
+            f"-composite:gpslongitude={geotag['longitude']}",
+            f"-xmp:gpslongitude={geotag['longitude']}",
+            f"-GPSAltitude=0",
+            f"-GPSAltitudeRef=0",
+
+            f"-Keys:GPSCoordinates={tri_coordinates}",
+            f"-Userdata:GPSCoordinates={tri_coordinates}",
+            f"-Itemlist:GPSCoordinates={tri_coordinates}",
+
+            f"-XMP-iptcExt:LocationShownGPSLatitude={geotag['latitude']}",
+            f"-XMP-iptcExt:LocationShownGPSLongitude={geotag['longitude']}",
+            f"-XMP-iptcExt:LocationShownGPSAltitude=0",
+            f"-XMP-iptcExt:LocationShownGPSAltitudeRef=0",
+
+            f"-GPSMapDatum=",
+            f"-GPSImgDirection=",
+            f"-GPSImgDirectionRef=",
+            f"-GPSSpeed=",
+            f"-GPSSpeedRef=",
+        ])
+
+    args.extend([
+        f"-XMP:City={geotag['city']}",
+        f"-XMP:State={geotag['state']}",
+        f"-XMP:CountryCode={geotag['country_code']}",
+        f"-XMP:Country={geotag['country']}",
+        f"-XMP:CountryName={geotag['country']}",
+
+        f"-IPTC:City={geotag['city']}",
+        f"-IPTC:Province-State={geotag['state']}",
+        f"-IPTC:Country-PrimaryLocationCode={geotag['country_code']}",
+        f"-IPTC:Country-PrimaryLocationName={geotag['country']}",
+
+        f"-XMP-photoshop:City={geotag['city']}",
+        f"-XMP-photoshop:State={geotag['state']}",
+        f"-XMP-photoshop:Country={geotag['country']}",
+
+        f"-XMP-iptcExt:LocationShownCity={geotag['city']}",
+        f"-XMP-iptcExt:LocationShownProvinceState={geotag['state']}",
+        f"-XMP-iptcExt:LocationShownCountryCode={geotag['country_code']}",
+        f"-XMP-iptcExt:LocationShownCountryName={geotag['country']}",
+        f"-XMP-iptcExt:LocationShownLocationName={geotag['location_name']}",
+
+        f"-Keys:LocationName={geotag['location_name']}",
+    ])
+    return args
+        
+def set_file_modified_date(file_path: str, date_str: str, timezone: str) -> None:
+    timestamp = file_modified_timestamp(date_str, timezone)
+    os.utime(file_path, (timestamp, timestamp))
+
+def file_modified_timestamp(date_str: str, timezone: str) -> float:
+    dt = datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
+    dt = dt.replace(tzinfo=ZoneInfo(timezone))
+    dt_utc = dt.astimezone(ZoneInfo("UTC"))
+    return dt_utc.timestamp()
+
+def modified_date_differs(file_path: str, date_str: str, timezone: str) -> bool:
+    return abs(os.stat(file_path).st_mtime - file_modified_timestamp(date_str, timezone)) >= 1
+    
+def validate_exif_fields(file_path, expected_fields):
+    try:
+        return exif_fields_match(run_exiftool(exif_validation_command(file_path, expected_fields)), expected_fields)
+    except Exception:
+        return False
+
+def exif_validation_command(file_path, expected_fields) -> list:
+    return ["-s"] + [f"-{key}" for key in expected_fields.keys()] + [file_path]
+
+def exif_fields_match(result, expected_fields) -> bool:
+    try:
+        if result.returncode != 0:
+            return False
+
+        lines = result.stdout.splitlines()
+        actual_fields = {line.split(":")[0].strip(): ":".join(line.split(":")[1:]).strip() for line in lines}
+
+        for key, expected_value in expected_fields.items():
+            if actual_fields.get(key) != expected_value:
+                return False
+
+        return True
+    except Exception:
+        return False
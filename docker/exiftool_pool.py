@@ -0,0 +1,217 @@
+import atexit
+import itertools
+import queue
+import subprocess
+import threading
+
+
+class ExifToolWorkerError(RuntimeError):
+    pass
+
+
+class ExifToolWorker:
+    """A single `exiftool -stay_open True -@ -` process.
+
+    Commands are written to stdin one argument per line and terminated with
+    `-executeNUM`. ExifTool prints `{readyNUM}` on stdout when the command is
+    finished, and the `-echo4` sentinel carries the exit status on stderr.
+    `command_prefix` (e.g. an ionice invocation) is prepended to the command.
+    """
+
+    def __init__(self, executable="exiftool", command_prefix=()):
+        self.executable = executable
+        self.command_prefix = list(command_prefix)
+        self.process = None
+        self._sequence = itertools.count(1)
+        self._stderr_lines = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command_prefix + [self.executable, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # Drain stderr on a separate thread so a chatty command can never
+        # fill the pipe while we are blocked reading stdout
+        self._stderr_lines = queue.Queue()
+        threading.Thread(
+            target=self._drain_stderr,
+            args=(self.process.stderr, self._stderr_lines),
+            daemon=True,
+        ).start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self, args) -> subprocess.CompletedProcess:
+        return self.execute_many([args])[0]
+
+    def execute_many(self, commands) -> list:
+        # Commands are written back to back and answered in order, so a batch
+        # costs a single round trip to this ExifTool process
+        if not self.is_alive():
+            raise ExifToolWorkerError("ExifTool worker is not running")
+
+        numbered_commands = [(next(self._sequence), list(args)) for args in commands]
+        payload = []
+        for number, args in numbered_commands:
+            for arg in args:
+                if "\n" in arg:
+                    raise ExifToolWorkerError(f"ExifTool arguments cannot contain newlines: {arg!r}")
+            payload.extend(args)
+            payload.extend(["-echo4", f"{{status{number}:${{status}}}}", f"-execute{number}"])
+
+        try:
+            self.process.stdin.write("".join(f"{arg}\n" for arg in payload).encode("utf-8"))
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise ExifToolWorkerError(f"ExifTool worker exited unexpectedly: {e}")
+
+        return [self._read_result(number, args) for number, args in numbered_commands]
+
+    def _read_result(self, number, args) -> subprocess.CompletedProcess:
+        stdout_lines = []
+        ready_marker = f"{{ready{number}}}".encode("utf-8")
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise ExifToolWorkerError("ExifTool worker exited unexpectedly")
+            if line.rstrip(b"\r\n") == ready_marker:
+                break
+            stdout_lines.append(line)
+
+        stderr_lines = []
+        status = None
+        status_marker = f"{{status{number}:"
+        while True:
+            line = self._stderr_lines.get()
+            if line is None:
+                raise ExifToolWorkerError("ExifTool worker exited unexpectedly")
+            if line.startswith(status_marker):
+                status = line[len(status_marker):].rstrip("}")
+                break
+            stderr_lines.append(line)
+
+        stderr = "\n".join(stderr_lines)
+        if status is not None and status.isdigit():
+            returncode = int(status)
+        else:
+            # ExifTool versions without ${status} support echo the text verbatim
+            returncode = 1 if any(line.startswith("Error") for line in stderr_lines) else 0
+
+        return subprocess.CompletedProcess(
+            args=args,
+            returncode=returncode,
+            stdout=b"".join(stdout_lines).decode("utf-8", errors="replace"),
+            stderr=stderr,
+        )
+
+    def stop(self, timeout: float = 5) -> None:
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write(b"-stay_open\nFalse\n")
+                self.process.stdin.flush()
+                self.process.stdin.close()
+                self.process.wait(timeout=timeout)
+        except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    @staticmethod
+    def _drain_stderr(stream, lines):
+        for line in iter(stream.readline, b""):
+            lines.put(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+        lines.put(None)
+
+
+class ExifToolPool:
+    """Keeps up to `size` ExifTool workers warm and hands them out per command.
+
+    Workers are started lazily, replaced if they die, and shut down when the
+    interpreter exits. `on_spawn` is called each time an ExifTool process is
+    started, and every process is started with `command_prefix`.
+    """
+
+    def __init__(self, size: int, executable: str = "exiftool", on_spawn=None, command_prefix=()):
+        self.size = max(1, size)
+        self.executable = executable
+        self.command_prefix = list(command_prefix)
+        self.on_spawn = on_spawn
+        self._idle = queue.LifoQueue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.shutdown)
+
+    def execute(self, args) -> subprocess.CompletedProcess:
+        return self.execute_many([args])[0]
+
+    def execute_many(self, commands) -> list:
+        # Runs all commands on the same worker in a single round trip
+        commands = [list(args) for args in commands]
+        # ExifTool reads one argument per line, so a command with a newline
+        # in an argument (legal in file names) fails on its own, leaving the
+        # worker and the rest of the batch alone
+        rejected = {index: newline_error(args) for index, args in enumerate(commands)}
+        rejected = {index: result for index, result in rejected.items() if result is not None}
+        if rejected:
+            accepted = [args for index, args in enumerate(commands) if index not in rejected]
+            results = iter(self.execute_many(accepted) if accepted else [])
+            return [rejected[index] if index in rejected else next(results) for index in range(len(commands))]
+
+        worker = self._acquire()
+        try:
+            if not worker.is_alive():
+                self._restart(worker)
+            return worker.execute_many(commands)
+        except ExifToolWorkerError as e:
+            worker.stop()
+            return [
+                subprocess.CompletedProcess(args=args, returncode=-1, stdout="", stderr=str(e))
+                for args in commands
+            ]
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+    def _acquire(self) -> ExifToolWorker:
+        with self._lock:
+            if self._closed:
+                raise ExifToolWorkerError("ExifTool pool has been shut down")
+            if self._idle.empty() and len(self._workers) < self.size:
+                worker = ExifToolWorker(self.executable, self.command_prefix)
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+        return self._idle.get()
+
+    def _restart(self, worker: ExifToolWorker) -> None:
+        # A worker that can't be started (e.g. exiftool is missing) stays in
+        # the pool and is retried by the next command
+        worker.stop()
+        try:
+            worker.start()
+        except OSError as e:
+            raise ExifToolWorkerError(f"Could not start ExifTool: {e}")
+        if self.on_spawn:
+            self.on_spawn()
+
+
+def newline_error(args):
+    # An error result for a command that can't be sent to ExifTool, or None
+    for arg in args:
+        if "\n" in arg:
+            return subprocess.CompletedProcess(
+                args=args, returncode=-1, stdout="", stderr=f"Error: ExifTool arguments cannot contain newlines: {arg!r}"
+            )
+    return None
@@ -0,0 +1,136 @@
+import bisect
+import hashlib
+import os
+import threading
+
+import yaml
+
+LEVELS = ("country", "state", "city", "location")
+
+
+class GeotagStore:
+    """Parsed GEOTAG_DATA_FILE, reloaded whenever the file changes.
+
+    `get()` stats the file and only re-parses it when its mtime or size
+    changed, returning an immutable GeotagIndex that requests can keep using
+    while a newer version is loaded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat_key = None
+        self._index = None
+
+    def get(self) -> "GeotagIndex":
+        # Raises OSError or yaml.YAMLError if the file can't be read
+        stat = os.stat(self.path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stat_key != self._stat_key:
+                with open(self.path, 'rb') as f:
+                    self._index = GeotagIndex(f.read())
+                self._stat_key = stat_key
+            return self._index
+
+
+class GeotagIndex:
+    """One version of the geotag tree (country -> state -> city -> location:
+    "lat, lon") with lookups by level and a type-ahead prefix index.
+
+    The prefix index is a sorted list of every word-suffix of every name, so
+    a search is a binary search plus a short scan. `version` is a digest of
+    the file content, suitable as an ETag.
+    """
+
+    def __init__(self, content: bytes):
+        tree = yaml.safe_load(content) or {}
+        if not isinstance(tree, dict):
+            raise yaml.YAMLError("Geotag data must be a mapping of countries")
+        self.tree = tree
+        self.version = hashlib.blake2b(content, digest_size=16).hexdigest()
+        self.places = list(iter_places(tree))
+        self._prefix_index = build_prefix_index(tree)
+
+    def children(self, path) -> list:
+        # Names one level below `path` (a list of names from the country
+        # down); at the location level each entry also has its coordinates
+        node = self.tree
+        for name in path:
+            if not isinstance(node, dict) or name not in node:
+                raise KeyError(name)
+            node = node[name]
+        if not isinstance(node, dict):
+            raise KeyError(path[-1] if path else None)
+        if len(path) == len(LEVELS) - 1:
+            return [{"name": str(name), "coordinates": coordinates} for name, coordinates in node.items()]
+        return [{"name": str(name)} for name in node]
+
+    def search(self, query: str, limit: int = 20) -> list:
+        # Entries at any level with a word starting with `query`
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        index = self._prefix_index
+        results = []
+        seen = set()
+        position = bisect.bisect_left(index, (prefix,))
+        while position < len(index) and index[position][0].startswith(prefix) and len(results) < limit:
+            path = index[position][1]
+            position += 1
+            if path in seen:
+                continue
+            seen.add(path)
+            result = dict(zip(LEVELS, path))
+            result["level"] = LEVELS[len(path) - 1]
+            if len(path) == len(LEVELS):
+                result["coordinates"] = self.coordinates(path)
+            results.append(result)
+        return results
+
+    def coordinates(self, path):
+        node = self.tree
+        for name in path:
+            node = node[name]
+        return node
+
+
+def iter_places(tree):
+    # (country, state, city, location, latitude, longitude) for every location
+    # whose coordinates parse, in a country named "Name - CODE" (the code is
+    # written to files along with the names)
+    for country, states in tree.items():
+        if " - " not in str(country):
+            continue
+        for state, cities in (states or {}).items():
+            for city, locations in (cities or {}).items():
+                for location, coordinates in (locations or {}).items():
+                    try:
+                        latitude, longitude = map(float, str(coordinates).split(','))
+                    except ValueError:
+                        continue
+                    yield str(country), str(state), str(city), str(location), latitude, longitude
+
+
+def build_prefix_index(tree) -> list:
+    # Sorted (name suffix starting at a word, path) pairs: a prefix search is
+    # a bisect to the first match followed by a short scan
+    entries = []
+
+    def add(node, path):
+        if not isinstance(node, dict) or len(path) == len(LEVELS):
+            return
+        for name, child in node.items():
+            child_path = path + (str(name),)
+            words = [word for word in normalize(str(name)).split(" ") if word != "-"]
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), child_path))
+            add(child, child_path)
+
+    add(tree, ())
+    entries.sort()
+    return entries
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
@@ -0,0 +1,27 @@
+"""Production server settings: `gunicorn -c gunicorn.conf.py app:app`.
+
+Threaded workers keep the UI responsive while long processing streams and
+followed job logs hold their own threads, so one worker is the default.
+Workers don't share memory: with more than one, `/metrics` reports the
+worker that answered, and runs on overlapping directories are kept apart by
+file locks (see run_locks.py) rather than in-process state.
+"""
+import os
+
+bind = "0.0.0.0:5000"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_WORKERS", "1"))
+threads = int(os.getenv("WEB_THREADS", "16"))
+# gthread workers heartbeat from their main loop, so this limits a stuck
+# worker rather than a long stream
+timeout = 60
+# Streams still running at shutdown are cut off; jobs resume on restart
+graceful_timeout = 10
+
+
+def post_worker_init(worker):
+    # Each worker offers to resume interrupted jobs (each job runs, and is
+    # logged as resumed, in whichever worker locks it) and competes for the
+    # watcher
+    from app import start_background_tasks
+    start_background_tasks()
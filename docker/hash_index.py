@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from move_engine import file_checksum
+
+
+class HashIndex:
+    """SQLite index of file sizes and content hashes under the move-to tree.
+
+    `refresh()` only re-lists directories whose mtime changed since the last
+    run, and hashes are computed lazily: a file is hashed only when an
+    incoming file of the same size is looked up, then reused until the file's
+    size, mtime or inode changes.
+    """
+
+    def __init__(self, database_path: str):
+        directory = os.path.dirname(database_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                hash TEXT,
+                hashed_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_size ON files (size);
+            CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL
+            );
+            """
+        )
+        self._connection.commit()
+
+    def refresh(self, root: str) -> int:
+        # Brings the index up to date with the tree, returning how many
+        # directories had to be listed again
+        with self._lock:
+            known_directories = dict(self._connection.execute("SELECT path, mtime_ns FROM directories"))
+        seen_directories = set()
+        relisted = 0
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            seen_directories.add(directory)
+            stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            if known_directories.get(directory) == mtime_ns:
+                continue
+            relisted += 1
+            self._update_directory(directory, mtime_ns, entries)
+
+        with self._lock:
+            for directory in set(known_directories) - seen_directories:
+                self._connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+                self._connection.execute("DELETE FROM directories WHERE path = ?", (directory,))
+            self._connection.commit()
+        return relisted
+
+    def find_duplicate(self, path: str, target_path: str = None):
+        # Returns an indexed file (or `target_path`) with the same content as
+        # `path`, comparing sizes first and hashing only on a size match
+        size = os.stat(path).st_size
+        candidates = []
+        if target_path and os.path.isfile(target_path) and os.path.getsize(target_path) == size:
+            candidates.append(target_path)
+        with self._lock:
+            candidates.extend(
+                row[0] for row in self._connection.execute("SELECT path FROM files WHERE size = ?", (size,))
+                if row[0] != target_path
+            )
+        if not candidates:
+            return None
+
+        digest = file_checksum(path)
+        for candidate in candidates:
+            try:
+                if self.file_hash(candidate) == digest:
+                    return candidate
+            except OSError:
+                continue
+        return None
+
+    def file_hash(self, path: str) -> str:
+        # Hash from the index if the file is unchanged, otherwise computed and stored
+        stat = os.stat(path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, inode, hash FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        if row and row[:3] == (stat.st_size, stat.st_mtime_ns, stat.st_ino) and row[3]:
+            return row[3]
+        digest = file_checksum(path)
+        self.add(path, digest)
+        return digest
+
+    def add(self, path: str, digest: str = None) -> None:
+        stat = os.stat(path)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, os.path.dirname(path), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                 digest, datetime.now().isoformat() if digest else None),
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _update_directory(self, directory, mtime_ns, entries):
+        files = {}
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    files[entry.path] = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+        with self._lock:
+            indexed = {
+                row[0]: row[1:] for row in self._connection.execute(
+                    "SELECT path, size, mtime_ns, inode FROM files WHERE directory = ?", (directory,)
+                )
+            }
+            for path in set(indexed) - set(files):
+                self._connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            for path, stat in files.items():
+                # Unchanged files keep their hash; changed or new ones are hashed on demand
+                if indexed.get(path) != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, NULL, NULL)",
+                        (path, directory, stat.st_size, stat.st_mtime_ns, stat.st_ino),
+                    )
+            self._connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?)", (directory, mtime_ns))
+            self._connection.commit()
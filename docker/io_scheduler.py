@@ -0,0 +1,134 @@
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# ionice(1) scheduling classes
+IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+ORDER_WINDOW = 200  # Files reordered at a time when interleaving
+
+
+class IoScheduler:
+    """Limits concurrent file operations per device (`st_dev`), weighted by size.
+
+    Each device has `device_limit` slots. An operation takes one slot, plus
+    one for every `large_file_size` bytes of its file, but never all of
+    them: a large video can always run next to small files, while two large
+    files never stream from the same spinning disk at once. Waiters are
+    served in arrival order, so a stream of small files can't starve a large
+    one. A `device_limit` of 0 turns the limits off.
+    """
+
+    def __init__(self, device_limit: int, large_file_size: int):
+        self.device_limit = max(0, device_limit)
+        self.large_file_size = max(1, large_file_size)
+        self._condition = threading.Condition()
+        self._in_use = {}
+        self._waiting = {}
+
+    def weight(self, size: int) -> int:
+        return max(1, min(self.device_limit - 1, 1 + size // self.large_file_size))
+
+    @contextmanager
+    def slot(self, paths, size: int, timer=None):
+        # Holds slots on the devices of all `paths` (a move's source and
+        # target directory, say) for the duration of the block. Time spent
+        # waiting is recorded as the "io_wait" phase of `timer`, if given.
+        if not self.device_limit:
+            yield
+            return
+        devices = sorted({device for device in map(device_of, paths) if device is not None})
+        weight = self.weight(size)
+        ticket = object()
+        wait_start = time.perf_counter()
+        with self._condition:
+            # Queued on every device at once, so all queues agree on the order
+            for device in devices:
+                self._waiting.setdefault(device, deque()).append(ticket)
+            self._condition.wait_for(lambda: all(self._can_start(device, ticket, weight) for device in devices))
+            for device in devices:
+                self._waiting[device].popleft()
+                self._in_use[device] = self._in_use.get(device, 0) + weight
+            self._condition.notify_all()
+        if timer:
+            timer.record("io_wait", time.perf_counter() - wait_start)
+        try:
+            yield
+        finally:
+            with self._condition:
+                for device in devices:
+                    self._in_use[device] -= weight
+                self._condition.notify_all()
+
+    def _can_start(self, device, ticket, weight: int) -> bool:
+        return self._waiting[device][0] is ticket and self._in_use.get(device, 0) + weight <= self.device_limit
+
+
+def device_of(path: str):
+    # Device of `path`, or of its nearest existing parent (move targets may
+    # not exist yet); None if nothing along the way can be read
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+
+def file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def interleave_by_size(items, large_file_size: int, path=lambda item: item):
+    # Reorders `items` a window at a time so large files (`large_file_size`
+    # or more) are spread evenly between the small ones, largest first,
+    # instead of arriving in clumps. `path` gives an item's file path.
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= ORDER_WINDOW:
+            yield from interleave_window(window, large_file_size, path)
+            window = []
+    yield from interleave_window(window, large_file_size, path)
+
+
+def interleave_window(items, large_file_size: int, path):
+    sizes = {id(item): file_size(path(item)) for item in items}
+    large = sorted((item for item in items if sizes[id(item)] >= large_file_size), key=lambda item: -sizes[id(item)])
+    small = [item for item in items if sizes[id(item)] < large_file_size]
+    if not large or not small:
+        yield from large or small
+        return
+    gap = len(small) / len(large)
+    large_index = 0
+    for index, item in enumerate(small):
+        while large_index < len(large) and index >= large_index * gap:
+            yield large[large_index]
+            large_index += 1
+        yield item
+    yield from large[large_index:]
+
+
+def ionice_prefix(setting: str) -> list:
+    # Command prefix that runs a process with the I/O priority in `setting`
+    # ("idle", "best-effort" or "realtime", optionally ":<level 0-7>"), or []
+    # when no priority is set or ionice isn't installed
+    if not setting:
+        return []
+    io_class, _, level = setting.partition(":")
+    if io_class not in IONICE_CLASSES or (level and level not in tuple("01234567")):
+        raise ValueError(f"Invalid I/O priority: {setting}")
+    executable = shutil.which("ionice")
+    if executable is None:
+        return []
+    prefix = [executable, "-c", IONICE_CLASSES[io_class]]
+    if level and io_class != "idle":
+        prefix.extend(["-n", level])
+    return prefix
@@ -0,0 +1,291 @@
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from datetime import datetime
+
+from progress import Event, ndjson_events
+
+
+class JobCheckpoint:
+    """Persistent set of files a job has finished, appended to as it runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._files = {line.rstrip("\n") for line in f if line.strip()}
+
+    def __contains__(self, file_path) -> bool:
+        return file_path in self._files
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def add(self, file_path: str) -> None:
+        with self._lock:
+            if file_path in self._files:
+                return
+            self._files.add(file_path)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(f"{file_path}\n")
+
+
+class JobManager:
+    """Runs processing and cleanup streams in the background, `workers` jobs at a time.
+
+    Each job lives in its own directory holding `job.json` (type, payload and
+    status), `log.txt` (everything the stream produced), `events.ndjson` (the
+    same run as progress events, without verbose metadata) and
+    `checkpoint.txt` (files already finished). Jobs left running or queued by a previous
+    process are picked up again by `resume_interrupted()`.
+
+    Several processes (web workers) can share the jobs directory: a job runs
+    only while its process holds the `flock` on the job's `job.lock`, so a
+    job resumed by more than one process still runs once, and cancelling
+    leaves a `cancel` file the running process picks up.
+    """
+
+    finished_statuses = ("completed", "failed", "cancelled")
+
+    def __init__(self, directory: str, runners: dict, workers: int = 1):
+        self.directory = directory
+        self.runners = runners
+        self.workers = max(1, workers)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._cancel_events = {}
+        self._resumed = set()
+        self._threads = []
+
+    def submit(self, job_type: str, payload: dict) -> dict:
+        if job_type not in self.runners:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(self._job_path(job_id), exist_ok=True)
+        job = {
+            "id": job_id,
+            "type": job_type,
+            "status": "queued",
+            "created": datetime.now().isoformat(timespec='seconds'),
+            "updated": datetime.now().isoformat(timespec='seconds'),
+            "payload": payload,
+        }
+        self._save(job)
+        self._enqueue(job_id)
+        return self._summary(job)
+
+    def resume_interrupted(self) -> None:
+        for job in sorted(self._load_all(), key=lambda job: job["created"]):
+            if job["status"] in ("queued", "running"):
+                with self._lock:
+                    self._resumed.add(job["id"])
+                self._enqueue(job["id"])
+
+    def cancel(self, job_id: str) -> dict:
+        job = self.get(job_id)
+        if job is None or job["status"] in self.finished_statuses:
+            return job
+        with self._lock:
+            self._cancel_events.setdefault(job_id, threading.Event()).set()
+        # The job may be running in another process
+        open(self._cancel_path(job_id), 'a').close()
+        if job["status"] == "queued":
+            job = self._update(job_id, status="cancelled")
+        return job
+
+    def get(self, job_id: str):
+        try:
+            return self._summary(self._load(job_id))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def list(self) -> list:
+        return [self._summary(job) for job in sorted(self._load_all(), key=lambda job: job["created"], reverse=True)]
+
+    def read_log(self, job_id: str, tail: int = None) -> str:
+        return self._read(self._log_path(job_id), tail)
+
+    def read_events(self, job_id: str, tail: int = None) -> str:
+        return self._read(self._events_path(job_id), tail)
+
+    def follow_log(self, job_id: str, tail: int = None, poll_interval: float = 0.5):
+        # Yields the log (or its last `tail` lines), then new output until the job finishes
+        return self._follow(job_id, self._log_path(job_id), tail, poll_interval)
+
+    def follow_events(self, job_id: str, tail: int = None, poll_interval: float = 0.5):
+        return self._follow(job_id, self._events_path(job_id), tail, poll_interval)
+
+    @staticmethod
+    def _read(path: str, tail: int = None) -> str:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                if tail is None:
+                    return f.read()
+                return "".join(deque(f, maxlen=tail))
+        except FileNotFoundError:
+            return ""
+
+    def _follow(self, job_id: str, log_path: str, tail: int, poll_interval: float):
+        yield self._read(log_path, tail)
+        position = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        while True:
+            job = self.get(job_id)
+            if os.path.exists(log_path):
+                with open(log_path, 'r', encoding='utf-8') as f:
+                    f.seek(position)
+                    chunk = f.read()
+                    position = f.tell()
+                if chunk:
+                    yield chunk
+                    continue
+            if job is None or job["status"] in self.finished_statuses:
+                return
+            time.sleep(poll_interval)
+
+    def _enqueue(self, job_id: str) -> None:
+        self._queue.put(job_id)
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run_jobs, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run_jobs(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception:
+                self._append_log(job_id, traceback.format_exc())
+                self._update(job_id, status="failed")
+
+    def _run(self, job_id: str) -> None:
+        with open(os.path.join(self._job_path(job_id), "job.lock"), 'a') as job_lock:
+            try:
+                fcntl.flock(job_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # Another process is running it
+            self._run_locked(job_id)
+
+    def _run_locked(self, job_id: str) -> None:
+        job = self._load(job_id)
+        if job["status"] in self.finished_statuses:
+            return
+        with self._lock:
+            cancel_event = self._cancel_events.setdefault(job_id, threading.Event())
+            resumed = job_id in self._resumed
+            self._resumed.discard(job_id)
+        # Logged by the process that won the job's lock, not by every web
+        # worker that found it interrupted
+        if resumed:
+            self._append_log(job_id, "Resuming job after restart.\n")
+        cancel_path = self._cancel_path(job_id)
+
+        self._update(job_id, status="running")
+        checkpoint = JobCheckpoint(os.path.join(self._job_path(job_id), "checkpoint.txt"))
+        if len(checkpoint):
+            self._append_log(job_id, f"Checkpoint found: {len(checkpoint)} files already completed.\n")
+
+        stream = self.runners[job["type"]](job["payload"], checkpoint)
+        end_status = None
+        cancelled = False
+        try:
+            with open(self._log_path(job_id), 'a', encoding='utf-8') as log, \
+                    open(self._events_path(job_id), 'a', encoding='utf-8') as events:
+
+                def logged_lines():
+                    # The full text goes to log.txt as the events are produced from it
+                    nonlocal end_status, cancelled
+                    for line in stream:
+                        log.write(line)
+                        log.flush()
+                        if getattr(line, "event", None) == "end":
+                            end_status = line.fields["status"]
+                        yield line
+                        if cancel_event.is_set() or os.path.exists(cancel_path):
+                            log.write("Job cancelled.\n")
+                            cancelled = True
+                            yield Event("Job cancelled.\n", "cancelled")
+                            return
+
+                for event in ndjson_events(logged_lines(), log_url=f"/jobs/{job_id}/log?download=true"):
+                    events.write(event)
+                    events.flush()
+        finally:
+            stream.close()
+
+        if cancelled:
+            self._update(job_id, status="cancelled")
+            return
+        # A run reports how it ended (progress.end_event); one that stopped
+        # without saying so didn't complete
+        self._update(job_id, status=end_status or "failed")
+
+    def _job_path(self, job_id: str) -> str:
+        if not job_id or os.sep in job_id or job_id.startswith("."):
+            raise ValueError(f"Invalid job id: {job_id}")
+        return os.path.join(self.directory, job_id)
+
+    def _log_path(self, job_id: str) -> str:
+        return os.path.join(self._job_path(job_id), "log.txt")
+
+    def _events_path(self, job_id: str) -> str:
+        return os.path.join(self._job_path(job_id), "events.ndjson")
+
+    def _cancel_path(self, job_id: str) -> str:
+        return os.path.join(self._job_path(job_id), "cancel")
+
+    def _append_log(self, job_id: str, text: str) -> None:
+        with open(self._log_path(job_id), 'a', encoding='utf-8') as log:
+            log.write(text)
+
+    def _load(self, job_id: str) -> dict:
+        with open(os.path.join(self._job_path(job_id), "job.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load_all(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                try:
+                    jobs.append(self._load(entry.name))
+                except (FileNotFoundError, ValueError):
+                    continue
+        return jobs
+
+    def _save(self, job: dict) -> None:
+        # Write then rename so a crash never leaves a half-written job file
+        job_file = os.path.join(self._job_path(job["id"]), "job.json")
+        with open(f"{job_file}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(job, f, indent=2)
+        os.replace(f"{job_file}.tmp", job_file)
+
+    def _update(self, job_id: str, **changes) -> dict:
+        with self._lock:
+            job = self._load(job_id)
+            job.update(changes)
+            job["updated"] = datetime.now().isoformat(timespec='seconds')
+            self._save(job)
+        return self._summary(job)
+
+    @staticmethod
+    def _summary(job: dict) -> dict:
+        return {
+            "id": job["id"],
+            "type": job["type"],
+            "status": job["status"],
+            "created": job["created"],
+            "updated": job["updated"],
+            "directory": job["payload"].get("selected_media_directory"),
+        }
@@ -0,0 +1,807 @@
+import hashlib
+import os
+import shutil
+import struct
+import xml.etree.ElementTree as ET
+
+# Segment markers
+SOI = b"\xff\xd8"
+APP0, APP1, APP2, APP13, SOS = 0xE0, 0xE1, 0xE2, 0xED, 0xDA
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+EXIF_HEADER = b"Exif\x00\x00"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+PHOTOSHOP_HEADER = b"Photoshop 3.0\x00"
+MPF_HEADER = b"MPF\x00"
+MAX_SEGMENT_PAYLOAD = 65533
+TEMPORARY_SUFFIX = ".native_tmp"
+
+# TIFF field types: size in bytes per value
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+BYTE, ASCII, SHORT, LONG, RATIONAL = 1, 2, 3, 4, 5
+
+# IFD0 / ExifIFD / GPS tag ids
+IMAGE_DESCRIPTION, SOFTWARE, MODIFY_DATE, ARTIST, COPYRIGHT = 0x010E, 0x0131, 0x0132, 0x013B, 0x8298
+RATING, RATING_PERCENT = 0x4746, 0x4749
+XP_COMMENT, XP_AUTHOR = 0x9C9C, 0x9C9D
+EXIF_IFD_POINTER, GPS_IFD_POINTER, INTEROP_IFD_POINTER = 0x8769, 0x8825, 0xA005
+SUB_IFDS, MAKER_NOTE = 0x014A, 0x927C
+THUMBNAIL_OFFSET, THUMBNAIL_LENGTH = 0x0201, 0x0202
+DATE_TIME_ORIGINAL, CREATE_DATE = 0x9003, 0x9004
+OFFSET_TIME, OFFSET_TIME_ORIGINAL, OFFSET_TIME_DIGITIZED = 0x9010, 0x9011, 0x9012
+GPS_VERSION_ID, GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 0x0000, 0x0001, 0x0002, 0x0003, 0x0004
+GPS_ALTITUDE_REF, GPS_ALTITUDE = 0x0005, 0x0006
+GPS_SPEED_REF, GPS_SPEED, GPS_IMG_DIRECTION_REF, GPS_IMG_DIRECTION, GPS_MAP_DATUM = 0x000C, 0x000D, 0x0010, 0x0011, 0x0012
+
+# IPTC IIM datasets (record, dataset) and their maximum lengths in bytes
+IPTC_CODED_CHARACTER_SET = (1, 90)
+IPTC_RECORD_VERSION = (2, 0)
+IPTC_OBJECT_NAME, IPTC_KEYWORDS = (2, 5), (2, 25)
+IPTC_DATE_CREATED, IPTC_TIME_CREATED = (2, 55), (2, 60)
+IPTC_DIGITAL_CREATION_DATE, IPTC_DIGITAL_CREATION_TIME = (2, 62), (2, 63)
+IPTC_BY_LINE, IPTC_CITY, IPTC_PROVINCE_STATE = (2, 80), (2, 90), (2, 95)
+IPTC_COUNTRY_CODE, IPTC_COUNTRY_NAME = (2, 100), (2, 101)
+IPTC_COPYRIGHT_NOTICE, IPTC_CAPTION = (2, 116), (2, 120)
+IPTC_MAX_LENGTHS = {
+    IPTC_OBJECT_NAME: 64, IPTC_KEYWORDS: 64, IPTC_CITY: 32,
+    IPTC_PROVINCE_STATE: 32, IPTC_COUNTRY_CODE: 3, IPTC_COUNTRY_NAME: 64,
+}
+IPTC_UTF8 = b"\x1b%G"
+PHOTOSHOP_IPTC, PHOTOSHOP_IPTC_DIGEST = 0x0404, 0x0425
+
+XMP_NAMESPACES = {
+    "x": "adobe:ns:meta/",
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "xmp": "http://ns.adobe.com/xap/1.0/",
+    "xmpMM": "http://ns.adobe.com/xap/1.0/mm/",
+    "xmpRights": "http://ns.adobe.com/xap/1.0/rights/",
+    "pdf": "http://ns.adobe.com/pdf/1.3/",
+    "photoshop": "http://ns.adobe.com/photoshop/1.0/",
+    "crs": "http://ns.adobe.com/camera-raw-settings/1.0/",
+    "lr": "http://ns.adobe.com/lightroom/1.0/",
+    "exif": "http://ns.adobe.com/exif/1.0/",
+    "tiff": "http://ns.adobe.com/tiff/1.0/",
+    "MicrosoftPhoto": "http://ns.microsoft.com/photo/1.0/",
+    "Iptc4xmpCore": "http://iptc.org/std/Iptc4xmpCore/1.0/xmlns/",
+    "Iptc4xmpExt": "http://iptc.org/std/Iptc4xmpExt/2008-02-29/",
+}
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+XMP_PADDING = 2048
+
+for prefix, uri in XMP_NAMESPACES.items():
+    ET.register_namespace(prefix, uri)
+
+
+class JpegMetadataError(ValueError):
+    pass
+
+
+def xmp_name(qualified: str) -> str:
+    prefix, name = qualified.split(":")
+    return f"{{{XMP_NAMESPACES[prefix]}}}{name}"
+
+
+def write_jpeg_metadata(file_path: str, fields: dict) -> int:
+    # Rewrites the EXIF, XMP and IPTC segments of a JPEG with the same values the
+    # ExifTool command in process_file writes, copying the image data through
+    # untouched. Returns the number of metadata bytes written.
+    #
+    # `fields` holds: date ("YYYY:MM:DD HH:MM:SS", UTC), title, author,
+    # copyright, raw_file_name, hierarchical_subject, subject, keywords (lists)
+    # and geotag (None, or a dict with latitude, longitude, city, state,
+    # country, country_code and location_name; latitude and longitude are
+    # None when only the location names are written).
+    # Raises JpegMetadataError for files it cannot safely rewrite.
+    with open(file_path, "rb") as source:
+        segments, scan_offset = read_segments(source)
+
+        exif_index = find_segment(segments, APP1, EXIF_HEADER)
+        xmp_index = find_segment(segments, APP1, XMP_HEADER)
+        photoshop_index = find_segment(segments, APP13, PHOTOSHOP_HEADER)
+        if sum(1 for marker, payload in segments if marker == APP13 and payload.startswith(PHOTOSHOP_HEADER)) > 1:
+            raise JpegMetadataError("Photoshop data is split over several APP13 segments")
+
+        exif = segments[exif_index][1][len(EXIF_HEADER):] if exif_index is not None else None
+        xmp = segments[xmp_index][1][len(XMP_HEADER):] if xmp_index is not None else None
+        photoshop = segments[photoshop_index][1][len(PHOTOSHOP_HEADER):] if photoshop_index is not None else None
+
+        new_segments = {
+            "exif": (APP1, EXIF_HEADER + build_exif(exif, fields)),
+            "xmp": (APP1, XMP_HEADER + build_xmp(xmp, fields)),
+            "photoshop": (APP13, PHOTOSHOP_HEADER + build_photoshop(photoshop, fields)),
+        }
+        for name, (marker, payload) in new_segments.items():
+            if len(payload) > MAX_SEGMENT_PAYLOAD:
+                raise JpegMetadataError(f"{name.upper()} data does not fit in one JPEG segment")
+
+        output = place_segments(segments, exif_index, xmp_index, photoshop_index, new_segments)
+        check_mpf_offsets(segments, output)
+
+        temporary_path = temporary_file_path(file_path)
+        try:
+            with open(temporary_path, "wb") as target:
+                target.write(SOI)
+                for marker, payload in output:
+                    target.write(struct.pack(">BBH", 0xFF, marker, len(payload) + 2) if marker not in STANDALONE_MARKERS
+                                 else struct.pack(">BB", 0xFF, marker))
+                    target.write(payload)
+                source.seek(scan_offset)
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            shutil.copymode(file_path, temporary_path)
+            os.replace(temporary_path, file_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    return sum(len(payload) + 4 for marker, payload in new_segments.values())
+
+
+def temporary_file_path(file_path: str) -> str:
+    # Where a rewritten copy is built before it replaces `file_path`: next to
+    # it (so os.replace stays on one filesystem), hidden, and ending in
+    # TEMPORARY_SUFFIX so file discovery skips it
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}{TEMPORARY_SUFFIX}")
+
+
+def read_jpeg_metadata(file_path: str) -> dict:
+    # Reads back the fields the writer manages, named and formatted like
+    # `exiftool -s -n` output (lists are joined with ", ")
+    with open(file_path, "rb") as source:
+        segments, scan_offset = read_segments(source)
+
+    # Later updates win, giving EXIF priority over IPTC over XMP like ExifTool
+    metadata = {}
+    xmp_index = find_segment(segments, APP1, XMP_HEADER)
+    if xmp_index is not None:
+        metadata.update(read_xmp(segments[xmp_index][1][len(XMP_HEADER):]))
+    photoshop_index = find_segment(segments, APP13, PHOTOSHOP_HEADER)
+    if photoshop_index is not None:
+        metadata.update(read_iptc(segments[photoshop_index][1][len(PHOTOSHOP_HEADER):]))
+    exif_index = find_segment(segments, APP1, EXIF_HEADER)
+    if exif_index is not None:
+        metadata.update(read_exif(segments[exif_index][1][len(EXIF_HEADER):]))
+    return metadata
+
+
+def read_segments(source):
+    # Returns ([(marker, payload)] for every segment before the scan, offset of SOS)
+    if source.read(2) != SOI:
+        raise JpegMetadataError("Not a JPEG file")
+    segments = []
+    while True:
+        byte = source.read(1)
+        if byte != b"\xff":
+            raise JpegMetadataError("Corrupt JPEG segment structure")
+        marker = source.read(1)
+        while marker == b"\xff":
+            marker = source.read(1)
+        if not marker:
+            raise JpegMetadataError("JPEG ends before the image data")
+        marker = marker[0]
+        if marker == SOS:
+            return segments, source.tell() - 2
+        if marker in STANDALONE_MARKERS:
+            segments.append((marker, b""))
+            continue
+        length_bytes = source.read(2)
+        if len(length_bytes) != 2:
+            raise JpegMetadataError("JPEG ends before the image data")
+        length = struct.unpack(">H", length_bytes)[0]
+        payload = source.read(length - 2)
+        if len(payload) != length - 2:
+            raise JpegMetadataError("Truncated JPEG segment")
+        segments.append((marker, payload))
+
+
+def find_segment(segments, marker, header):
+    for index, (segment_marker, payload) in enumerate(segments):
+        if segment_marker == marker and payload.startswith(header):
+            return index
+    return None
+
+
+def place_segments(segments, exif_index, xmp_index, photoshop_index, new_segments):
+    # Replaces existing segments in place; new ones go after JFIF/EXIF, in the
+    # EXIF, XMP, Photoshop order ExifTool uses
+    replacements = {exif_index: "exif", xmp_index: "xmp", photoshop_index: "photoshop"}
+    output = []
+    for index, segment in enumerate(segments):
+        name = replacements.get(index)
+        output.append(new_segments[name] if name else segment)
+
+    insert_at = 1 if segments and segments[0][0] == APP0 else 0
+    for name, index in (("exif", exif_index), ("xmp", xmp_index), ("photoshop", photoshop_index)):
+        if index is None:
+            output.insert(insert_at, new_segments[name])
+        else:
+            insert_at = next(i for i, segment in enumerate(output) if segment is new_segments[name])
+        insert_at += 1
+    return output
+
+
+def check_mpf_offsets(old_segments, new_segments):
+    # MPF (multi-picture) offsets are relative to the APP2 segment, so they stay
+    # valid only if every size change happens before it
+    old_mpf = find_segment(old_segments, APP2, MPF_HEADER)
+    if old_mpf is None:
+        return
+    new_mpf = find_segment(new_segments, APP2, MPF_HEADER)
+    old_after = [len(payload) for marker, payload in old_segments[old_mpf + 1:]]
+    new_after = [len(payload) for marker, payload in new_segments[new_mpf + 1:]]
+    if old_after != new_after:
+        raise JpegMetadataError("Metadata after the MPF segment would move embedded images")
+
+
+# EXIF
+
+def build_exif(block, fields):
+    # Existing EXIF data is kept byte for byte (maker notes hold absolute offsets)
+    # and the IFDs that change are appended after it with pointers updated
+    if block is None or len(block) < 8:
+        block = b"MM\x00\x2a\x00\x00\x00\x08" + struct.pack(">HI", 0, 0)
+    byte_order = {b"II": "<", b"MM": ">"}.get(block[:2])
+    if byte_order is None:
+        raise JpegMetadataError("Unknown EXIF byte order")
+
+    ifd0_offset = struct.unpack(byte_order + "I", block[4:8])[0]
+    ifd0, next_ifd = read_ifd_entries(block, ifd0_offset, byte_order)
+    exif_ifd = gps_ifd = {}
+    if EXIF_IFD_POINTER in ifd0:
+        exif_ifd = read_ifd_entries(block, entry_pointer(ifd0[EXIF_IFD_POINTER], byte_order), byte_order)[0]
+    if GPS_IFD_POINTER in ifd0:
+        gps_ifd = read_ifd_entries(block, entry_pointer(ifd0[GPS_IFD_POINTER], byte_order), byte_order)[0]
+
+    date = fields["date"]
+    set_ascii(ifd0, IMAGE_DESCRIPTION, fields["title"], byte_order)
+    set_ascii(ifd0, ARTIST, fields["author"], byte_order)
+    set_ascii(ifd0, COPYRIGHT, fields["copyright"], byte_order)
+    set_ascii(ifd0, MODIFY_DATE, date, byte_order)
+    set_entry(ifd0, XP_AUTHOR, BYTE, list((fields["author"] + "\x00").encode("utf-16-le")), byte_order)
+    for tag in (XP_COMMENT, RATING, RATING_PERCENT, SOFTWARE):
+        ifd0.pop(tag, None)
+
+    exif_ifd = dict(exif_ifd)
+    set_ascii(exif_ifd, DATE_TIME_ORIGINAL, date, byte_order)
+    set_ascii(exif_ifd, CREATE_DATE, date, byte_order)
+    for tag in (OFFSET_TIME, OFFSET_TIME_ORIGINAL, OFFSET_TIME_DIGITIZED):
+        set_ascii(exif_ifd, tag, "+00:00", byte_order)
+
+    gps_ifd = dict(gps_ifd)
+    geotag = fields.get("geotag")
+    if geotag and geotag["latitude"] is not None:
+        set_entry(gps_ifd, GPS_VERSION_ID, BYTE, [2, 3, 0, 0], byte_order)
+        set_ascii(gps_ifd, GPS_LATITUDE_REF, "N" if geotag["latitude"] >= 0 else "S", byte_order)
+        set_entry(gps_ifd, GPS_LATITUDE, RATIONAL, degrees_to_rationals(geotag["latitude"]), byte_order)
+        set_ascii(gps_ifd, GPS_LONGITUDE_REF, "E" if geotag["longitude"] >= 0 else "W", byte_order)
+        set_entry(gps_ifd, GPS_LONGITUDE, RATIONAL, degrees_to_rationals(geotag["longitude"]), byte_order)
+        set_entry(gps_ifd, GPS_ALTITUDE_REF, BYTE, [0], byte_order)
+        set_entry(gps_ifd, GPS_ALTITUDE, RATIONAL, [(0, 1)], byte_order)
+        for tag in (GPS_MAP_DATUM, GPS_IMG_DIRECTION, GPS_IMG_DIRECTION_REF, GPS_SPEED, GPS_SPEED_REF):
+            gps_ifd.pop(tag, None)
+
+    if MAKER_NOTE in exif_ifd or SUB_IFDS in ifd0:
+        # Appending keeps every original offset valid
+        output = bytearray(block)
+    else:
+        # Nothing depends on absolute offsets, so the block is rebuilt from
+        # scratch instead of growing with every run
+        output = bytearray(block[:4] + b"\x00\x00\x00\x00")
+        for entries in (ifd0, exif_ifd, gps_ifd):
+            materialize_entries(block, entries, byte_order)
+        if INTEROP_IFD_POINTER in exif_ifd:
+            interop_ifd = read_ifd_entries(block, entry_pointer(exif_ifd[INTEROP_IFD_POINTER], byte_order), byte_order)[0]
+            materialize_entries(block, interop_ifd, byte_order)
+            set_entry(exif_ifd, INTEROP_IFD_POINTER, LONG, [append_ifd(output, interop_ifd, 0, byte_order)], byte_order)
+        if next_ifd:
+            next_ifd = append_thumbnail_ifd(output, block, next_ifd, byte_order)
+
+    if GPS_IFD_POINTER in ifd0 or gps_ifd:
+        set_entry(ifd0, GPS_IFD_POINTER, LONG, [append_ifd(output, gps_ifd, 0, byte_order)], byte_order)
+    set_entry(ifd0, EXIF_IFD_POINTER, LONG, [append_ifd(output, exif_ifd, 0, byte_order)], byte_order)
+    new_ifd0_offset = append_ifd(output, ifd0, next_ifd, byte_order)
+    output[4:8] = struct.pack(byte_order + "I", new_ifd0_offset)
+    return bytes(output)
+
+
+def materialize_entries(block, entries, byte_order):
+    # Copies out-of-line values into the entries so they survive a rebuilt block
+    for tag, entry in entries.items():
+        if entry[3] is None and tag not in (EXIF_IFD_POINTER, GPS_IFD_POINTER, INTEROP_IFD_POINTER):
+            entries[tag] = (entry[0], entry[1], None, entry_bytes(block, entry, byte_order))
+
+
+def append_thumbnail_ifd(output, block, offset, byte_order):
+    # Copies IFD1 and its embedded thumbnail into a rebuilt block
+    ifd1 = read_ifd_entries(block, offset, byte_order)[0]
+    materialize_entries(block, ifd1, byte_order)
+    if THUMBNAIL_OFFSET in ifd1 and THUMBNAIL_LENGTH in ifd1:
+        thumbnail_offset = struct.unpack(byte_order + "I", ifd1[THUMBNAIL_OFFSET][3])[0]
+        thumbnail_length = struct.unpack(byte_order + "I", ifd1[THUMBNAIL_LENGTH][3][:4].ljust(4, b"\x00"))[0] \
+            if ifd1[THUMBNAIL_LENGTH][0] == LONG else struct.unpack(byte_order + "H", ifd1[THUMBNAIL_LENGTH][3][:2])[0]
+        thumbnail = block[thumbnail_offset:thumbnail_offset + thumbnail_length]
+        if len(output) % 2:
+            output.append(0)
+        set_entry(ifd1, THUMBNAIL_OFFSET, LONG, [len(output)], byte_order)
+        output += thumbnail
+    return append_ifd(output, ifd1, 0, byte_order)
+
+
+def read_ifd_entries(block, offset, byte_order):
+    # Returns ({tag: entry}, next IFD offset). An entry is (type, count, raw
+    # 4-byte value field, out-of-line data or None); unchanged entries keep their
+    # original value field so they still point at the original data
+    if offset + 2 > len(block):
+        raise JpegMetadataError("EXIF IFD offset out of range")
+    count = struct.unpack(byte_order + "H", block[offset:offset + 2])[0]
+    end = offset + 2 + count * 12
+    if end + 4 > len(block):
+        raise JpegMetadataError("EXIF IFD runs past the end of the segment")
+    entries = {}
+    for position in range(offset + 2, end, 12):
+        tag, field_type, value_count = struct.unpack(byte_order + "HHI", block[position:position + 8])
+        entries[tag] = (field_type, value_count, block[position + 8:position + 12], None)
+    next_ifd = struct.unpack(byte_order + "I", block[end:end + 4])[0]
+    return entries, next_ifd
+
+
+def entry_pointer(entry, byte_order):
+    return struct.unpack(byte_order + "I", entry[2])[0]
+
+
+def entry_bytes(block, entry, byte_order):
+    field_type, count, value_field, data = entry
+    if data is not None:
+        return data
+    size = TIFF_TYPE_SIZES.get(field_type, 1) * count
+    if size <= 4:
+        return value_field[:size]
+    offset = struct.unpack(byte_order + "I", value_field)[0]
+    return block[offset:offset + size]
+
+
+def set_ascii(entries, tag, value, byte_order):
+    # Empty values delete the tag, like ExifTool's "-TAG="
+    if not value:
+        entries.pop(tag, None)
+        return
+    data = value.encode("utf-8") + b"\x00"
+    entries[tag] = (ASCII, len(data), None, data)
+
+
+def set_entry(entries, tag, field_type, values, byte_order):
+    if field_type == RATIONAL:
+        data = b"".join(struct.pack(byte_order + "II", numerator, denominator) for numerator, denominator in values)
+    else:
+        data = struct.pack(byte_order + {BYTE: "B", SHORT: "H", LONG: "I"}[field_type] * len(values), *values)
+    entries[tag] = (field_type, len(values), None, data)
+
+
+def append_ifd(output, entries, next_ifd, byte_order):
+    # Appends an IFD (and the data of changed entries) to the block, returning its offset
+    if len(output) % 2:
+        output.append(0)
+    offset = len(output)
+    data_offset = offset + 2 + len(entries) * 12 + 4
+    table = bytearray(struct.pack(byte_order + "H", len(entries)))
+    data_area = bytearray()
+    for tag in sorted(entries):
+        field_type, count, value_field, data = entries[tag]
+        if data is None:
+            table += struct.pack(byte_order + "HHI", tag, field_type, count) + value_field
+        elif len(data) <= 4:
+            table += struct.pack(byte_order + "HHI", tag, field_type, count) + data.ljust(4, b"\x00")
+        else:
+            table += struct.pack(byte_order + "HHII", tag, field_type, count, data_offset + len(data_area))
+            data_area += data
+            if len(data_area) % 2:
+                data_area.append(0)
+    table += struct.pack(byte_order + "I", next_ifd)
+    output += table + data_area
+    return offset
+
+
+def degrees_to_rationals(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = (value - degrees - minutes / 60) * 3600
+    return [(degrees, 1), (minutes, 1), (round(seconds * 100000), 100000)]
+
+
+def rationals_to_degrees(data, byte_order):
+    values = struct.unpack(byte_order + "6I", data[:24])
+    degrees, minutes, seconds = (values[i] / values[i + 1] if values[i + 1] else 0 for i in (0, 2, 4))
+    return degrees + minutes / 60 + seconds / 3600
+
+
+def read_exif(block):
+    byte_order = {b"II": "<", b"MM": ">"}.get(block[:2])
+    if byte_order is None:
+        return {}
+    ifd0 = read_ifd_entries(block, struct.unpack(byte_order + "I", block[4:8])[0], byte_order)[0]
+    exif_ifd = gps_ifd = {}
+    if EXIF_IFD_POINTER in ifd0:
+        exif_ifd = read_ifd_entries(block, entry_pointer(ifd0[EXIF_IFD_POINTER], byte_order), byte_order)[0]
+    if GPS_IFD_POINTER in ifd0:
+        gps_ifd = read_ifd_entries(block, entry_pointer(ifd0[GPS_IFD_POINTER], byte_order), byte_order)[0]
+
+    def text(entries, tag):
+        return entry_bytes(block, entries[tag], byte_order).split(b"\x00")[0].decode("utf-8", "replace")
+
+    metadata = {}
+    for name, entries, tag in (
+        ("ImageDescription", ifd0, IMAGE_DESCRIPTION),
+        ("Artist", ifd0, ARTIST),
+        ("Copyright", ifd0, COPYRIGHT),
+        ("ModifyDate", ifd0, MODIFY_DATE),
+        ("DateTimeOriginal", exif_ifd, DATE_TIME_ORIGINAL),
+        ("CreateDate", exif_ifd, CREATE_DATE),
+    ):
+        if tag in entries:
+            metadata[name] = text(entries, tag)
+    if XP_AUTHOR in ifd0:
+        metadata["XPAuthor"] = entry_bytes(block, ifd0[XP_AUTHOR], byte_order).decode("utf-16-le").rstrip("\x00")
+    for name, tag, ref_tag, negative in (
+        ("GPSLatitude", GPS_LATITUDE, GPS_LATITUDE_REF, "S"),
+        ("GPSLongitude", GPS_LONGITUDE, GPS_LONGITUDE_REF, "W"),
+    ):
+        if tag in gps_ifd:
+            value = rationals_to_degrees(entry_bytes(block, gps_ifd[tag], byte_order), byte_order)
+            if ref_tag in gps_ifd and text(gps_ifd, ref_tag) == negative:
+                value = -value
+            metadata[name] = f"{value:.10g}"
+    return metadata
+
+
+# XMP
+
+def build_xmp(packet, fields):
+    # Edits the existing XMP packet (keeping properties this app does not manage)
+    # or creates a new one
+    root = parse_xmp(packet) if packet else None
+    if root is None:
+        root = ET.Element(xmp_name("x:xmpmeta"))
+        rdf = ET.SubElement(root, xmp_name("rdf:RDF"))
+        ET.SubElement(rdf, xmp_name("rdf:Description"), {xmp_name("rdf:about"): ""})
+    rdf = root if root.tag == xmp_name("rdf:RDF") else root.find(xmp_name("rdf:RDF"))
+    if rdf is None:
+        raise JpegMetadataError("XMP packet has no rdf:RDF element")
+    descriptions = rdf.findall(xmp_name("rdf:Description"))
+    if not descriptions:
+        descriptions = [ET.SubElement(rdf, xmp_name("rdf:Description"), {xmp_name("rdf:about"): ""})]
+    xmp = XmpProperties(descriptions)
+
+    xmp_date = fields["date"].replace(":", "-", 2).replace(" ", "T") + "+00:00"
+    for name in ("xmp:CreateDate", "xmp:ModifyDate", "xmp:MetadataDate", "photoshop:DateCreated",
+                 "exif:DateTimeOriginal", "exif:DateTimeDigitized", "tiff:DateTime"):
+        xmp.update_existing(name, xmp_date)
+
+    xmp.set_alt("dc:title", fields["title"])
+    xmp.set_alt("dc:description", fields["title"])
+    xmp.set_list("dc:creator", "Seq", [fields["author"]])
+    xmp.set_text("pdf:Author", fields["author"])
+    xmp.update_existing("tiff:Artist", fields["author"])
+    xmp.set_text("crs:RawFileName", fields["raw_file_name"])
+    xmp.set_list("lr:hierarchicalSubject", "Bag", fields["hierarchical_subject"])
+    xmp.set_list("dc:subject", "Bag", fields["subject"])
+    for name in ("dc:rights", "xmpRights:UsageTerms", "xmpRights:WebStatement", "xmpRights:Marked",
+                 "xmp:Rating", "MicrosoftPhoto:Rating", "Iptc4xmpCore:CountryCode",
+                 "Iptc4xmpCore:CreatorContactInfo", "photoshop:TextLayers", "xmpMM:DerivedFrom",
+                 "xmpMM:OriginalDocumentID", "xmpMM:DocumentID", "xmpMM:History", "xmpMM:InstanceID"):
+        xmp.remove(name)
+
+    geotag = fields.get("geotag")
+    if geotag:
+        location_shown = {
+            "Iptc4xmpExt:City": geotag["city"],
+            "Iptc4xmpExt:ProvinceState": geotag["state"],
+            "Iptc4xmpExt:CountryCode": geotag["country_code"],
+            "Iptc4xmpExt:CountryName": geotag["country"],
+        }
+        if geotag["latitude"] is not None:
+            latitude = xmp_coordinate(geotag["latitude"], "N", "S")
+            longitude = xmp_coordinate(geotag["longitude"], "E", "W")
+            xmp.set_text("exif:GPSLatitude", latitude)
+            xmp.set_text("exif:GPSLongitude", longitude)
+            xmp.set_text("exif:GPSAltitude", "0/1")
+            xmp.set_text("exif:GPSAltitudeRef", "0")
+            for name in ("exif:GPSMapDatum", "exif:GPSImgDirection", "exif:GPSImgDirectionRef",
+                         "exif:GPSSpeed", "exif:GPSSpeedRef"):
+                xmp.remove(name)
+            location_shown.update({
+                "exif:GPSLatitude": latitude,
+                "exif:GPSLongitude": longitude,
+                "exif:GPSAltitude": "0/1",
+                "exif:GPSAltitudeRef": "0",
+            })
+        location_shown["Iptc4xmpExt:LocationName"] = {"x-default": geotag["location_name"]}
+        xmp.set_text("photoshop:City", geotag["city"])
+        xmp.set_text("photoshop:State", geotag["state"])
+        xmp.set_text("photoshop:Country", geotag["country"])
+        xmp.set_text("Iptc4xmpCore:CountryCode", geotag["country_code"])
+        xmp.set_struct_list("Iptc4xmpExt:LocationShown", [location_shown])
+
+    if root.tag != xmp_name("x:xmpmeta"):
+        wrapper = ET.Element(xmp_name("x:xmpmeta"))
+        wrapper.append(root)
+        root = wrapper
+    body = ET.tostring(root, encoding="utf-8", short_empty_elements=True)
+    padding = b"\n".join([b" " * 99] * (XMP_PADDING // 100))
+    return (
+        b'<?xpacket begin="\xef\xbb\xbf" id="W5M0MpCehiHzreSzNTczkc9d"?>\n' + body
+        + b"\n" + padding + b'\n<?xpacket end="w"?>'
+    )
+
+
+def parse_xmp(packet):
+    try:
+        # Keep the packet's own prefixes when it is serialised again
+        for event, (prefix, uri) in ET.iterparse(_BytesReader(packet), events=("start-ns",)):
+            if prefix and prefix not in XMP_NAMESPACES and uri not in XMP_NAMESPACES.values():
+                try:
+                    ET.register_namespace(prefix, uri)
+                except ValueError:
+                    continue
+        return ET.fromstring(packet)
+    except ET.ParseError as e:
+        raise JpegMetadataError(f"Unreadable XMP packet: {e}")
+
+
+class _BytesReader:
+    # Minimal file object for ET.iterparse over an in-memory packet
+    def __init__(self, data: bytes):
+        self.data, self.position = data, 0
+
+    def read(self, size=-1):
+        end = len(self.data) if size < 0 else self.position + size
+        chunk = self.data[self.position:end]
+        self.position = min(end, len(self.data))
+        return chunk
+
+
+class XmpProperties:
+    """Reads and edits top-level properties spread over rdf:Description elements."""
+
+    def __init__(self, descriptions):
+        self.descriptions = descriptions
+
+    def remove(self, name):
+        qualified = xmp_name(name)
+        for description in self.descriptions:
+            description.attrib.pop(qualified, None)
+            for child in description.findall(qualified):
+                description.remove(child)
+
+    def exists(self, name):
+        qualified = xmp_name(name)
+        return any(qualified in d.attrib or d.find(qualified) is not None for d in self.descriptions)
+
+    def _replace(self, name):
+        self.remove(name)
+        return ET.SubElement(self.descriptions[0], xmp_name(name))
+
+    def set_text(self, name, value):
+        if not value:
+            self.remove(name)
+            return
+        self._replace(name).text = value
+
+    def update_existing(self, name, value):
+        if self.exists(name):
+            self.set_text(name, value)
+
+    def set_alt(self, name, value):
+        if not value:
+            self.remove(name)
+            return
+        alt = ET.SubElement(self._replace(name), xmp_name("rdf:Alt"))
+        ET.SubElement(alt, xmp_name("rdf:li"), {XML_LANG: "x-default"}).text = value
+
+    def set_list(self, name, list_type, values):
+        if not values:
+            self.remove(name)
+            return
+        container = ET.SubElement(self._replace(name), xmp_name(f"rdf:{list_type}"))
+        for value in values:
+            ET.SubElement(container, xmp_name("rdf:li")).text = value
+
+    def set_struct_list(self, name, structs):
+        bag = ET.SubElement(self._replace(name), xmp_name("rdf:Bag"))
+        for struct_fields in structs:
+            item = ET.SubElement(bag, xmp_name("rdf:li"), {xmp_name("rdf:parseType"): "Resource"})
+            for field, value in struct_fields.items():
+                element = ET.SubElement(item, xmp_name(field))
+                if isinstance(value, dict):
+                    alt = ET.SubElement(element, xmp_name("rdf:Alt"))
+                    for language, text in value.items():
+                        ET.SubElement(alt, xmp_name("rdf:li"), {XML_LANG: language}).text = text
+                else:
+                    element.text = value
+
+    def get(self, name):
+        # Simple values as text, Alt as the x-default value, Seq/Bag as a list
+        qualified = xmp_name(name)
+        for description in self.descriptions:
+            if qualified in description.attrib:
+                return description.attrib[qualified]
+            element = description.find(qualified)
+            if element is None:
+                continue
+            container = next(iter(element), None)
+            if container is None:
+                return element.text or ""
+            items = container.findall(xmp_name("rdf:li"))
+            if container.tag == xmp_name("rdf:Alt"):
+                preferred = [li for li in items if li.get(XML_LANG) == "x-default"] or items
+                return (preferred[0].text or "") if preferred else ""
+            return [li.text or "" for li in items]
+        return None
+
+
+def xmp_coordinate(value, positive, negative):
+    # XMP stores GPS as "DDD,MM.mmmmmmmmR"
+    degrees = int(abs(value))
+    minutes = (abs(value) - degrees) * 60
+    return f"{degrees},{minutes:.8f}{positive if value >= 0 else negative}"
+
+
+def xmp_coordinate_to_degrees(value):
+    degrees, minutes = value[:-1].split(",", 1)
+    result = int(degrees) + float(minutes) / 60
+    return -result if value[-1] in "SW" else result
+
+
+def read_xmp(packet):
+    try:
+        root = ET.fromstring(packet)
+    except ET.ParseError:
+        return {}
+    xmp = XmpProperties(list(root.iter(xmp_name("rdf:Description"))))
+    metadata = {}
+    for name, qualified in (
+        ("Title", "dc:title"), ("Description", "dc:description"), ("Creator", "dc:creator"),
+        ("Author", "pdf:Author"), ("RawFileName", "crs:RawFileName"),
+        ("HierarchicalSubject", "lr:hierarchicalSubject"), ("Subject", "dc:subject"),
+        ("City", "photoshop:City"), ("State", "photoshop:State"), ("Country", "photoshop:Country"),
+        ("CountryCode", "Iptc4xmpCore:CountryCode"),
+    ):
+        value = xmp.get(qualified)
+        if value is not None:
+            metadata[name] = ", ".join(value) if isinstance(value, list) else value
+    for name, qualified in (("GPSLatitude", "exif:GPSLatitude"), ("GPSLongitude", "exif:GPSLongitude")):
+        value = xmp.get(qualified)
+        if value:
+            try:
+                metadata[name] = f"{xmp_coordinate_to_degrees(value):.10g}"
+            except ValueError:
+                pass
+    return metadata
+
+
+# IPTC (inside the Photoshop APP13 segment)
+
+def build_photoshop(data, fields):
+    resources = read_photoshop_resources(data) if data else []
+    iptc = next((resource_data for resource_id, name, resource_data in resources if resource_id == PHOTOSHOP_IPTC), b"")
+    iptc = build_iptc(iptc, fields)
+    digest = hashlib.md5(iptc).digest()
+
+    output = []
+    has_digest = has_iptc = False
+    for resource_id, name, resource_data in resources:
+        if resource_id == PHOTOSHOP_IPTC:
+            resource_data, has_iptc = iptc, True
+        elif resource_id == PHOTOSHOP_IPTC_DIGEST:
+            resource_data, has_digest = digest, True
+        output.append((resource_id, name, resource_data))
+    if not has_iptc:
+        output.append((PHOTOSHOP_IPTC, b"", iptc))
+    if not has_digest:
+        output.append((PHOTOSHOP_IPTC_DIGEST, b"", digest))
+
+    result = bytearray()
+    for resource_id, name, resource_data in output:
+        pascal_name = bytes([len(name)]) + name
+        if len(pascal_name) % 2:
+            pascal_name += b"\x00"
+        result += b"8BIM" + struct.pack(">H", resource_id) + pascal_name + struct.pack(">I", len(resource_data))
+        result += resource_data + (b"\x00" if len(resource_data) % 2 else b"")
+    return bytes(result)
+
+
+def read_photoshop_resources(data):
+    resources = []
+    position = 0
+    while position + 12 <= len(data) and data[position:position + 4] == b"8BIM":
+        resource_id = struct.unpack(">H", data[position + 4:position + 6])[0]
+        name_length = data[position + 6]
+        name = data[position + 7:position + 7 + name_length]
+        position += 6 + ((name_length + 2) & ~1)
+        size = struct.unpack(">I", data[position:position + 4])[0]
+        position += 4
+        resources.append((resource_id, name, data[position:position + size]))
+        position += size + (size % 2)
+    return resources
+
+
+def read_iptc_datasets(data):
+    datasets = []
+    position = 0
+    while position + 5 <= len(data) and data[position] == 0x1C:
+        record, dataset = data[position + 1], data[position + 2]
+        size = struct.unpack(">H", data[position + 3:position + 5])[0]
+        position += 5
+        if size & 0x8000:
+            length_size = size & 0x7FFF
+            size = int.from_bytes(data[position:position + length_size], "big")
+            position += length_size
+        datasets.append(((record, dataset), data[position:position + size]))
+        position += size
+    return datasets
+
+
+def iptc_value(key, value):
+    encoded = value.encode("utf-8")
+    limit = IPTC_MAX_LENGTHS.get(key)
+    if limit and len(encoded) > limit:
+        # Truncate on a character boundary, as ExifTool does for over-long values
+        encoded = encoded[:limit].decode("utf-8", "ignore").encode("utf-8")
+    return encoded
+
+
+def build_iptc(data, fields):
+    datasets = read_iptc_datasets(data)
+    date, time = fields["date"].split(" ")
+    iptc_date, iptc_time = date.replace(":", ""), time.replace(":", "") + "+0000"
+    existing = {key for key, value in datasets}
+
+    updates = {
+        IPTC_CODED_CHARACTER_SET: [IPTC_UTF8],
+        IPTC_RECORD_VERSION: [struct.pack(">H", 4)],
+        IPTC_OBJECT_NAME: [iptc_value(IPTC_OBJECT_NAME, fields["title"])] if fields["title"] else [],
+        IPTC_KEYWORDS: [iptc_value(IPTC_KEYWORDS, keyword) for keyword in fields["keywords"]],
+        IPTC_BY_LINE: [],
+        IPTC_CAPTION: [],
+        IPTC_COPYRIGHT_NOTICE: [],
+    }
+    for key, value in ((IPTC_DATE_CREATED, iptc_date), (IPTC_TIME_CREATED, iptc_time),
+                       (IPTC_DIGITAL_CREATION_DATE, iptc_date), (IPTC_DIGITAL_CREATION_TIME, iptc_time)):
+        if key in existing:
+            updates[key] = [value.encode("ascii")]
+    geotag = fields.get("geotag")
+    if geotag:
+        updates[IPTC_CITY] = [iptc_value(IPTC_CITY, geotag["city"])]
+        updates[IPTC_PROVINCE_STATE] = [iptc_value(IPTC_PROVINCE_STATE, geotag["state"])]
+        updates[IPTC_COUNTRY_CODE] = [iptc_value(IPTC_COUNTRY_CODE, geotag["country_code"])]
+        updates[IPTC_COUNTRY_NAME] = [iptc_value(IPTC_COUNTRY_NAME, geotag["country"])]
+
+    datasets = [(key, value) for key, value in datasets if key not in updates]
+    datasets += [(key, value) for key, values in updates.items() for value in values]
+    datasets.sort(key=lambda dataset: dataset[0])
+
+    result = bytearray()
+    for (record, dataset), value in datasets:
+        if len(value) > 0x7FFF:
+            raise JpegMetadataError("IPTC value too long")
+        result += struct.pack(">BBBH", 0x1C, record, dataset, len(value)) + value
+    return bytes(result)
+
+
+def read_iptc(data):
+    iptc = next((resource_data for resource_id, name, resource_data in read_photoshop_resources(data)
+                 if resource_id == PHOTOSHOP_IPTC), None)
+    if iptc is None:
+        return {}
+    names = {
+        IPTC_OBJECT_NAME: "ObjectName", IPTC_KEYWORDS: "Keywords", IPTC_CITY: "City",
+        IPTC_PROVINCE_STATE: "Province-State", IPTC_COUNTRY_CODE: "Country-PrimaryLocationCode",
+        IPTC_COUNTRY_NAME: "Country-PrimaryLocationName",
+    }
+    values = {}
+    for key, value in read_iptc_datasets(iptc):
+        if key in names:
+            values.setdefault(names[key], []).append(value.decode("utf-8", "replace"))
+    return {name: ", ".join(items) for name, items in values.items()}
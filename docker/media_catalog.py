@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+MAX_RESULTS = 500
+
+
+class MediaCatalog:
+    """SQLite catalog of processed files and the fields parsed from their names.
+
+    Each file's date, title, tags, location, size and mtime are recorded as
+    it is processed, and its path follows it when it is moved. Dates and
+    tags are indexed: a tag query matches the tag and everything below it
+    in the hierarchy (`holiday` finds `holiday.christmas`) with one index
+    range scan. Titles are searched with SQLite full-text search (FTS5),
+    or a plain substring match where FTS5 isn't compiled in.
+    """
+
+    def __init__(self, database_path: str):
+        directory = os.path.dirname(database_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS media (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                taken_at TEXT NOT NULL,
+                title TEXT NOT NULL,
+                country TEXT,
+                state TEXT,
+                city TEXT,
+                place TEXT,
+                latitude REAL,
+                longitude REAL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                cataloged_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS media_taken_at ON media (taken_at);
+            CREATE TABLE IF NOT EXISTS media_tags (
+                tag_key TEXT NOT NULL,
+                media_id INTEGER NOT NULL,
+                tag TEXT NOT NULL,
+                PRIMARY KEY (tag_key, media_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS media_tags_media ON media_tags (media_id);
+            """
+        )
+        try:
+            self._connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS media_titles USING fts5(title)")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False
+        self._connection.commit()
+
+    def contains(self, path: str) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM media WHERE path = ?", (path,)).fetchone() is not None
+
+    def record(self, path: str, date: str, title: str, tags, location=None) -> None:
+        # `date` is "YYYY:MM:DD HH:MM:SS" as parsed from the file name and
+        # `location` None or a dict with any of latitude, longitude, city,
+        # state, country and place
+        stat = os.stat(path)
+        location = location or {}
+        taken_at = date.replace(":", "-", 2)
+        with self._lock:
+            media_id = self._connection.execute(
+                """
+                INSERT INTO media (path, taken_at, title, country, state, city, place, latitude, longitude, size, mtime_ns, cataloged_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    taken_at = excluded.taken_at, title = excluded.title, country = excluded.country,
+                    state = excluded.state, city = excluded.city, place = excluded.place,
+                    latitude = excluded.latitude, longitude = excluded.longitude, size = excluded.size,
+                    mtime_ns = excluded.mtime_ns, cataloged_at = excluded.cataloged_at
+                RETURNING id
+                """,
+                (path, taken_at, title, location.get("country"), location.get("state"), location.get("city"),
+                 location.get("place"), location.get("latitude"), location.get("longitude"),
+                 stat.st_size, stat.st_mtime_ns, datetime.now().isoformat()),
+            ).fetchone()[0]
+            self._connection.execute("DELETE FROM media_tags WHERE media_id = ?", (media_id,))
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO media_tags VALUES (?, ?, ?)",
+                [(tag.casefold(), media_id, tag) for tag in tags or ()],
+            )
+            if self.full_text:
+                self._connection.execute("DELETE FROM media_titles WHERE rowid = ?", (media_id,))
+                self._connection.execute("INSERT INTO media_titles (rowid, title) VALUES (?, ?)", (media_id, title))
+            self._connection.commit()
+
+    def move(self, old_path: str, new_path: str) -> None:
+        stat = os.stat(new_path)
+        with self._lock:
+            # A stale entry already at the new path is replaced
+            self._delete(new_path)
+            self._connection.execute(
+                "UPDATE media SET path = ?, size = ?, mtime_ns = ? WHERE path = ?",
+                (new_path, stat.st_size, stat.st_mtime_ns, old_path),
+            )
+            self._connection.commit()
+
+    def search(self, text=None, tags=(), year=None, date_from=None, date_to=None, place=None, limit=100, offset=0):
+        # Returns (number of matches, one page of matches as dicts ordered by
+        # date). Every given filter must match; `date_from` and `date_to` are
+        # inclusive "YYYY-MM-DD" dates. Raises ValueError for malformed dates.
+        conditions, parameters = [], []
+        if text and text.strip():
+            if self.full_text:
+                # Each word is matched as a prefix, with FTS5 syntax quoted away
+                query = " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+                conditions.append("id IN (SELECT rowid FROM media_titles WHERE media_titles MATCH ?)")
+                parameters.append(query)
+            else:
+                conditions.append("title LIKE ?")
+                parameters.append(f"%{text.strip()}%")
+        for tag in tags:
+            key = tag.strip().casefold()
+            # "/" sorts right after ".", so this range is every tag below `key`
+            conditions.append("id IN (SELECT media_id FROM media_tags WHERE tag_key = ? OR (tag_key > ? AND tag_key < ?))")
+            parameters.extend([key, key + ".", key + "/"])
+        if year:
+            conditions.append("taken_at >= ? AND taken_at < ?")
+            parameters.extend([f"{int(year):04d}", f"{int(year) + 1:04d}"])
+        if date_from:
+            conditions.append("taken_at >= ?")
+            parameters.append(parse_date(date_from).strftime("%Y-%m-%d"))
+        if date_to:
+            conditions.append("taken_at < ?")
+            parameters.append((parse_date(date_to) + timedelta(days=1)).strftime("%Y-%m-%d"))
+        if place:
+            conditions.append("? COLLATE NOCASE IN (place, city, state, country)")
+            parameters.append(place.strip())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        limit = max(1, min(int(limit), MAX_RESULTS))
+        with self._lock:
+            total = self._connection.execute(f"SELECT COUNT(*) FROM media {where}", parameters).fetchone()[0]
+            rows = self._connection.execute(
+                f"""
+                SELECT id, path, taken_at, title, country, state, city, place, latitude, longitude, size, mtime_ns
+                FROM media {where} ORDER BY taken_at, path LIMIT ? OFFSET ?
+                """,
+                parameters + [limit, max(0, int(offset))],
+            ).fetchall()
+            tags_by_id = {}
+            for media_id, tag in self._connection.execute(
+                f"SELECT media_id, tag FROM media_tags WHERE media_id IN ({','.join('?' * len(rows))}) ORDER BY tag",
+                [row[0] for row in rows],
+            ):
+                tags_by_id.setdefault(media_id, []).append(tag)
+
+        columns = ("path", "taken_at", "title", "country", "state", "city", "place", "latitude", "longitude", "size", "mtime_ns")
+        results = []
+        for media_id, *values in rows:
+            result = dict(zip(columns, values))
+            result["tags"] = tags_by_id.get(media_id, [])
+            results.append(result)
+        return total, results
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _delete(self, path: str) -> None:
+        row = self._connection.execute("SELECT id FROM media WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._connection.execute("DELETE FROM media_tags WHERE media_id = ?", row)
+            if self.full_text:
+                self._connection.execute("DELETE FROM media_titles WHERE rowid = ?", row)
+            self._connection.execute("DELETE FROM media WHERE id = ?", row)
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value.strip(), "%Y-%m-%d")
@@ -0,0 +1,120 @@
+import re
+
+TIME_FIELD = "Time:all"
+
+# Time group tags ExifTool reports but `-Time:all=` doesn't write: file system
+# dates (compared separately as the modified date), derived tags and ICC
+# profile headers, which are only written as a whole
+UNWRITTEN_TIME_GROUPS = ("System", "File", "Composite", "ExifTool", "ICC")
+
+DATE_TIME = re.compile(r"^(\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2})(?:\.\d+)? ?(Z|[+-]\d{2}:\d{2})?$")
+DATE_ONLY = re.compile(r"^\d{4}:\d{2}:\d{2}$")
+TIME_ONLY = re.compile(r"^(\d{2}:\d{2}:\d{2})(?:\.\d+)?$")
+TIME_ZONE = re.compile(r"^[+-]\d{2}:\d{2}$")
+NUMBER_SEPARATOR = re.compile(r"[,\s]+")
+
+
+def parse_assignment(argument: str):
+    # "-Group:Tag=value" -> ("Group:Tag", "value")
+    tag, _, value = argument[1:].partition("=")
+    return tag, value
+
+
+def read_fields(fields) -> list:
+    # The fields to read (as `-json -n -a -G1`) to compare a file with
+    # `fields`, a list of (tag, target value) pairs
+    return list(dict.fromkeys(tag for tag, _ in fields))
+
+
+def field_changes(fields, record: dict) -> list:
+    """Compares the fields a run would write with a file's current metadata.
+
+    `fields` are (tag, target) pairs in the order ExifTool applies them: a
+    target is a string ("" deletes the tag) or a list of values, and a tag is
+    `Tag`, `Group:Tag` or `Time:all`. `record` is the file's ExifTool
+    `-json -n -a -G1` output for those tags. Returns (tag, current value,
+    target) for every field that differs; the rest can be left unwritten.
+
+    A tag without a group matches every group, a family 0 group (`XMP`) its
+    family 1 groups (`XMP-dc`), and when several fields match the same tag
+    the last one decides, as it does in ExifTool. `Time:all` covers the
+    remaining date/time tags and compares dates in UTC.
+    """
+    values = {key: value for key, value in record.items() if key != "SourceFile"}
+    owners = {}
+    for index, (tag, _) in enumerate(fields):
+        if tag != TIME_FIELD:
+            for key in values:
+                if tag_matches(tag, key):
+                    owners[key] = index
+
+    changes = []
+    for index, (tag, target) in enumerate(fields):
+        if tag == TIME_FIELD:
+            keys = [key for key in values if key not in owners and not key.startswith(UNWRITTEN_TIME_GROUPS)]
+            results = [same_time(values[key], target) for key in keys]
+            # A file without any dates needs them written
+            differs = False in results or not any(results)
+        else:
+            keys = [key for key, owner in owners.items() if owner == index]
+            if isinstance(target, list):
+                differs = any(as_list(values[key]) != target for key in keys) or (bool(target) and not keys)
+            elif target == "":
+                differs = any(values[key] not in (None, "", []) for key in keys)
+            else:
+                differs = any(not same_value(values[key], target) for key in keys) or not keys
+        if differs:
+            current = [values[key] for key in keys]
+            changes.append((tag, current[0] if len(current) == 1 else current or None, target))
+    return changes
+
+
+def tag_matches(tag: str, key: str) -> bool:
+    group, _, name = tag.rpartition(":")
+    key_group, _, key_name = key.rpartition(":")
+    if name.lower() != key_name.lower():
+        return False
+    if not group or not key_group:
+        return True
+    group, key_group = group.lower(), key_group.lower()
+    return key_group == group or key_group.startswith(group + "-")
+
+
+def as_list(value) -> list:
+    if value is None or value == "":
+        return []
+    return [str(item) for item in value] if isinstance(value, list) else [str(value)]
+
+
+def same_value(value, target: str) -> bool:
+    if isinstance(value, list):
+        value = ", ".join(map(str, value))
+    value = str(value).strip()
+    if value == target.strip():
+        return True
+    # Numbers (and coordinate triples) are compared as numbers: `-n` prints
+    # "30.1 -97.7 0" for a written "30.1, -97.7, 0"
+    try:
+        numbers = [float(part) for part in NUMBER_SEPARATOR.split(value) if part]
+        target_numbers = [float(part) for part in NUMBER_SEPARATOR.split(target.strip()) if part]
+    except ValueError:
+        return False
+    return len(numbers) == len(target_numbers) and all(abs(a - b) < 1e-6 for a, b in zip(numbers, target_numbers))
+
+
+def same_time(value, target: str):
+    # Whether a date/time tag holds `target` ("YYYY:MM:DD HH:MM:SS +00:00"),
+    # or None for values ExifTool derives rather than stores (e.g. SubSecTime)
+    date = target[:19]
+    value = str(value).strip()
+    match = DATE_TIME.match(value)
+    if match:
+        return match.group(1) == date and match.group(2) in (None, "Z", "+00:00")
+    if DATE_ONLY.match(value):
+        return value == date[:10]
+    match = TIME_ONLY.match(value)
+    if match:
+        return match.group(1) == date[11:]
+    if TIME_ZONE.match(value):
+        return value == "+00:00"
+    return None
@@ -0,0 +1,142 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metrics:
+    """Process-wide counters and latency histograms.
+
+    `render()` returns them in the Prometheus text exposition format, so the
+    `/metrics` endpoint can be scraped without any extra dependency.
+    """
+
+    def __init__(self, prefix: str = "media_processor", buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, then sum and count
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self._histograms.items()}
+
+        lines = []
+        described = set()
+        for (name, labels), value in sorted(counters.items()):
+            self._render_help(lines, described, name, "counter")
+            lines.append(f"{self.prefix}_{name}{format_labels(labels)} {format_value(value)}")
+        for (name, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+            self._render_help(lines, described, name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (("le", format_value(bound)),)
+                lines.append(f"{self.prefix}_{name}_bucket{format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.prefix}_{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.prefix}_{name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.prefix}_{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _render_help(self, lines, described, name, default_kind):
+        if name in described:
+            return
+        described.add(name)
+        kind, help_text = self._help.get(name, (default_kind, ""))
+        if help_text:
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+
+class PhaseTimer:
+    """Time spent per pipeline phase during one run.
+
+    Every measurement also goes into the shared `Metrics` histogram
+    `phase_duration_seconds`. Phases that run on several workers at once add
+    up their time, so totals can exceed the run's wall-clock time.
+    """
+
+    def __init__(self, metrics: Metrics = None):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            total, count = self._totals.get(name, (0.0, 0))
+            self._totals[name] = (total + seconds, count + 1)
+        if self.metrics:
+            self.metrics.observe("phase_duration_seconds", seconds, phase=name)
+
+    def iterate(self, name: str, iterator):
+        # Yields from `iterator`, timing only the work done to produce each item
+        iterator = iter(iterator)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start)
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def error(self, phase: str) -> None:
+        if self.metrics:
+            self.metrics.increment("errors_total", phase=phase)
+
+    def summary(self) -> list:
+        # (phase, total seconds, number of measurements), slowest phase first
+        with self._lock:
+            totals = list(self._totals.items())
+        return sorted(((name, total, count) for name, (total, count) in totals), key=lambda row: -row[1])
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
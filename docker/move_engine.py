@@ -0,0 +1,211 @@
+import errno
+import hashlib
+import os
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+
+# os.link() errors that fall back to copying
+LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK}
+
+
+class MoveError(OSError):
+    pass
+
+
+class DuplicateFileError(FileExistsError):
+    def __init__(self, source_path: str, duplicate_path: str):
+        super().__init__(f"{source_path} is identical to {duplicate_path}")
+        self.source_path = source_path
+        self.duplicate_path = duplicate_path
+
+
+class MoveEngine:
+    """Moves files into the move-to tree without overwriting anything.
+
+    Targets on the same device as the source are hard-linked and the source
+    removed, which (unlike a rename) never replaces a file that appeared at
+    the target. Cross-device moves, and mounts that refuse links, are copied
+    with kernel-side copies (`copy_file_range`, then `sendfile`), verified by
+    size or checksum, and only then is the source removed. Copies run on a
+    bounded thread pool and each target directory is created once.
+
+    With a `duplicate_index` (HashIndex), files whose content already exists
+    at the target path (or anywhere, with `skip_duplicates`) are not moved
+    and raise DuplicateFileError instead. Each move is timed as the "move"
+    phase of `timer` (a PhaseTimer), if given, and with a `scheduler`
+    (IoScheduler) waits for an I/O slot on the source and target devices.
+    """
+
+    chunk_size = 8 * 1024 * 1024
+
+    def __init__(self, workers: int = 4, verify: str = "size", duplicate_index=None, skip_duplicates: bool = False, timer=None, scheduler=None):
+        if verify not in ("size", "checksum"):
+            raise ValueError(f"Unknown move verification: {verify}")
+        self.workers = max(1, workers)
+        self.verify = verify
+        self.duplicate_index = duplicate_index
+        self.skip_duplicates = skip_duplicates
+        self.timer = timer
+        self.scheduler = scheduler
+        self._executor = None
+        self._lock = threading.Lock()
+        self._created_directories = set()
+
+    def submit(self, source_path: str, target_path: str):
+        # Starts a move in the background and returns its Future
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor.submit(self.move, source_path, target_path)
+
+    def move_all(self, operations):
+        # Moves (source, target) pairs in parallel, yielding
+        # (source, target, move() result or None, error or None) in order
+        pending = deque()
+        operations = iter(operations)
+        while True:
+            while len(pending) < self.workers * 2:
+                operation = next(operations, None)
+                if operation is None:
+                    break
+                pending.append((operation, self.submit(*operation)))
+            if not pending:
+                return
+            (source_path, target_path), future = pending.popleft()
+            try:
+                yield source_path, target_path, future.result(), None
+            except OSError as e:
+                yield source_path, target_path, None, e
+
+    def move(self, source_path: str, target_path: str):
+        # Returns ("renamed" or "copied", path of an identical file already in
+        # the tree or None)
+        if self.scheduler:
+            slot = self.scheduler.slot([source_path, os.path.dirname(target_path)], os.path.getsize(source_path), self.timer)
+        else:
+            slot = nullcontext()
+        with slot, self.timer.phase("move") if self.timer else nullcontext():
+            return self._move(source_path, target_path)
+
+    def _move(self, source_path: str, target_path: str):
+        duplicate_path = None
+        if self.duplicate_index is not None:
+            duplicate_path = self.duplicate_index.find_duplicate(source_path, target_path)
+            if duplicate_path and (self.skip_duplicates or duplicate_path == target_path):
+                raise DuplicateFileError(source_path, duplicate_path)
+
+        self.ensure_directory(os.path.dirname(target_path))
+        if os.path.lexists(target_path):
+            raise FileExistsError(f"Target already exists: {target_path}")
+
+        method = None
+        if os.stat(source_path).st_dev == os.stat(os.path.dirname(target_path)).st_dev:
+            method = self._link_and_remove(source_path, target_path)
+        if method is None:
+            self._copy_and_remove(source_path, target_path)
+            method = "copied"
+
+        if self.duplicate_index is not None:
+            self.duplicate_index.add(target_path)
+        return method, duplicate_path
+
+    def _link_and_remove(self, source_path: str, target_path: str):
+        # A hard link never replaces an existing target, unlike rename().
+        # Returns None where the file can't be linked: bind mounts of one
+        # filesystem share st_dev but refuse links (and renames) between them
+        # with EXDEV, and some filesystems have no hard links at all.
+        try:
+            os.link(source_path, target_path)
+        except OSError as e:
+            if e.errno in LINK_UNSUPPORTED:
+                return None
+            raise
+        try:
+            os.remove(source_path)
+        except BaseException:
+            os.remove(target_path)
+            raise
+        return "renamed"
+
+    def _copy_and_remove(self, source_path: str, target_path: str) -> None:
+        # "xb" refuses to replace a target that appeared since the existence
+        # check, and only a target created here is removed on failure
+        target = open(target_path, "xb")
+        try:
+            with target:
+                self._copy(source_path, target)
+            shutil.copystat(source_path, target_path)
+            self._verify(source_path, target_path)
+        except BaseException:
+            os.remove(target_path)
+            raise
+        os.remove(source_path)
+
+    def ensure_directory(self, directory: str) -> None:
+        with self._lock:
+            if directory in self._created_directories:
+                return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._created_directories.add(directory)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _copy(self, source_path: str, target) -> None:
+        with open(source_path, "rb") as source:
+            size = os.fstat(source.fileno()).st_size
+            copied = self._kernel_copy(source.fileno(), target.fileno(), size)
+            if copied < size:
+                source.seek(copied)
+                target.seek(copied)
+                shutil.copyfileobj(source, target, self.chunk_size)
+
+    def _kernel_copy(self, source_fd: int, target_fd: int, size: int) -> int:
+        # Returns how many bytes were copied before the kernel paths gave up;
+        # the caller finishes the rest in user space
+        copied = 0
+        for copy in (self._copy_file_range, self._sendfile):
+            try:
+                while copied < size:
+                    count = copy(source_fd, target_fd, copied, min(self.chunk_size, size - copied))
+                    if count == 0:
+                        break
+                    copied += count
+                return copied
+            except OSError:
+                if copied:
+                    raise
+        return copied
+
+    @staticmethod
+    def _copy_file_range(source_fd, target_fd, offset, count):
+        if not hasattr(os, "copy_file_range"):
+            raise OSError("copy_file_range is not available")
+        return os.copy_file_range(source_fd, target_fd, count, offset, offset)
+
+    @staticmethod
+    def _sendfile(source_fd, target_fd, offset, count):
+        os.lseek(target_fd, offset, os.SEEK_SET)
+        return os.sendfile(target_fd, source_fd, offset, count)
+
+    def _verify(self, source_path: str, target_path: str) -> None:
+        if os.path.getsize(source_path) != os.path.getsize(target_path):
+            raise MoveError(f"Size mismatch after copying {source_path}")
+        if self.verify == "checksum" and file_checksum(source_path) != file_checksum(target_path):
+            raise MoveError(f"Checksum mismatch after copying {source_path}")
+
+
+def file_checksum(path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,648 @@
+import os
+import re
+import shutil
+import struct
+from datetime import datetime, timedelta, timezone
+
+from jpeg_metadata import JpegMetadataError, build_xmp, read_xmp, temporary_file_path
+
+# Boxes walked to reach the ones this module edits; everything else is copied as is
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"udta", b"meta"}
+PADDING_BOXES = {b"free", b"skip"}
+XMP_UUID = bytes.fromhex("BE7ACFCB97A942E89C71999491E3AFAC")
+XMP_TRAILER = b'\n<?xpacket end="w"?>'
+QUICKTIME_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+MOOV_PADDING = 4096  # Room left in moov so later edits fit in place
+LANGUAGE_ENGLISH = 0x15C7
+UTF8 = 1
+
+# ItemList (moov/udta/meta, handler "mdir") and Keys (moov/meta, handler "mdta") entries
+ITEM_TITLE, ITEM_DESCRIPTION, ITEM_ARTIST = b"\xa9nam", b"desc", b"\xa9ART"
+ITEM_COPYRIGHT, ITEM_DATE, ITEM_GPS = b"cprt", b"\xa9day", b"\xa9xyz"
+KEY_PREFIX = "com.apple.quicktime."
+KEY_CREATION_DATE, KEY_TITLE, KEY_DESCRIPTION = "creationdate", "title", "description"
+KEY_AUTHOR, KEY_ARTIST, KEY_COPYRIGHT = "author", "artist", "copyright"
+KEY_GPS, KEY_LOCATION_NAME = "location.ISO6709", "location.name"
+
+# How a write reached the disk, from cheapest to most expensive
+IN_PLACE, MOOV_AT_END, MOOV_MOVED, FULL_REWRITE = "in_place", "moov_at_end", "moov_moved", "full_rewrite"
+
+
+class Mp4MetadataError(ValueError):
+    pass
+
+
+class Box:
+    """One box: raw `data`, or `children` (after `prefix`, the version and
+    flags of a full box) for the containers this module edits."""
+
+    def __init__(self, box_type: bytes, data: bytes = b"", children=None, prefix: bytes = b"", tail: bytes = b""):
+        self.type = box_type
+        self.data = data
+        self.children = children
+        self.prefix = prefix
+        self.tail = tail
+
+    def payload(self) -> bytes:
+        if self.children is None:
+            return self.data
+        return self.prefix + b"".join(child.serialize() for child in self.children) + self.tail
+
+    def serialize(self) -> bytes:
+        payload = self.payload()
+        if len(payload) + 8 > 0xFFFFFFFF:
+            return struct.pack(">I4sQ", 1, self.type, len(payload) + 16) + payload
+        return struct.pack(">I4s", len(payload) + 8, self.type) + payload
+
+    def find(self, box_type: bytes):
+        return next((child for child in self.children or () if child.type == box_type), None)
+
+    def find_all(self, box_type: bytes) -> list:
+        return [child for child in self.children or () if child.type == box_type]
+
+
+class TopLevelBox:
+    def __init__(self, box_type: bytes, offset: int, size: int, header_size: int, to_end: bool):
+        self.type = box_type
+        self.offset = offset
+        self.size = size
+        self.header_size = header_size
+        self.to_end = to_end  # Size 0: the box runs to the end of the file
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.size
+
+
+def write_mp4_metadata(file_path: str, fields: dict, in_place: bool = False):
+    # Writes the same date, title, author, copyright, tag and geotag values as
+    # the ExifTool command in process_file (see write_jpeg_metadata for
+    # `fields`). By default the file is rewritten into a temporary copy that
+    # replaces it, so a crash or full disk never leaves a damaged video. With
+    # `in_place`, only the moov and XMP boxes are rewritten where possible,
+    # directly in the original file: far less I/O, but an interrupted write
+    # can corrupt it.
+    # Returns (bytes written, one of IN_PLACE/MOOV_AT_END/MOOV_MOVED/FULL_REWRITE).
+    # Raises Mp4MetadataError for files it cannot safely update.
+    quicktime = os.path.splitext(file_path)[1].lower() == ".mov"
+    with open(file_path, "r+b" if in_place else "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        boxes = read_top_level(f, file_size)
+        moov_box = single_box(boxes, b"moov")
+        f.seek(moov_box.offset + moov_box.header_size)
+        moov = parse_box(b"moov", f.read(moov_box.size - moov_box.header_size))
+
+        update_dates(moov, fields["date"])
+        update_item_list(moov, fields)
+        update_keys(moov, fields, quicktime)
+        update_user_data_gps(moov, fields)
+
+        # QuickTime keeps XMP in moov/udta; MP4 in a top-level uuid box
+        xmp_box = find_xmp_box(f, boxes)
+        udta = moov.find(b"udta")
+        udta_xmp = udta.find(b"XMP_") if udta else None
+        new_xmp = None
+        if udta_xmp is not None or (quicktime and xmp_box is None):
+            packet = udta_xmp.data if udta_xmp is not None else None
+            if udta_xmp is None:
+                udta_xmp = Box(b"XMP_")
+                user_data(moov).children.append(udta_xmp)
+            udta_xmp.data = xmp_packet(packet, fields)
+        else:
+            packet = None
+            if xmp_box is not None:
+                packet = read_at(f, xmp_box.offset + xmp_box.header_size + 16, xmp_box.size - xmp_box.header_size - 16)
+            new_xmp = xmp_packet(packet, fields)
+
+        moov.children = [child for child in moov.children if child.type not in PADDING_BOXES]
+
+        # Plan everything before writing, so a full rewrite starts from the original file
+        fitted_xmp = None
+        if new_xmp is not None and xmp_box is not None and not xmp_box.to_end:
+            fitted_xmp = fit_packet(new_xmp, xmp_box.size - xmp_box.header_size - 16)
+        append_xmp = new_xmp is not None and fitted_xmp is None
+        content = moov.payload()
+        following = following_padding(boxes, moov_box)
+        available = following.end - moov_box.offset if following else moov_box.size
+        if moov_box.to_end or not in_place:
+            method = FULL_REWRITE
+        elif fits(content, available):
+            method = IN_PLACE
+        elif all(box.type in PADDING_BOXES for box in boxes if box.offset > moov_box.offset):
+            method = MOOV_AT_END
+        else:
+            method = MOOV_MOVED
+        if boxes[-1].to_end and (method == MOOV_MOVED or (method == IN_PLACE and append_xmp)):
+            # Nothing can be appended to a file whose last box runs to its end
+            method = FULL_REWRITE
+
+        if method == FULL_REWRITE:
+            if any(box.type == b"moof" for box in boxes):
+                raise Mp4MetadataError("Fragmented MP4 files can't be rewritten natively")
+            f.close()
+            return full_rewrite(file_path, boxes, moov_box, moov, xmp_box, new_xmp), method
+
+        written = 0
+        if fitted_xmp is not None:
+            f.seek(xmp_box.offset + xmp_box.header_size + 16)
+            f.write(fitted_xmp)
+            written += len(fitted_xmp)
+        elif append_xmp and xmp_box is not None:
+            # Left behind as padding; the new packet goes at the end
+            retype(f, xmp_box, b"free")
+            written += 8
+
+        if method == IN_PLACE:
+            f.seek(moov_box.offset)
+            written += write_moov(f, content, available)
+        elif method == MOOV_AT_END:
+            # Nothing but padding after moov, so it can grow into the end of the file
+            size = moov_size(content, MOOV_PADDING)
+            f.seek(moov_box.offset)
+            written += write_moov(f, content, size)
+            f.truncate(moov_box.offset + size)
+        else:
+            # Chunk offsets point into mdat, which doesn't move, so the new
+            # moov can go at the end with the old one left as padding
+            f.seek(0, os.SEEK_END)
+            written += write_moov(f, content, moov_size(content, MOOV_PADDING))
+            retype(f, moov_box, b"free")
+            written += 8
+
+        if append_xmp:
+            f.seek(0, os.SEEK_END)
+            xmp = Box(b"uuid", XMP_UUID + new_xmp).serialize()
+            f.write(xmp)
+            written += len(xmp)
+        f.flush()
+        os.fsync(f.fileno())
+    return written, method
+
+
+
+def read_mp4_metadata(file_path: str) -> dict:
+    # Reads back the fields the writer manages, named and formatted like
+    # `exiftool -s -n` output
+    with open(file_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        boxes = read_top_level(f, file_size)
+        moov_box = single_box(boxes, b"moov")
+        f.seek(moov_box.offset + moov_box.header_size)
+        moov = parse_box(b"moov", f.read(moov_box.size - moov_box.header_size))
+        xmp_box = find_xmp_box(f, boxes)
+        packet = read_at(f, xmp_box.offset + xmp_box.header_size + 16, xmp_box.size - xmp_box.header_size - 16) if xmp_box else None
+
+    udta = moov.find(b"udta")
+    if udta is not None and udta.find(b"XMP_") is not None:
+        packet = udta.find(b"XMP_").data
+    # Later updates win: QuickTime tags take priority over XMP like ExifTool
+    metadata = read_xmp(packet) if packet else {}
+
+    mvhd = moov.find(b"mvhd")
+    if mvhd is not None:
+        created = read_times(mvhd.data)[0]
+        if created:
+            metadata["CreateDate"] = (QUICKTIME_EPOCH + timedelta(seconds=created)).strftime("%Y:%m:%d %H:%M:%S")
+
+    items = item_list_values(moov)
+    keys = keys_values(moov)
+    for name, value in (
+        ("Title", items.get(ITEM_TITLE) or keys.get(KEY_TITLE)),
+        ("Description", items.get(ITEM_DESCRIPTION) or keys.get(KEY_DESCRIPTION)),
+        ("Artist", items.get(ITEM_ARTIST) or keys.get(KEY_ARTIST)),
+        ("Author", keys.get(KEY_AUTHOR)),
+        ("Copyright", items.get(ITEM_COPYRIGHT) or keys.get(KEY_COPYRIGHT)),
+        ("ContentCreateDate", items.get(ITEM_DATE)),
+        ("LocationName", keys.get(KEY_LOCATION_NAME)),
+    ):
+        if value:
+            metadata[name] = value
+
+    coordinates = keys.get(KEY_GPS) or items.get(ITEM_GPS) or user_data_gps(moov)
+    if coordinates:
+        parsed = parse_iso6709(coordinates)
+        if parsed:
+            metadata["GPSLatitude"], metadata["GPSLongitude"] = (f"{value:.10g}" for value in parsed)
+    return metadata
+
+
+# File layout
+
+def read_top_level(f, file_size: int) -> list:
+    boxes = []
+    offset = 0
+    while offset < file_size:
+        header = read_at(f, offset, 16)
+        if len(header) < 8:
+            raise Mp4MetadataError("Truncated box header")
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        to_end = False
+        if size == 1:
+            if len(header) < 16:
+                raise Mp4MetadataError("Truncated box header")
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+            to_end = True
+        if size < header_size or offset + size > file_size:
+            raise Mp4MetadataError(f"Box {box_type!r} extends past the end of the file")
+        boxes.append(TopLevelBox(box_type, offset, size, header_size, to_end))
+        offset += size
+    return boxes
+
+
+def single_box(boxes, box_type: bytes) -> TopLevelBox:
+    matches = [box for box in boxes if box.type == box_type]
+    if len(matches) != 1:
+        raise Mp4MetadataError(f"Expected one {box_type.decode()} box, found {len(matches)}")
+    return matches[0]
+
+
+def read_at(f, offset: int, length: int) -> bytes:
+    f.seek(offset)
+    return f.read(length)
+
+
+def find_xmp_box(f, boxes):
+    return next((box for box in boxes if box.type == b"uuid" and read_at(f, box.offset + box.header_size, 16) == XMP_UUID), None)
+
+
+def following_padding(boxes, moov_box):
+    # The last of the padding boxes directly after moov, if any
+    last = None
+    for box in boxes[boxes.index(moov_box) + 1:]:
+        if box.type not in PADDING_BOXES or box.to_end:
+            break
+        last = box
+    return last
+
+
+def fits(content: bytes, available: int) -> bool:
+    # Exactly, or with room for a free box to fill the gap
+    remaining = available - 8 - len(content)
+    return remaining == 0 or remaining >= 8
+
+
+def moov_size(content: bytes, padding: int) -> int:
+    return 8 + len(content) + 8 + padding
+
+
+def write_moov(f, content: bytes, size: int) -> int:
+    # Writes a moov box of exactly `size` bytes at the current position, the
+    # rest filled by a free box whose contents are left as they were.
+    # Returns the number of bytes written.
+    remaining = size - 8 - len(content)
+    f.write(struct.pack(">I4s", size, b"moov") + content)
+    written = 8 + len(content)
+    if remaining:
+        start = f.tell()
+        f.write(struct.pack(">I4s", remaining, b"free"))
+        written += 8
+        if start + remaining > os.fstat(f.fileno()).st_size:
+            f.truncate(start + remaining)
+    return written
+
+
+def retype(f, box: TopLevelBox, box_type: bytes) -> None:
+    f.seek(box.offset + 4)
+    f.write(box_type)
+
+
+def full_rewrite(file_path, boxes, moov_box, moov, xmp_box, new_xmp) -> int:
+    # The default write, and the last resort for in-place writes when the moov
+    # can't grow without moving media data: copies the file with the new boxes
+    # and shifts every chunk offset to match
+    xmp = Box(b"uuid", XMP_UUID + new_xmp).serialize() if new_xmp is not None else b""
+    replacements = {}
+    if xmp_box is not None and xmp:
+        replacements[xmp_box.offset] = xmp
+        xmp = b""
+
+    # Chunk offsets are fixed width, so moov's size doesn't depend on their values.
+    # A new XMP box goes straight after moov, ahead of any box that runs to the end.
+    moov.children.append(Box(b"free", b"\x00" * MOOV_PADDING))
+    new_sizes = {offset: len(data) for offset, data in replacements.items()}
+    new_sizes[moov_box.offset] = len(moov.serialize()) + len(xmp)
+    layout = []
+    position = 0
+    for box in boxes:
+        layout.append((box.offset, box.end, position))
+        position += new_sizes.get(box.offset, box.size)
+
+    def shift(offset):
+        for old_start, old_end, new_start in layout:
+            if old_start <= offset < old_end:
+                return offset - old_start + new_start
+        return offset
+
+    for table in chunk_offset_tables(moov):
+        count = struct.unpack(">I", table.data[4:8])[0]
+        entry = "Q" if table.type == b"co64" else "I"
+        end = 8 + count * struct.calcsize(entry)
+        shifted = [shift(value) for value in struct.unpack(f">{count}{entry}", table.data[8:end])]
+        if entry == "I" and any(value > 0xFFFFFFFF for value in shifted):
+            raise Mp4MetadataError("Chunk offsets no longer fit in 32 bits")
+        table.data = table.data[:8] + struct.pack(f">{count}{entry}", *shifted) + table.data[end:]
+    replacements[moov_box.offset] = moov.serialize() + xmp
+
+    temporary_path = temporary_file_path(file_path)
+    written = 0
+    try:
+        with open(file_path, "rb") as source, open(temporary_path, "wb") as target:
+            for box in boxes:
+                if box.offset in replacements:
+                    data = replacements[box.offset]
+                    target.write(data)
+                    written += len(data)
+                    continue
+                source.seek(box.offset)
+                remaining = box.size
+                while remaining:
+                    chunk = source.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        raise Mp4MetadataError("File changed while it was being rewritten")
+                    target.write(chunk)
+                    remaining -= len(chunk)
+                written += box.size
+        shutil.copymode(file_path, temporary_path)
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return written
+
+
+def chunk_offset_tables(moov: Box) -> list:
+    tables = []
+    for trak in moov.find_all(b"trak"):
+        stbl = descend(trak, b"mdia", b"minf", b"stbl")
+        if stbl is not None:
+            tables.extend(child for child in stbl.children if child.type in (b"stco", b"co64"))
+    return tables
+
+
+# Box tree
+
+def parse_box(box_type: bytes, payload: bytes) -> Box:
+    if box_type not in CONTAINER_BOXES:
+        return Box(box_type, payload)
+    prefix = b""
+    if box_type == b"meta" and payload[4:8] != b"hdlr":
+        # ISO meta is a full box; QuickTime's isn't
+        prefix, payload = payload[:4], payload[4:]
+    children, tail = parse_children(payload)
+    return Box(box_type, children=children, prefix=prefix, tail=tail)
+
+
+def parse_children(data: bytes):
+    children = []
+    offset = 0
+    while len(data) - offset >= 8:
+        size, box_type = struct.unpack(">I4s", data[offset:offset + 8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header_size = 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header_size or offset + size > len(data):
+            if size == 0 or box_type == b"\x00\x00\x00\x00":
+                break  # QuickTime user data may end with a zero terminator
+            raise Mp4MetadataError(f"Box {box_type!r} extends past its parent")
+        children.append(parse_box(box_type, data[offset + header_size:offset + size]))
+        offset += size
+    return children, data[offset:]
+
+
+def descend(box: Box, *path):
+    for box_type in path:
+        box = box.find(box_type) if box is not None else None
+    return box
+
+
+def user_data(moov: Box) -> Box:
+    udta = moov.find(b"udta")
+    if udta is None:
+        udta = Box(b"udta", children=[])
+        moov.children.append(udta)
+    return udta
+
+
+def handler_type(meta: Box):
+    hdlr = meta.find(b"hdlr")
+    return hdlr.data[8:12] if hdlr is not None and len(hdlr.data) >= 12 else None
+
+
+def new_meta(handler: bytes, manufacturer: bytes, full_box: bool) -> Box:
+    hdlr = Box(b"hdlr", struct.pack(">II4s4sII", 0, 0, handler, manufacturer, 0, 0) + b"\x00")
+    return Box(b"meta", children=[hdlr], prefix=b"\x00\x00\x00\x00" if full_box else b"")
+
+
+# Dates (mvhd, tkhd, mdhd)
+
+def update_dates(moov: Box, date: str) -> None:
+    moment = datetime.strptime(date, "%Y:%m:%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    seconds = int((moment - QUICKTIME_EPOCH).total_seconds())
+    headers = [moov.find(b"mvhd")]
+    for trak in moov.find_all(b"trak"):
+        headers.extend([trak.find(b"tkhd"), descend(trak, b"mdia", b"mdhd")])
+    for header in headers:
+        if header is not None:
+            header.data = with_times(header.data, seconds)
+
+
+def read_times(data: bytes):
+    if data[:1] == b"\x01":
+        return struct.unpack(">QQ", data[4:20])
+    return struct.unpack(">II", data[4:12])
+
+
+def with_times(data: bytes, seconds: int) -> bytes:
+    if data[:1] == b"\x01":
+        return data[:4] + struct.pack(">QQ", seconds, seconds) + data[20:]
+    return data[:4] + struct.pack(">II", seconds, seconds) + data[12:]
+
+
+# ItemList (moov/udta/meta/ilst)
+
+def data_box(value: str) -> bytes:
+    return Box(b"data", struct.pack(">II", UTF8, 0) + value.encode("utf-8")).serialize()
+
+
+def item_list(moov: Box) -> Box:
+    udta = user_data(moov)
+    meta = next((box for box in udta.find_all(b"meta") if handler_type(box) == b"mdir"), None)
+    if meta is None:
+        meta = new_meta(b"mdir", b"appl", True)
+        udta.children.append(meta)
+    ilst = meta.find(b"ilst")
+    if ilst is None:
+        ilst = Box(b"ilst", b"")
+        meta.children.append(ilst)
+    return ilst
+
+
+def update_item_list(moov: Box, fields: dict) -> None:
+    ilst = item_list(moov)
+    items, _ = parse_children(ilst.data)
+    values = {
+        ITEM_TITLE: fields["title"],
+        ITEM_DESCRIPTION: fields["title"],
+        ITEM_ARTIST: fields["author"],
+        ITEM_COPYRIGHT: fields["copyright"],
+        ITEM_DATE: iso_date(fields["date"]),
+    }
+    coordinates = geotag_iso6709(fields.get("geotag"))
+    if coordinates:
+        values[ITEM_GPS] = coordinates
+    items = [item for item in items if item.type not in values]
+    items.extend(Box(item_type, data_box(value)) for item_type, value in values.items() if value)
+    ilst.data = b"".join(item.serialize() for item in items)
+
+
+def item_list_values(moov: Box) -> dict:
+    udta = moov.find(b"udta")
+    meta = next((box for box in udta.find_all(b"meta") if handler_type(box) == b"mdir"), None) if udta else None
+    ilst = meta.find(b"ilst") if meta is not None else None
+    if ilst is None:
+        return {}
+    items, _ = parse_children(ilst.data)
+    return {item.type: data_value(item.data) for item in items}
+
+
+def data_value(item_data: bytes):
+    # Text of an item's first "data" box
+    boxes, _ = parse_children(item_data)
+    for box in boxes:
+        if box.type == b"data" and len(box.data) >= 8:
+            return box.data[8:].decode("utf-8", "replace")
+    return None
+
+
+# Keys (moov/meta with handler "mdta")
+
+def update_keys(moov: Box, fields: dict, quicktime: bool) -> None:
+    meta = next((box for box in moov.find_all(b"meta") if handler_type(box) == b"mdta"), None)
+    if meta is None:
+        meta = new_meta(b"mdta", b"\x00\x00\x00\x00", not quicktime)
+        moov.children.append(meta)
+    names, values = read_keys(meta)
+
+    updates = {
+        KEY_CREATION_DATE: iso_date(fields["date"], compact_offset=True),
+        KEY_TITLE: fields["title"],
+        KEY_DESCRIPTION: fields["title"],
+        KEY_AUTHOR: fields["author"],
+        KEY_ARTIST: fields["author"],
+        KEY_COPYRIGHT: fields["copyright"],
+    }
+    geotag = fields.get("geotag")
+    if geotag:
+        updates[KEY_LOCATION_NAME] = geotag["location_name"]
+        coordinates = geotag_iso6709(geotag)
+        if coordinates:
+            updates[KEY_GPS] = coordinates
+    for key, value in updates.items():
+        name = KEY_PREFIX + key
+        if value:
+            values[name] = data_box(value)
+        else:
+            values.pop(name, None)
+
+    names = [name for name in names if name in values] + [name for name in values if name not in names]
+    keys = struct.pack(">II", 0, len(names)) + b"".join(
+        struct.pack(">I4s", 8 + len(name.encode("utf-8")), b"mdta") + name.encode("utf-8") for name in names
+    )
+    ilst = b"".join(Box(struct.pack(">I", index), values[name]).serialize() for index, name in enumerate(names, 1))
+    others = [child for child in meta.children if child.type not in (b"keys", b"ilst")]
+    meta.children = others + [Box(b"keys", keys), Box(b"ilst", ilst)]
+
+
+def read_keys(meta: Box):
+    # ([key names in order], {key name: item payload})
+    keys = meta.find(b"keys")
+    names = []
+    if keys is not None and len(keys.data) >= 8:
+        count = struct.unpack(">I", keys.data[4:8])[0]
+        offset = 8
+        for _ in range(count):
+            size = struct.unpack(">I", keys.data[offset:offset + 4])[0]
+            names.append(keys.data[offset + 8:offset + size].decode("utf-8", "replace"))
+            offset += size
+    values = {}
+    ilst = meta.find(b"ilst")
+    if ilst is not None:
+        items, _ = parse_children(ilst.data)
+        for item in items:
+            index = struct.unpack(">I", item.type)[0]
+            if 1 <= index <= len(names):
+                values[names[index - 1]] = item.data
+    return names, values
+
+
+def keys_values(moov: Box) -> dict:
+    meta = next((box for box in moov.find_all(b"meta") if handler_type(box) == b"mdta"), None)
+    if meta is None:
+        return {}
+    _, values = read_keys(meta)
+    return {name[len(KEY_PREFIX):]: data_value(data) for name, data in values.items() if name.startswith(KEY_PREFIX)}
+
+
+# UserData GPS (moov/udta/©xyz)
+
+def update_user_data_gps(moov: Box, fields: dict) -> None:
+    coordinates = geotag_iso6709(fields.get("geotag"))
+    if not coordinates:
+        return
+    udta = user_data(moov)
+    encoded = coordinates.encode("utf-8")
+    udta.children = [child for child in udta.children if child.type != ITEM_GPS]
+    udta.children.append(Box(ITEM_GPS, struct.pack(">HH", len(encoded), LANGUAGE_ENGLISH) + encoded))
+
+
+def user_data_gps(moov: Box):
+    gps = descend(moov, b"udta", ITEM_GPS)
+    if gps is None or len(gps.data) < 4:
+        return None
+    length = struct.unpack(">H", gps.data[:2])[0]
+    return gps.data[4:4 + length].decode("utf-8", "replace")
+
+
+# Values
+
+def iso_date(date: str, compact_offset: bool = False) -> str:
+    iso = date.replace(":", "-", 2).replace(" ", "T")
+    return iso + ("+0000" if compact_offset else "+00:00")
+
+
+def geotag_iso6709(geotag):
+    if not geotag or geotag.get("latitude") is None:
+        return None
+    return f"{geotag['latitude']:+08.4f}{geotag['longitude']:+09.4f}+000.000/"
+
+
+def parse_iso6709(value: str):
+    match = re.match(r"^([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)", value)
+    if not match:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+
+def xmp_packet(packet, fields) -> bytes:
+    try:
+        return build_xmp(packet, fields)
+    except JpegMetadataError as e:
+        raise Mp4MetadataError(str(e))
+
+
+def fit_packet(packet: bytes, size: int):
+    # The packet with its whitespace padding resized to fill exactly `size`
+    # bytes, or None if it doesn't fit even without padding
+    content = packet[:-len(XMP_TRAILER)].rstrip()
+    padding = size - len(content) - 1 - len(XMP_TRAILER)
+    if padding < 0:
+        return None
+    return content + b"\n" + b" " * padding + XMP_TRAILER
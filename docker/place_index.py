@@ -0,0 +1,59 @@
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class PlaceIndex:
+    """Nearest saved place within `max_distance_km` of a coordinate.
+
+    Places are bucketed into a latitude/longitude grid whose cells are
+    `max_distance_km` tall, so a lookup only measures the places in the
+    handful of cells that can hold a match rather than every place. Columns
+    wrap around the antimeridian and widen towards the poles, where a degree
+    of longitude gets shorter.
+    """
+
+    def __init__(self, places, max_distance_km: float):
+        # `places` are tuples ending in (latitude, longitude)
+        self.max_distance_km = max_distance_km
+        self.cell_degrees = min(max(max_distance_km / KM_PER_DEGREE, 1e-4), 180.0)
+        self.columns = math.ceil(360 / self.cell_degrees)
+        self._cells = defaultdict(list)
+        for place in places:
+            latitude, longitude = place[-2:]
+            self._cells[self._cell(latitude, longitude)].append(place)
+
+    def __len__(self) -> int:
+        return sum(len(places) for places in self._cells.values())
+
+    def nearest(self, latitude: float, longitude: float):
+        # Returns (place, distance in km) or None if nothing is close enough
+        row, column = self._cell(latitude, longitude)
+        # Cells to either side needed to cover max_distance_km at this latitude
+        longitude_scale = max(math.cos(math.radians(min(abs(latitude) + self.cell_degrees, 90.0))), 1e-9)
+        span = min(math.ceil(1 / longitude_scale), self.columns // 2)
+
+        best = None
+        for neighbour_row in (row - 1, row, row + 1):
+            for offset in range(-span, span + 1):
+                for place in self._cells.get((neighbour_row, (column + offset) % self.columns), ()):
+                    distance = haversine_km(latitude, longitude, *place[-2:])
+                    if distance <= self.max_distance_km and (best is None or distance < best[1]):
+                        best = (place, distance)
+        return best
+
+    def _cell(self, latitude, longitude):
+        return (
+            math.floor(latitude / self.cell_degrees),
+            math.floor(((longitude + 180) % 360) / self.cell_degrees) % self.columns,
+        )
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2) -> float:
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    delta_phi = phi2 - phi1
+    delta_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class ProcessingManifest:
+    """SQLite record of files already processed and the metadata applied to them.
+
+    A file is considered unchanged when its path, size, mtime and inode all
+    match the recorded values, so any edit, copy or replacement invalidates it.
+    """
+
+    def __init__(self, database_path: str):
+        directory = os.path.dirname(database_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed_files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                processed_at TEXT NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+
+    def is_current(self, path: str, stat: os.stat_result, fingerprint: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, inode, fingerprint FROM processed_files WHERE path = ?",
+                (path,),
+            ).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns, stat.st_ino, fingerprint)
+
+    def record(self, path: str, fingerprint: str) -> None:
+        stat = os.stat(path)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO processed_files VALUES (?, ?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, fingerprint, datetime.now().isoformat()),
+            )
+            self._connection.commit()
+
+    def move(self, old_path: str, new_path: str) -> None:
+        # Cross-device moves change the inode, so the new location is re-stated
+        stat = os.stat(new_path)
+        with self._lock:
+            self._connection.execute(
+                "UPDATE OR REPLACE processed_files SET path = ?, size = ?, mtime_ns = ?, inode = ? WHERE path = ?",
+                (new_path, stat.st_size, stat.st_mtime_ns, stat.st_ino, old_path),
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def metadata_fingerprint(values: dict) -> str:
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
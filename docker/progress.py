@@ -0,0 +1,142 @@
+import json
+import time
+
+SUCCESS_STATUSES = ("processed", "skipped", "deleted", "resumed")
+
+
+class Event(str):
+    """A log line that also carries a structured event.
+
+    Everything that treats the stream as text (job logs, `text/plain`
+    responses) just sees the string; `ndjson_events()` reads `event` and
+    `fields` instead of guessing from the wording.
+    """
+
+    def __new__(cls, text: str, event: str, **fields):
+        line = super().__new__(cls, text)
+        line.event = event
+        line.fields = fields
+        return line
+
+
+def file_event(log, status: str, file_name: str = None) -> Event:
+    # One file's log lines as a single "file" event. Verbose metadata dumps
+    # ("detail" events) stay in the text but are kept apart from the messages.
+    messages = [line for line in log if getattr(line, "event", None) != "detail"]
+    details = [line for line in log if getattr(line, "event", None) == "detail"]
+    return Event("".join(log), "file", status=status, file=file_name, messages=messages, details="".join(details))
+
+
+def end_event(text: str, status: str) -> Event:
+    # The last line of a processing or cleanup run; `status` ("completed" or
+    # "failed") is what job status and the "done" event are set from
+    return Event(text, "end", status=status)
+
+
+def ndjson_events(lines, log_url: str = None, interval: float = 0.5):
+    """Turns a processing or cleanup stream into newline-delimited JSON events.
+
+    Successful files only update the counters, which are sent as a
+    "progress" event (counts, percent complete, files per second and ETA) at
+    most every `interval` seconds. Warnings, errors and other log lines are
+    sent as "log" events straight away. Verbose metadata is never sent
+    inline: a single "verbose_log" event points at `log_url` instead, if the
+    full text log is kept somewhere. A final "done" event ends the stream.
+    """
+    counts = {status: 0 for status in SUCCESS_STATUSES + ("error",)}
+    total = None
+    phase = None
+    started = time.monotonic()
+    last_progress = None
+    details_seen = False
+    details_omitted = 0
+    last_line = ""
+    end_status = None
+
+    def progress():
+        done = sum(counts.values())
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        event = {"type": "progress", "phase": phase, "done": done, "total": total, "counts": dict(counts),
+                 "percent": None, "rate": round(rate, 2), "eta": None, "elapsed": round(elapsed, 1)}
+        if total:
+            event["percent"] = round(min(100.0, 100.0 * done / total), 1)
+            if rate > 0:
+                event["eta"] = round(max(0, total - done) / rate, 1)
+        return encode(event)
+
+    for line in lines:
+        if line:
+            last_line = line
+        event = getattr(line, "event", None)
+
+        if event == "start":
+            total = line.fields.get("total")
+            phase = line.fields.get("phase", phase)
+            started = time.monotonic()
+            yield encode({"type": "log", "level": "info", "message": line.rstrip("\n")})
+            yield progress()
+            last_progress = time.monotonic()
+            continue
+
+        if event == "phase":
+            phase = line.fields.get("phase")
+            yield progress()
+            last_progress = time.monotonic()
+            yield encode({"type": "log", "level": "info", "message": line.rstrip("\n")})
+            continue
+
+        if event == "file":
+            status = line.fields["status"]
+            counts[status] = counts.get(status, 0) + 1
+            if line.fields.get("details"):
+                if log_url and not details_seen:
+                    yield encode({"type": "verbose_log", "url": log_url})
+                details_seen = True
+                details_omitted += 1
+            if status == "error":
+                # Counters first, so the error shows up against the right totals
+                yield progress()
+                last_progress = time.monotonic()
+                for message in line.fields["messages"]:
+                    yield encode({"type": "log", "level": "error", "message": message.rstrip("\n"), "file": line.fields.get("file")})
+                continue
+            for message in line.fields["messages"]:
+                if "Warning" in message:
+                    yield encode({"type": "log", "level": "warning", "message": message.strip(), "file": line.fields.get("file")})
+            if last_progress is None or time.monotonic() - last_progress >= interval:
+                yield progress()
+                last_progress = time.monotonic()
+            continue
+
+        if event == "end":
+            end_status = line.fields["status"]
+            yield encode({"type": "log", "level": "error" if end_status == "failed" else "info", "message": line.rstrip("\n")})
+            continue
+
+        if line:
+            yield encode({"type": "log", "level": line_level(line), "message": line.rstrip("\n")})
+
+    yield progress()
+    if getattr(last_line, "event", None) == "cancelled":
+        status = "cancelled"
+    else:
+        # Streams without an end event (validation, plans) only report
+        status = end_status or "completed"
+    done = {"type": "done", "status": status}
+    if details_omitted and not log_url:
+        done["details_omitted"] = details_omitted
+    yield encode(done)
+
+
+def line_level(line: str) -> str:
+    stripped = line.strip()
+    if "Error" in stripped.split(":", 1)[0] or stripped.startswith("Conflict"):
+        return "error"
+    if stripped.startswith(("Warning", "Duplicate")):
+        return "warning"
+    return "info"
+
+
+def encode(event: dict) -> str:
+    return json.dumps(event, separators=(",", ":")) + "\n"
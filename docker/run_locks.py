@@ -0,0 +1,95 @@
+import fcntl
+import hashlib
+import os
+import threading
+
+
+class RunLocks:
+    """Cross-process locks on the directory subtrees a run works in.
+
+    A claim takes an exclusive `flock` on a lock file for each claimed
+    directory and a shared one for every directory above it. Claims on
+    separate folders (`/media/2023` and `/media/2024`) only share their
+    parents' locks and proceed together, while a claim on a folder and one
+    on anything inside or above it conflict. The locks belong to open files,
+    so they hold between threads of one process as well as between web
+    workers, and the kernel releases them if the process dies.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def try_claim(self, paths):
+        # Returns a held RunClaim, or None while any of `paths` overlaps
+        # another run's claim
+        claim = RunClaim(self, paths)
+        return claim if claim.acquire() else None
+
+    def lock_file(self, path: str) -> str:
+        digest = hashlib.blake2b(path.encode("utf-8", "surrogateescape"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{digest}.lock")
+
+
+class RunClaim:
+    """The locks held for one set of claimed directories, until `release()`."""
+
+    def __init__(self, run_locks: RunLocks, paths):
+        self.run_locks = run_locks
+        # Directories inside another claimed directory are already covered
+        claimed = sorted({os.path.realpath(path) for path in paths})
+        self.paths = [path for path in claimed if not any(is_within(path, other) for other in claimed if other != path)]
+        parents = set()
+        for path in self.paths:
+            parent = os.path.dirname(path)
+            while parent not in parents and parent != path:
+                parents.add(parent)
+                path, parent = parent, os.path.dirname(parent)
+        # Always locked in the same order
+        self._modes = sorted([(path, fcntl.LOCK_EX) for path in self.paths] + [(path, fcntl.LOCK_SH) for path in parents])
+        self._files = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        os.makedirs(self.run_locks.directory, exist_ok=True)
+        with self._lock:
+            for path, mode in self._modes:
+                lock_file = open(self.run_locks.lock_file(path), "a")
+                try:
+                    fcntl.flock(lock_file, mode | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    self._release()
+                    return False
+                self._files.append(lock_file)
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._release()
+
+    def _release(self) -> None:
+        for lock_file in reversed(self._files):
+            lock_file.close()  # Closing the file drops its lock
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def is_within(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def hold_process_lock(path: str):
+    # Blocks until this process holds the exclusive lock in `path` and
+    # returns the open lock file, which keeps it until closed or the process
+    # exits. Used for work only one web worker should do (the watcher).
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lock_file = open(path, "a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
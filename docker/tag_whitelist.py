@@ -0,0 +1,144 @@
+import os
+import threading
+
+WILDCARD = "*"
+# Characters that can't appear in a tag inside a file name's [...] block
+RESERVED_CHARACTERS = "[];"
+MEMO_SIZE = 100000
+
+
+class TagWhitelistStore:
+    """TAG_WHITELIST_FILE compiled into a TagWhitelist, rebuilt only when the
+    file's mtime or size changes.
+
+    `get()` returns an immutable TagWhitelist, so a run keeps the version it
+    started with even if the file is edited while it is processing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat_key = None
+        self._whitelist = None
+
+    def get(self) -> "TagWhitelist":
+        # Raises OSError or UnicodeDecodeError if the file can't be read
+        stat = os.stat(self.path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stat_key != self._stat_key:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._whitelist = TagWhitelist(f.read().splitlines())
+                self._stat_key = stat_key
+            return self._whitelist
+
+
+class TagWhitelist:
+    """Dot-separated tag patterns (`*` matches any one segment) as a segment trie.
+
+    Checking a tag walks one trie level per segment instead of trying every
+    pattern, and results are memoized because the same tags repeat across
+    most files of a run. Matching ignores case, like the patterns always have.
+    """
+
+    def __init__(self, lines):
+        self._root = {}
+        self._memo = {}
+        self.patterns = []
+        self.problems = []
+
+        seen = {}
+        for line_number, line in enumerate(lines, 1):
+            pattern = line.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            key = pattern.casefold()
+            if key in seen:
+                self.problems.append(problem(line_number, pattern, f"Duplicate of line {seen[key]}"))
+                continue
+            seen[key] = line_number
+            for message in pattern_errors(pattern):
+                self.problems.append(problem(line_number, pattern, message))
+            self.patterns.append((line_number, pattern))
+            self._insert(key.split('.'))
+
+        # A pattern is redundant if the rest of the whitelist already allows
+        # everything it does, e.g. `holiday.christmas` next to `holiday.*`
+        for line_number, pattern in self.patterns:
+            covering = self._covering(pattern.casefold().split('.'))
+            if covering is not None:
+                self.problems.append(problem(line_number, pattern, f"Already allowed by '{covering}'"))
+        self.problems.sort(key=lambda entry: entry["line"])
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def allows(self, tag: str) -> bool:
+        allowed = self._memo.get(tag)
+        if allowed is None:
+            allowed = self._match(tag.casefold().split('.'))
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[tag] = allowed
+        return allowed
+
+    def _insert(self, segments):
+        node = self._root
+        for segment in segments:
+            node = node.setdefault(segment, {})
+        node[None] = True
+
+    def _match(self, segments) -> bool:
+        nodes = [self._root]
+        for segment in segments:
+            next_nodes = []
+            for node in nodes:
+                if segment in node and segment != WILDCARD:
+                    next_nodes.append(node[segment])
+                # A wildcard matches one non-empty segment
+                if segment and WILDCARD in node:
+                    next_nodes.append(node[WILDCARD])
+            if not next_nodes:
+                return False
+            nodes = next_nodes
+        return any(None in node for node in nodes)
+
+    def _covering(self, segments):
+        # The first other pattern that matches everything `segments` matches,
+        # or None. Only wildcards can cover a wildcard.
+        def walk(node, index, path):
+            if index == len(segments):
+                if None in node and path != segments:
+                    return '.'.join(path)
+                return None
+            segment = segments[index]
+            branches = [segment]
+            if segment and segment != WILDCARD:
+                branches.append(WILDCARD)
+            for branch in branches:
+                if branch in node:
+                    found = walk(node[branch], index + 1, path + [branch])
+                    if found is not None:
+                        return found
+            return None
+
+        return walk(self._root, 0, [])
+
+
+def pattern_errors(pattern: str) -> list:
+    errors = []
+    segments = pattern.split('.')
+    if any(not segment for segment in segments):
+        errors.append("Empty segment")
+    if any(WILDCARD in segment and segment != WILDCARD for segment in segments):
+        errors.append("'*' must be a whole segment")
+    reserved = sorted({c for c in pattern if c in RESERVED_CHARACTERS})
+    if reserved:
+        errors.append(f"Contains {' '.join(reserved)}, which can't be used in file name tags")
+    if pattern != ' '.join(pattern.split()):
+        errors.append("Contains repeated or non-space whitespace")
+    return errors
+
+
+def problem(line_number: int, pattern: str, message: str) -> dict:
+    return {"line": line_number, "pattern": pattern, "message": message}
@@ -0,0 +1,254 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+# Mounts where inotify misses changes made by other machines
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "sshfs", "fuse.sshfs", "fuse.rclone"}
+
+
+class WatchError(OSError):
+    pass
+
+
+class InotifySource:
+    """Change notifications for a directory tree from the kernel.
+
+    `changes(timeout)` returns the paths of files that were written, created
+    or moved in, plus files found in newly created subdirectories (and, on
+    the first call, every file already there). `None` in the result means
+    events were dropped and the caller should rescan.
+    """
+
+    name = "inotify"
+
+    def __init__(self, directory: str, recursive: bool, excluded_directories):
+        library = ctypes.util.find_library("c") or "libc.so.6"
+        try:
+            self._libc = ctypes.CDLL(library, use_errno=True)
+            self._libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise WatchError(f"inotify is not available: {e}")
+        self.recursive = recursive
+        self.excluded_directories = set(excluded_directories)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise WatchError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}
+        self._found = []
+        self._add_tree(directory, self._found)
+
+    def changes(self, timeout: float) -> list:
+        if self._found:
+            found, self._found = self._found, []
+            return found
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                paths.append(None)
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self._directories.pop(wd, None)
+                continue
+            directory = self._directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive and os.path.basename(path) not in self.excluded_directories:
+                    # Files can land in a new directory before it is watched
+                    self._add_tree(path, paths)
+                continue
+            paths.append(path)
+        return paths
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+    def _add_tree(self, directory: str, found: list) -> None:
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise WatchError(error, "inotify watch limit reached (fs.inotify.max_user_watches)")
+                continue  # Vanished or unreadable
+            self._directories[wd] = current
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive and entry.name not in self.excluded_directories:
+                                pending.append(entry.path)
+                        elif entry.is_file():
+                            found.append(entry.path)
+            except OSError:
+                continue
+
+
+class PollingSource:
+    """Change detection by listing the tree every `interval` seconds, for
+    mounts where inotify doesn't see changes made elsewhere."""
+
+    name = "polling"
+
+    def __init__(self, list_files, interval: float):
+        self.list_files = list_files
+        self.interval = interval
+        self._snapshot = {}
+        self._next_poll = 0.0
+
+    def changes(self, timeout: float) -> list:
+        wait = self._next_poll - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if time.monotonic() < self._next_poll:
+                return []
+        self._next_poll = time.monotonic() + self.interval
+
+        snapshot = {}
+        changed = []
+        for path in self.list_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+            if self._snapshot.get(path) != snapshot[path]:
+                changed.append(path)
+        self._snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class StableFileBatcher:
+    """Groups changed files into batches once they have stopped changing.
+
+    A file is ready when its size and mtime haven't changed for
+    `settle_seconds`, so half-copied files are never picked up. Ready files
+    are released together when nothing else is still settling, when
+    `batch_size` are waiting, or when the oldest has waited another
+    `settle_seconds`. Files whose current size and mtime were already
+    handled (`mark_handled`) are ignored, so the pipeline's own writes don't
+    trigger another run.
+    """
+
+    def __init__(self, settle_seconds: float, batch_size: int):
+        self.settle_seconds = settle_seconds
+        self.batch_size = batch_size
+        self._settling = {}
+        self._ready = {}
+        self._handled = {}
+
+    def add(self, path: str) -> None:
+        self._ready.pop(path, None)
+        self._settling[path] = (None, time.monotonic())
+
+    def pending(self) -> int:
+        return len(self._settling) + len(self._ready)
+
+    def take_batch(self) -> list:
+        now = time.monotonic()
+        for path, (signature, since) in list(self._settling.items()):
+            current = file_signature(path)
+            if current is None:
+                del self._settling[path]
+                self._handled.pop(path, None)
+            elif current != signature:
+                self._settling[path] = (current, now)
+            elif now - since >= self.settle_seconds:
+                del self._settling[path]
+                if self._handled.get(path) != current:
+                    self._ready[path] = now
+
+        if not self._ready:
+            return []
+        oldest = min(self._ready.values())
+        if self._settling and len(self._ready) < self.batch_size and now - oldest < self.settle_seconds:
+            return []
+        batch = sorted(self._ready, key=self._ready.get)[:self.batch_size]
+        for path in batch:
+            del self._ready[path]
+        return batch
+
+    def mark_handled(self, paths) -> None:
+        for path in paths:
+            signature = file_signature(path)
+            if signature is None:
+                self._handled.pop(path, None)
+            else:
+                self._handled[path] = signature
+
+
+def file_signature(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def filesystem_type(path: str) -> str:
+    # Type of the mount containing `path`, from /proc/self/mounts ("" if unknown)
+    path = os.path.realpath(path)
+    best, best_type = "", ""
+    try:
+        with open("/proc/self/mounts", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) >= len(best):
+                    best, best_type = mount_point, fields[2]
+    except OSError:
+        pass
+    return best_type
+
+
+def open_source(directory: str, recursive: bool, excluded_directories, list_files, mode: str, poll_interval: float):
+    # inotify unless `mode` is "poll", the directory is on a network mount or
+    # inotify can't be used; "inotify" fails instead of falling back
+    if mode != "poll" and (mode == "inotify" or filesystem_type(directory) not in NETWORK_FILESYSTEMS):
+        try:
+            return InotifySource(directory, recursive, excluded_directories)
+        except WatchError:
+            if mode == "inotify":
+                raise
+    return PollingSource(list_files, poll_interval)